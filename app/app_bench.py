@@ -0,0 +1,274 @@
+import resource
+import time
+from array import array
+
+from tornado import gen
+from tornado.iostream import StreamClosedError
+
+from app.app_client import ApplicationSourceClient, ApplicationListenerClient, ClientException
+from base.clock import monotonic_ns
+from base.source import Source
+
+
+def percentiles(values, points):
+    """
+    Percentiles of values (nearest rank)
+    :param values: values :array.array or list
+    :param points: percentiles, e.g. (50, 99) :tuple
+    :return: dict, key - percentile, value - value or None for empty values :dict
+    """
+    ordered = sorted(values)
+    result = {}
+    for point in points:
+        if not ordered:
+            result[point] = None
+            continue
+        rank = max(int(len(ordered) * point / 100 + 0.5), 1)
+        result[point] = ordered[min(rank, len(ordered)) - 1]
+    return result
+
+
+class ApplicationBenchmark:
+    """
+    Load generator for application server.
+    `sources` simulated sources send messages with `fields` data fields at `rate` messages/sec each
+    (0 - as fast as acknowledgements allow) for `duration` seconds, `listeners` listeners receive
+    messages in binary format. Sources use pipelined clients with `window` messages in flight
+    (None - strict request/response).
+
+    Report (see `report`) contains throughput, latency of acknowledgements (from sending of message
+    to its acknowledgement) and latency of delivery (from sending of message to its receiving by listener)
+    in microseconds, and CPU time and max RSS of current process
+    (it includes server if server runs in the same process).
+    """
+
+    # format of ids of simulated sources by number, ids fit in `Source.SOURCE_NAME_LENGTH` for up to 10**7 sources
+    SOURCE_ID_FORMAT = 'b{:07d}'
+
+    # reported percentiles of latencies
+    PERCENTILES = (50, 99, 99.9)
+
+    # max time of waiting for delivery of sent messages to listeners after sending is finished (seconds)
+    DRAIN_TIMEOUT = 2.0
+
+    def __init__(self, host, source_port, listener_port, sources=10, listeners=1, rate=0, fields=1,
+                 duration=5.0, window=64):
+        """
+        :param host: server host :str
+        :param source_port: port of sources :int
+        :param listener_port: port of listeners :int
+        :param sources: count of sources :int
+        :param listeners: count of listeners :int
+        :param rate: messages per second of each source (0 - unlimited) :float
+        :param fields: count of data fields of message :int
+        :param duration: duration of sending (seconds) :float
+        :param window: max count of not acknowledged messages of source (None - strict mode) :int
+        """
+        self.host = host
+        self.source_port = source_port
+        self.listener_port = listener_port
+        self.sources = sources
+        self.listeners = listeners
+        self.rate = rate
+        self.fields = fields
+        self.duration = duration
+        self.window = window or None
+        # sent messages, key - (source_id, num), value - [time of sending, count of pending receivers]
+        self.sent = {}
+        self.ack_latencies = array('q')
+        self.delivery_latencies = array('q')
+        self.messages = 0
+        self.acknowledged = 0
+        self.rejected = 0
+        self.delivered = 0
+
+    async def run(self):
+        """
+        Connects listeners, runs sources and waits for delivery of messages to listeners
+        :return: report :dict
+        """
+        listeners = []
+        for _ in range(self.listeners):
+            listeners.append(await self.connect_listener())
+        readers = [gen.convert_yielded(self.read_listener(listener)) for listener in listeners]
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        await gen.multi([self.run_source(number) for number in range(self.sources)])
+        elapsed = time.perf_counter() - start
+        await self.drain()
+        end_usage = resource.getrusage(resource.RUSAGE_SELF)
+        for listener in listeners:
+            listener.stop()
+        await gen.multi(readers)
+        return self.report(elapsed, usage, end_usage)
+
+    async def connect_listener(self):
+        """
+        Connects listener and switches it to binary format
+        :return: listener client :ApplicationListenerClient
+        """
+        listener = ApplicationListenerClient()
+        await listener.connect(self.host, self.listener_port)
+        await listener.request_binary()
+        # snapshot of sources is received before response to command
+        while not listener.binary:
+            await listener.listen()
+        return listener
+
+    async def read_listener(self, listener):
+        """
+        Receives messages of listener and measures latency of delivery
+        :param listener: listener client :ApplicationListenerClient
+        :return: None
+        """
+        try:
+            while True:
+                record = await listener.listen()
+                if isinstance(record, bytes):
+                    continue
+                message = record[2]
+                key = message.source_id, message.num
+                sent = self.sent.get(key)
+                if sent is None:
+                    continue
+                self.delivered += 1
+                self.delivery_latencies.append(monotonic_ns() - sent[0])
+                self._received(key, sent)
+        except StreamClosedError:
+            pass
+
+    async def run_source(self, number):
+        """
+        Sends messages of one source during `duration`
+        :param number: number of source :int
+        :return: None
+        """
+        source = Source(self.SOURCE_ID_FORMAT.format(number), Source.STATUS_ACTIVE)
+        client = ApplicationSourceClient(source, self.window)
+        await client.connect(self.host, self.source_port)
+        names = ['f{}'.format(field) for field in range(self.fields)]
+        interval = 1 / self.rate if self.rate else 0
+        start = time.perf_counter()
+        end = start + self.duration
+        next_time = start
+        count = 0
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= end:
+                    break
+                if interval:
+                    if next_time > now:
+                        await gen.sleep(next_time - now)
+                    next_time += interval
+                data = {name: count & 0xffffffff for name in names}
+                await self.send_message(client, source, data)
+                count += 1
+            await client.flush()
+        except (StreamClosedError, ClientException):
+            pass
+        finally:
+            client.stop()
+
+    async def send_message(self, client, source, data):
+        """
+        Sends message and registers time of sending
+        :return: None
+        """
+        registered = []
+
+        def register(message):
+            # message is registered before writing, listeners could receive it before `send_message` returns
+            key = source.source_id, message.num
+            registered.extend((key, message.num, [monotonic_ns(), self.listeners + 1]))
+            self.sent[key] = registered[-1]
+
+        acknowledgement = await client.send_message(data, register)
+        self.messages += 1
+        key, num, sent = registered
+        if acknowledgement is None:
+            response = await client.listen()
+            self._acknowledge(key, sent, response is not None and response.num == num)
+            return
+        acknowledgement.add_done_callback(lambda future: self._acknowledge(key, sent, future.exception() is None))
+
+    def _acknowledge(self, key, sent, success):
+        if success:
+            self.acknowledged += 1
+            self.ack_latencies.append(monotonic_ns() - sent[0])
+        else:
+            self.rejected += 1
+            # rejected message is not delivered to listeners
+            sent[1] = 1
+        self._received(key, sent)
+
+    def _received(self, key, sent):
+        sent[1] -= 1
+        if sent[1] <= 0 and self.sent.get(key) is sent:
+            del self.sent[key]
+
+    async def drain(self):
+        """
+        Waits for delivery of all acknowledged messages to listeners, but not more than `DRAIN_TIMEOUT` seconds
+        without progress
+        :return: None
+        """
+        if not self.listeners:
+            return
+        expected = self.acknowledged * self.listeners
+        delivered = -1
+        while self.delivered < expected and self.delivered != delivered:
+            delivered = self.delivered
+            deadline = time.perf_counter() + self.DRAIN_TIMEOUT
+            while self.delivered == delivered and time.perf_counter() < deadline:
+                await gen.sleep(0.01)
+
+    def latency_report(self, latencies):
+        """
+        :param latencies: latencies (ns) :array.array
+        :return: count, mean, max and percentiles in microseconds :dict
+        """
+        report = {'count': len(latencies)}
+        values = percentiles(latencies, self.PERCENTILES)
+        for point in self.PERCENTILES:
+            value = values[point]
+            report['p{}'.format(str(point).replace('.', ''))] = None if value is None else round(value / 1000, 1)
+        report['mean'] = round(sum(latencies) / len(latencies) / 1000, 1) if latencies else None
+        report['max'] = round(max(latencies) / 1000, 1) if latencies else None
+        return report
+
+    def report(self, elapsed, usage, end_usage):
+        """
+        :param elapsed: duration of sending (seconds) :float
+        :param usage: resource usage at start :resource.struct_rusage
+        :param end_usage: resource usage at end :resource.struct_rusage
+        :return: report :dict
+        """
+        user = end_usage.ru_utime - usage.ru_utime
+        system = end_usage.ru_stime - usage.ru_stime
+        return {
+            'config': {
+                'sources': self.sources,
+                'listeners': self.listeners,
+                'rate': self.rate,
+                'fields': self.fields,
+                'duration': self.duration,
+                'window': self.window,
+            },
+            'elapsed': round(elapsed, 3),
+            'messages': self.messages,
+            'acknowledged': self.acknowledged,
+            'rejected': self.rejected,
+            'messages_per_sec': round(self.acknowledged / elapsed, 1) if elapsed else None,
+            'ack_latency_us': self.latency_report(self.ack_latencies),
+            'delivered': self.delivered,
+            'expected_deliveries': self.acknowledged * self.listeners,
+            'delivery_latency_us': self.latency_report(self.delivery_latencies),
+            'cpu': {
+                'user': round(user, 3),
+                'system': round(system, 3),
+                'percent': round((user + system) / elapsed * 100, 1) if elapsed else None,
+            },
+            # ru_maxrss is in kilobytes on Linux
+            'max_rss_kb': end_usage.ru_maxrss,
+        }
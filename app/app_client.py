@@ -1,7 +1,14 @@
-from tornado import gen
+from collections import deque
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.locks import Semaphore
 from tornado.tcpclient import TCPClient
 
-from base.message import ServerMessage
+from base.clock import from_wall_ns
+from base.listener import BaseListener
+from base.message import ServerMessage, SourceMessage, CRC32SourceMessage, AckModeMessage, header_table
 from base.exceptions import InvalidMessageException, EncodeMessageError
 
 
@@ -20,8 +27,7 @@ class ApplicationClient:
         self.stream = None
         self.client = None
 
-    @gen.coroutine
-    def connect(self, host, port, io_loop=None):
+    async def connect(self, host, port, io_loop=None):
         """
         Connect to server. Based on tornado.tcpclient.TCPClient `connect` method
         :param host: server host :str
@@ -32,10 +38,9 @@ class ApplicationClient:
         if not self.client:
             self.client = TCPClient(io_loop=io_loop)
         if not self.stream:
-            self.stream = yield self.client.connect(host, port)
+            self.stream = await self.client.connect(host, port)
         return self.stream
 
-    @gen.coroutine
     def stop(self):
         """
         Stop client
@@ -51,36 +56,157 @@ class ApplicationSourceClient(ApplicationClient):
     Application client for sources.
     Use `send_message` to send message from source with additional data
     `listen` method get data from server and decode it to ServerMessage
+
+    With `window` client works in pipelined mode: up to `window` messages are sent without waiting for response.
+    `send_message` returns future of acknowledgement, responses are read by background reader (do not use `listen`)
+    and matched with sent messages by `num`. Server responds in order of messages, so acknowledgement of message
+    acknowledges all previous messages too, error response (it has no number) rejects the oldest not acknowledged one.
+    So pipelined client works with cumulative acknowledgements of server (see `set_ack_mode`).
     """
-    def __init__(self, source):
+    def __init__(self, source, window=None):
+        """
+        :param source: source :base.source.Source
+        :param window: max count of not acknowledged messages, None - strict request/response mode :int
+        """
         super().__init__()
         self.source = source
+        self.window = window
+        self.pending = deque()  # (num, future) of sent not acknowledged messages in order of sending
+        self._window = Semaphore(window) if window else None
+        self._reader_started = False
+        self.ack_mode = AckModeMessage.MODE_EACH
+        self._ack_mode_confirmation = None
+
+    async def connect(self, host, port, io_loop=None):
+        stream = await super().connect(host, port, io_loop)
+        if self.window and not self._reader_started:
+            # messages in flight must not wait for acknowledgements of TCP (Nagle's algorithm)
+            stream.set_nodelay(True)
+            self._reader_started = True
+            IOLoop.current().spawn_callback(self._read_responses)
+        return stream
 
-    @gen.coroutine
-    def send_message(self, data):
+    async def send_message(self, data, on_send=None):
         """
-        Send message to server with additional data
+        Send message to server with additional data.
+        In pipelined mode waits for free place in window and returns future of acknowledgement,
+        it resolves to response `ServerMessage` or raises `ClientException` if message is rejected.
         :param data: message data :dict
+        :param on_send: callback called with sent message right before it is written to stream
         :return: future :tornado.concurrent.Future
         """
+        if self._window is not None:
+            await self._window.acquire()
+        frame = None
         try:
-            message = self.source.new_message(data).encode()
-            yield self.stream.write(message)
+            message = self.source.new_message(data)
+            frame = message.encode()
         except EncodeMessageError as e:
             raise ClientException(e.args[0]) from e
+        finally:
+            if self._window is not None and frame is None:
+                self._window.release()
+        if on_send is not None:
+            on_send(message)
+        if self._window is None:
+            await self.stream.write(frame)
+            return None
+        acknowledgement = Future()
+        self.pending.append((message.num, acknowledgement))
+        self.stream.write(frame)
+        return acknowledgement
+
+    async def set_ack_mode(self, mode, batch=0):
+        """
+        Negotiates mode of acknowledgements with server (see `AckModeMessage`).
+        Call it when there are no messages in flight.
+        Raises `ClientException` if mode is not accepted by server
+        :param mode: AckModeMessage.MODE_* value :int
+        :param batch: max count of messages per acknowledgement for cumulative mode :int
+        :return: future :tornado.concurrent.Future
+        """
+        frame = AckModeMessage(mode, batch).encode()
+        if self._reader_started:
+            self._ack_mode_confirmation = confirmation = Future()
+            await self.stream.write(frame)
+            response = await confirmation
+        else:
+            await self.stream.write(frame)
+            response = await self.listen()
+        if response is None or response.header != ServerMessage.HEADER_ACK_MODE or response.num != mode:
+            raise ClientException('acknowledgement mode {} not accepted'.format(mode))
+        self.ack_mode = mode
+
+    async def flush(self):
+        """
+        Waits for acknowledgements of all sent messages (pipelined mode)
+        :return: future :tornado.concurrent.Future
+        """
+        while self.pending:
+            try:
+                await self.pending[-1][1]
+            except ClientException:
+                pass
 
+    async def _read_responses(self):
+        """
+        Background reader of responses in pipelined mode
+        :return: None
+        """
+        try:
+            while True:
+                response = await self.listen()
+                if response is not None:
+                    self.acknowledge(response)
+        except StreamClosedError as e:
+            while self.pending:
+                self._resolve(self.pending.popleft()[1], exception=e)
 
-    @gen.coroutine
-    def listen(self):
+    def acknowledge(self, response):
+        """
+        Resolves futures of messages acknowledged by response
+        :param response: response of server :ServerMessage
+        :return: None
+        """
+        pending = self.pending
+        confirmation = self._ack_mode_confirmation
+        if confirmation is not None and (response.header == ServerMessage.HEADER_ACK_MODE or
+                                         (response.header == ServerMessage.HEADER_ERROR and not pending)):
+            self._ack_mode_confirmation = None
+            confirmation.set_result(response)
+            return
+        if response.header == ServerMessage.HEADER_ACK_MODE:
+            return
+        if response.header == ServerMessage.HEADER_ERROR:
+            if pending:
+                self._resolve(pending.popleft()[1], exception=ClientException('message rejected by server'))
+            return
+        # response for message which is not pending (e.g. already rejected) is ignored
+        if not pending or (pending[0][0] != response.num and all(num != response.num for num, _ in pending)):
+            return
+        while pending:
+            num, acknowledgement = pending.popleft()
+            self._resolve(acknowledgement, response)
+            if num == response.num:
+                break
+
+    def _resolve(self, acknowledgement, response=None, exception=None):
+        if exception is not None:
+            acknowledgement.set_exception(exception)
+        else:
+            acknowledgement.set_result(response)
+        self._window.release()
+
+    async def listen(self):
         """
         Listen server for response
         :return: future with message :tornado.concurrent.Future
         """
-        header = yield self.stream.read_bytes(1)
+        header = await self.stream.read_bytes(1)
         header = int.from_bytes(header, ServerMessage.BYTE_ORDER)
         if header in ServerMessage.HEADERS:
             try:
-                message = yield ServerMessage.decode_stream(self.stream, header)
+                message = await ServerMessage.decode_stream(self.stream, header)
                 return message
             except InvalidMessageException:
                 print('invalid message')
@@ -88,13 +214,80 @@ class ApplicationSourceClient(ApplicationClient):
 
 class ApplicationListenerClient(ApplicationClient):
     """
-    Application client for listeners
+    Application client for listeners.
+    After `binary` command listener receives original frames of messages (see `BaseListener.FORMAT_BINARY`),
+    they are decoded by message classes of `MESSAGE_CLASSES`.
     """
-    @gen.coroutine
-    def listen(self):
+
+    # message classes of frames received in binary format
+    MESSAGE_CLASSES = (SourceMessage, CRC32SourceMessage)
+
+    def __init__(self):
+        super().__init__()
+        self.binary = False
+        self.message_classes = header_table(self.MESSAGE_CLASSES)
+
+    async def subscribe(self, sources=None, prefixes=None, statuses=None, fields=None):
+        """
+        Send subscription to server, only matching messages will be received.
+        Server responds with line `OK subscribe` or `ERROR <description>` (see `listen`).
+        Subscription without arguments resets filters.
+        :param sources: ids of sources :iterable of str
+        :param prefixes: prefixes of source ids :iterable of str
+        :param statuses: statuses (names or integer values) :iterable
+        :param fields: data field names :iterable of str
+        :return: future :tornado.concurrent.Future
+        """
+        parts = ['subscribe']
+        for key, values in (('source', sources), ('prefix', prefixes), ('status', statuses), ('field', fields)):
+            if values:
+                parts.append('{}={}'.format(key, ','.join(str(value) for value in values)))
+        await self.send_command(' '.join(parts))
+
+    async def request_binary(self):
+        """
+        Request binary format of messages.
+        Listener is switched to binary format when `OK binary` line is received by `listen`
+        :return: future :tornado.concurrent.Future
+        """
+        await self.send_command('binary')
+
+    async def send_command(self, command):
+        """
+        Send text command to server
+        :param command: command line without line end :str
+        :return: future :tornado.concurrent.Future
+        """
+        await self.stream.write((command + '\n').encode())
+
+    async def listen(self):
+        """
+        Listen messages from server.
+        In text format text line is returned.
+        In binary format - tuple (timestamp, sequence, message) for message (timestamp is wall-clock time
+        of receiving on server, ns) or text line for response to command.
+        :return: future with text message or decoded message :tornado.concurrent.Future
+        """
+        if self.binary:
+            return await self.listen_binary()
+        data = await self.stream.read_until(b'\n')
+        if data == b'OK binary\n':
+            self.binary = True
+        return data
+
+    async def listen_binary(self):
         """
-        Listen text messages from server
-        :return: future with text message :tornado.concurrent.Future
+        Reads and decodes binary record
+        :return: future with (timestamp, sequence, message) or text :tornado.concurrent.Future
         """
-        data = yield self.stream.read_until(b'\n')
-        return data
\ No newline at end of file
+        envelope = BaseListener.ENVELOPE
+        kind, timestamp, sequence, size = envelope.unpack(await self.stream.read_bytes(envelope.size))
+        payload = await self.stream.read_bytes(size)
+        if kind == BaseListener.RECORD_TEXT:
+            return payload
+        message_class = self.message_classes.get(payload[0])
+        if message_class is None:
+            raise InvalidMessageException('invalid message header {}'.format(payload[0]))
+        message = message_class.decode(payload)
+        message.received = from_wall_ns(timestamp)
+        return timestamp, sequence, message
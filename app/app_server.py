@@ -1,10 +1,32 @@
+import heapq
+import json
+import os
+import time
+from collections import deque
+from weakref import WeakKeyDictionary, WeakSet
+
+from tornado import gen
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.iostream import StreamClosedError, UnsatisfiableReadError
+
+from base.admission import AdmissionControl
+from base.bus import MessageBus
+from base.profiler import LoopLagMonitor, SamplingProfiler
+from base.ratelimit import TokenBuckets
+from base.timerwheel import TimerWheel
 from base.listener import BaseListener
 from base.server import BaseServer
-from tornado import gen
+from base.subscriptions import Subscription, SubscriptionIndex
+from base.timeseries import TimeSeriesStore
+from base.wal import WriteAheadLog, WALReader
 
-from base.message import SourceMessage, ServerMessage
-from base.exceptions import ListenerClosedException, InvalidMessageException, SourceException
+from base.acknowledgement import CumulativeAcknowledgement
+from base.message import SourceMessage, CRC32SourceMessage, ServerMessage, AckModeMessage
+from base.exceptions import ListenerClosedException, ListenerCommandException, InvalidMessageException, \
+    SourceException
+from base.protocol import MessageProtocol
 from base.source import Source
+from base.clock import monotonic_ns, to_wall_ns
 
 
 class ApplicationServer(BaseServer):
@@ -12,6 +34,35 @@ class ApplicationServer(BaseServer):
     This server add listeners to BaseServer.
     Specify SOURCE_PORT and LISTENER_PORT for working with sources and listeners accordingly.
     ALLOWED MESSAGES contains tuple of messages classes sending from sources.
+    Source port could be served by asyncio protocol instead of IOStream (see `create_source_protocol`).
+    Values of data fields of source messages are saved to columnar store `timeseries` (see base.timeseries).
+    With `WAL_PATH` accepted frames are appended to write-ahead log (see base.wal),
+    state of sources is restored from the log on server creation.
+    Listeners could send text commands, e.g. `subscribe source=a,b status=RECHARGE` to receive only
+    messages of some sources, statuses or data fields, or `binary` to receive original frames of messages.
+    Source could switch its connection to cumulative acknowledgements by `AckModeMessage`.
+
+    Server could run in several worker processes sharing ports (see `start_server` of start.py),
+    `WORKER_ID` and `WORKERS` are set in each worker. Frames accepted by worker are sent by local bus (see base.bus)
+    to workers with listeners only, received frames update state of sources and are broadcast to listeners of worker,
+    so listener connected to any worker receives messages of all sources. Worker owns sources which last messages
+    it accepted, their last messages are sent to worker when it gets the first listener (see `bus_snapshot`).
+    Time series keep only messages received by the worker itself, each worker writes own log
+    in `worker-<id>` directory of `WAL_PATH`.
+
+    Counters, latencies of sampled messages and state of connections are returned by `get_stats`,
+    with `STATS_PORT` they are sent as JSON line to each connection of this port.
+    With `IDLE_TIMEOUT` connections of sources without messages and stalled listeners (see
+    `BaseListener.progressed`) are closed, timeouts of all connections are kept in one timer wheel (see base.timerwheel).
+    When connection of source is lost, source is marked stale (see `Source.stale`) and it is removed from `sources`
+    after `SOURCE_RETENTION` seconds without new connection (its time series are kept).
+    Sources and listeners have separate budgets of connections (`SOURCE_*` and `LISTENER_*` limits,
+    see `BaseServer.create_admission`), budgets are returned by `get_stats`.
+    Messages of sources are limited by token buckets of source ids and statuses (see `SOURCE_RATE_LIMITS`)
+    and of connections (`CONNECTION_RATE_LIMIT`). Over-limit message is rejected with error response
+    or it is held back and reading of connection is paused until source is within limits (`RATE_LIMIT_POLICY`).
+    Lag of event loop is recorded to `loop_lag` histogram of metrics every `LOOP_LAG_INTERVAL` milliseconds,
+    sampling `profiler` of application code is switched on and off at runtime by `toggle_profiler`.
     """
 
     # dict of sources: key - source id, value - Source instance
@@ -24,10 +75,307 @@ class ApplicationServer(BaseServer):
 
     LISTENER_PORT = 8889
 
-    ALLOWED_MESSAGES = (SourceMessage, )
+    ALLOWED_MESSAGES = (SourceMessage, CRC32SourceMessage, AckModeMessage)
+
+    # count of last messages kept for each source (0 - only last message)
+    SOURCE_HISTORY_SIZE = Source.HISTORY_SIZE
+
+    # max size of outgoing queue of listener (see BaseListener)
+    LISTENER_QUEUE_SIZE = BaseListener.QUEUE_SIZE
+
+    # policy for listener with full queue: BaseListener.OVERFLOW_* value
+    LISTENER_OVERFLOW_POLICY = BaseListener.OVERFLOW_POLICY
+
+    # count of samples in chunk of time series of source field
+    TIMESERIES_CHUNK_SIZE = TimeSeriesStore.CHUNK_SIZE
+
+    # max count of chunks kept for each source field (None - unlimited)
+    TIMESERIES_MAX_CHUNKS = TimeSeriesStore.MAX_CHUNKS
+
+    # max size of command line of listener (bytes)
+    LISTENER_COMMAND_SIZE = 4096
+
+    # prefix of methods handling commands of listeners
+    LISTENER_COMMAND_PREFIX = 'listener_command_'
+
+    # count of sources in one write of snapshot sent to new listener
+    SNAPSHOT_CHUNK_SIZE = 1000
+
+    # directory of write-ahead log of source frames (None - log is disabled)
+    WAL_PATH = None
+
+    # sync policy of log: WriteAheadLog.FSYNC_* value
+    WAL_FSYNC_POLICY = WriteAheadLog.FSYNC_POLICY
+
+    # interval of writing of log batch (milliseconds)
+    WAL_FLUSH_INTERVAL = 100
+
+    # max count of kept segments of log (None - segments are not removed)
+    WAL_MAX_SEGMENTS = None
+
+    # id of worker process (None - server runs in single process)
+    WORKER_ID = None
+
+    # count of worker processes
+    WORKERS = 1
+
+    # directory of sockets of bus of workers
+    BUS_PATH = None
+
+    # port of stats (None - disabled)
+    STATS_PORT = None
+
+    # idle timeout of connections of sources and listeners (seconds, None - disabled)
+    IDLE_TIMEOUT = None
+
+    # time of keeping of disconnected sources (seconds): None - sources are kept, 0 - removed at once
+    SOURCE_RETENTION = None
+
+    # tick of timer wheels of idle timeouts and retention of sources (seconds)
+    TIMER_TICK = 1.0
+
+    # limits of connections of source port (None - unlimited): open connections, open connections
+    # of one remote address, accepted connections per second
+    SOURCE_MAX_CONNECTIONS = None
+    SOURCE_MAX_CONNECTIONS_PER_ADDRESS = None
+    SOURCE_MAX_ACCEPT_RATE = None
+
+    # limits of connections of listener port (None - unlimited)
+    LISTENER_MAX_CONNECTIONS = None
+    LISTENER_MAX_CONNECTIONS_PER_ADDRESS = None
+    LISTENER_MAX_ACCEPT_RATE = None
+
+    # limits of messages of each source by status: key - status (None - other statuses),
+    # value - (messages per second, burst), e.g. {None: (100, 200), Source.STATUS_RECHARGE: (10, 10)}
+    SOURCE_RATE_LIMITS = {}
+
+    # limit of messages of one source connection: (messages per second, burst) or None - unlimited
+    CONNECTION_RATE_LIMIT = None
+
+    # over-limit message is accepted after pause, reading of connection is paused until limit is restored
+    RATE_LIMIT_PAUSE = 'pause'
+    # over-limit message is rejected with error response
+    RATE_LIMIT_REJECT = 'reject'
+    RATE_LIMIT_POLICIES = (RATE_LIMIT_PAUSE, RATE_LIMIT_REJECT)
+
+    # policy for over-limit messages: RATE_LIMIT_* value
+    RATE_LIMIT_POLICY = RATE_LIMIT_PAUSE
+
+    # interval of checks of event loop lag (milliseconds, None - disabled)
+    LOOP_LAG_INTERVAL = 100
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeseries = TimeSeriesStore(self.TIMESERIES_CHUNK_SIZE, self.TIMESERIES_MAX_CHUNKS)
+        self.subscriptions = SubscriptionIndex()
+        self.sequence = 0  # number of last broadcast message
+        # cumulative acknowledgements of source connections, key - IOStream or asyncio transport
+        self.acknowledgements = WeakKeyDictionary()
+        self.protocols = WeakSet()  # protocols of source connections served by asyncio
+        self.admitted_transports = {}  # key - admitted transport of source protocol, value - remote address
+        # key - (source id, status of limit), statuses without own limit share bucket with status None
+        self.source_buckets = TokenBuckets()
+        self.connection_buckets = TokenBuckets()  # key - IOStream or asyncio transport
+        # transports of source protocol paused by rate limits,
+        # value - deque of held messages (message, frame), the first one is over-limit message
+        self.paused_transports = {}
+        self._rate_limited = bool(self.SOURCE_RATE_LIMITS or self.CONNECTION_RATE_LIMIT)
+        # ids of sources of connections, key - IOStream or asyncio transport
+        self.connection_sources = WeakKeyDictionary()
+        self.idle_connections = None
+        if self.IDLE_TIMEOUT:
+            self.idle_connections = TimerWheel(self.IDLE_TIMEOUT, self.connection_timeout, self.TIMER_TICK)
+            self.idle_connections.start()
+        self.stale_sources = None
+        if self.SOURCE_RETENTION:
+            self.stale_sources = TimerWheel(self.SOURCE_RETENTION, self.source_retention_expired, self.TIMER_TICK)
+            self.stale_sources.start()
+        self.wal = None
+        self._wal_flusher = None
+        self.bus = None
+        self.own_sources = set()  # ids of sources which last messages were accepted by worker (with bus)
+        self.binary_listeners = 0  # count of listeners of binary format
+        self.profiler = SamplingProfiler()
+        self.loop_monitor = None
+        if self.LOOP_LAG_INTERVAL:
+            self.loop_monitor = LoopLagMonitor(self.metrics.histogram('loop_lag'), self.LOOP_LAG_INTERVAL / 1000)
+            self.loop_monitor.start()
+        if self.WAL_PATH:
+            self.open_wal(self.WAL_PATH)
+        if self.WORKER_ID is not None and self.WORKERS > 1:
+            self.open_bus(self.BUS_PATH, self.WORKER_ID, self.WORKERS)
+
+    def stop(self):
+        """
+        Stops listening of ports, monitor of loop lag and profiler
+        :return: None
+        """
+        super().stop()
+        if self.loop_monitor is not None:
+            self.loop_monitor.stop()
+        for wheel in (self.idle_connections, self.stale_sources):
+            if wheel is not None:
+                wheel.stop()
+        self.profiler.stop()
+
+    def admission_enabled(self):
+        limits = (self.SOURCE_MAX_CONNECTIONS, self.SOURCE_MAX_CONNECTIONS_PER_ADDRESS, self.SOURCE_MAX_ACCEPT_RATE,
+                  self.LISTENER_MAX_CONNECTIONS, self.LISTENER_MAX_CONNECTIONS_PER_ADDRESS,
+                  self.LISTENER_MAX_ACCEPT_RATE)
+        return super().admission_enabled() or any(limit is not None for limit in limits)
+
+    def create_admission(self, port):
+        """
+        Budgets of source and listener ports are set by `SOURCE_*` and `LISTENER_*` limits,
+        other ports use limits of BaseServer
+        :param port: local port :int
+        :return: budget or None if connections of port are not limited :base.admission.AdmissionControl
+        """
+        if port == self.SOURCE_PORT:
+            admission = AdmissionControl(self.SOURCE_MAX_CONNECTIONS, self.SOURCE_MAX_CONNECTIONS_PER_ADDRESS,
+                                         self.SOURCE_MAX_ACCEPT_RATE)
+        elif port == self.LISTENER_PORT:
+            admission = AdmissionControl(self.LISTENER_MAX_CONNECTIONS, self.LISTENER_MAX_CONNECTIONS_PER_ADDRESS,
+                                         self.LISTENER_MAX_ACCEPT_RATE)
+        else:
+            return super().create_admission(port)
+        return admission if admission.enabled else None
+
+    def toggle_profiler(self):
+        """
+        Starts profiler with cleared samples or stops running profiler
+        :return: report of stopped profiler (see `SamplingProfiler.report`) or None if profiler is started :dict
+        """
+        if self.profiler.running:
+            self.profiler.stop()
+            return self.profiler.report()
+        self.profiler.reset()
+        self.profiler.start()
+
+    def open_wal(self, path):
+        """
+        Restores state of sources from write-ahead log and starts appending accepted frames to it
+        :param path: directory of log :str
+        :return: count of restored messages :int
+        """
+        restored = 0
+        message_classes = [message_class for message_class in self.ALLOWED_MESSAGES
+                           if issubclass(message_class, SourceMessage)]
+        # logs of all workers (and log written by single process) are merged by time of receiving
+        paths = [path]
+        if os.path.isdir(path):
+            paths.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.startswith('worker-'))
+        replays = [WALReader(log_path, message_classes).replay() for log_path in paths]
+        for _, message in heapq.merge(*replays, key=lambda record: record[0]):
+            try:
+                self.accept_source_message(message)
+            except SourceException:
+                continue
+            restored += 1
+        if self.WORKER_ID is not None:
+            path = os.path.join(path, 'worker-{}'.format(self.WORKER_ID))
+        self.wal = WriteAheadLog(path, self.WAL_FSYNC_POLICY, max_segments=self.WAL_MAX_SEGMENTS)
+        self._wal_flusher = PeriodicCallback(self.wal.flush, self.WAL_FLUSH_INTERVAL)
+        self._wal_flusher.start()
+        self.update_frames()
+        return restored
+
+    def close_wal(self):
+        """
+        Writes batch of log and closes it
+        :return: None
+        """
+        if self.wal is not None:
+            self._wal_flusher.stop()
+            self.wal.close()
+            self.wal = None
+            self.update_frames()
+
+    def open_bus(self, path, worker_id, workers):
+        """
+        Starts exchange of accepted frames with other workers
+        :param path: directory of sockets of bus :str
+        :param worker_id: id of current worker :int
+        :param workers: count of workers :int
+        :return: None
+        """
+        message_classes = [message_class for message_class in self.ALLOWED_MESSAGES
+                           if issubclass(message_class, SourceMessage)]
+        self.bus = MessageBus(path, worker_id, workers, message_classes, self.handle_bus_message,
+                              self.bus_snapshot, self.handle_bus_snapshot)
+        self.bus.set_interest(bool(self.listeners))
+        self.bus.open()
+        self.update_frames()
+
+    def close_bus(self):
+        """
+        Sends not sent frames to other workers and closes bus
+        :return: None
+        """
+        if self.bus is not None:
+            self.bus.close()
+            self.bus = None
+            self.update_frames()
+
+    @property
+    def frames_needed(self):
+        """
+        Raw frames of source messages are kept only for write-ahead log, bus and binary listeners,
+        otherwise messages are decoded without joining of frames
+        :return: bool
+        """
+        return self.wal is not None or self.bus is not None or self.binary_listeners > 0
+
+    def update_frames(self):
+        """
+        Switches passing of raw frames by source protocols (see `frames_needed`)
+        :return: None
+        """
+        frames_needed = self.frames_needed
+        for protocol in self.protocols:
+            protocol.with_frames = frames_needed
+
+    def handle_bus_message(self, message, frame):
+        """
+        Handler of messages accepted by other workers: updates state of source and notifies listeners
+        :param message: message: SourceMessage
+        :param frame: raw frame of message :bytes
+        :return: None
+        """
+        self.own_sources.discard(message.source_id)
+        try:
+            self.update_source(message)
+        except SourceException:
+            return
+        self.broadcast_message(message, frame)
+
+    def handle_bus_snapshot(self, message, frame):
+        """
+        Handler of last messages of sources owned by other workers, sent when worker becomes interested in messages:
+        message is skipped if state of source is newer (source could be owned by several workers one after another)
+        :param message: message: SourceMessage
+        :param frame: raw frame of message :bytes
+        :return: None
+        """
+        source = self.sources.get(message.source_id)
+        last_message = source.last_message if source is not None else None
+        if last_message is not None and last_message.received is not None and last_message.received >= message.received:
+            return
+        self.handle_bus_message(message, frame)
+
+    def bus_snapshot(self):
+        """
+        Records of sources owned by worker (last messages of them were accepted by worker) for other workers
+        :return: generator of (frame, wall-clock time of receiving (ns)) :tuple
+        """
+        for source_id in self.own_sources:
+            source = self.sources.get(source_id)
+            message = source.last_message if source is not None else None
+            if message is not None:
+                received = message.received
+                yield message.encode(), to_wall_ns(monotonic_ns() if received is None else received)
 
-    @gen.coroutine
-    def handle(self, stream, address):
+    async def handle(self, stream, address):
         """
         This method overrides `handle` class and added routing of streams by port.
         If used source port then default handler logic (see BaseServer).
@@ -39,32 +387,141 @@ class ApplicationServer(BaseServer):
         port = stream.socket.getsockname()[1]
         # if source
         if port == self.SOURCE_PORT:
-            yield super().handle(stream, address)
+            # responses are written as soon as possible, also for pipelined sources
+            stream.set_nodelay(True)
+            self.metrics.source_connections += 1
+            if self.idle_connections is not None:
+                self.idle_connections.add(stream)
+            try:
+                await super().handle(stream, address)
+            finally:
+                # handling could be stopped by other errors besides closing of stream
+                self.metrics.source_connections -= 1
+                self.source_disconnected(stream)
+                stream.close()
         elif port == self.LISTENER_PORT:
-            yield self.handle_listener(stream, address)
+            await self.handle_listener(stream, address)
+        elif port == self.STATS_PORT:
+            await stream.write((json.dumps(self.get_stats(), sort_keys=True) + '\n').encode())
+            stream.close()
 
-    @gen.coroutine
-    def handle_listener(self, stream, address):
+    async def handle_listener(self, stream, address):
         """
         Handles listeners connections to server and save it for later broadcasting.
+        After snapshot of sources text commands of listener are read line by line (see `handle_listener_command`).
         :param stream :stream :tornado.iostream.IOStream
         :param address :address
         :return: future :tornado.concurrent.Future
         """
-        listener = BaseListener(stream)
+        listener = BaseListener(stream, self.LISTENER_QUEUE_SIZE, self.LISTENER_OVERFLOW_POLICY, self.metrics)
         self.listeners[address] = listener
-        # send sources info
-        last_messages = '\n'.join([str(source) for source in self.sources.values()])
-        if not last_messages:
-            last_messages = 'No sources yet'
-        last_messages += '\n'
+        self.subscriptions.subscribe(address, Subscription())
+        if self.bus is not None:
+            self.bus.set_interest(True)
+        if self.idle_connections is not None:
+            self.idle_connections.add(listener)
+            # listener without data to send is not closed by timeout, its lost peer is detected by keepalive
+            self.set_keepalive(stream, self.IDLE_TIMEOUT)
+        listener.start()
         try:
-            yield listener.send(last_messages.encode())
+            # send sources info
+            await self.send_snapshot(listener)
+            while True:
+                line = await stream.read_until(b'\n', max_bytes=self.LISTENER_COMMAND_SIZE)
+                if self.idle_connections is not None:
+                    self.idle_connections.touch(listener)
+                self.handle_listener_command(listener, address, line)
         except ListenerClosedException:
-            self.listeners.pop(address)
+            self.remove_listener(address)
+        except (StreamClosedError, UnsatisfiableReadError):
+            self.remove_listener(address)
+            listener.close()
+
+    def handle_listener_command(self, listener, address, line):
+        """
+        Invokes `listener_command_<name>(listener, address, arguments)` method for command line of listener
+        in format `<name> [arguments]` and sends result line to listener: `OK <name>` or `ERROR <description>`.
+        Result is rendered in format of listener at time of receiving of command.
+        :param listener: listener :BaseListener
+        :param address: address of listener
+        :param line: command line :bytes
+        :return: None
+        """
+        listener_format = listener.format
+        try:
+            name, _, arguments = line.decode().strip().partition(' ')
+            handler = getattr(self, self.LISTENER_COMMAND_PREFIX + name, None) if name.isidentifier() else None
+            if handler is None:
+                raise ListenerCommandException('unknown command "{}"'.format(name))
+            handler(listener, address, arguments.strip())
+        except UnicodeDecodeError:
+            result = 'ERROR invalid command\n'
+        except ListenerCommandException as e:
+            result = 'ERROR {}\n'.format(e.args[0])
+        else:
+            result = 'OK {}\n'.format(name)
+        listener.send(self.render_text(result, listener_format))
+
+    def listener_command_subscribe(self, listener, address, arguments):
+        """
+        Replaces subscription of listener (see `base.subscriptions.Subscription.parse` for format),
+        without arguments listener receives all messages
+        """
+        self.subscriptions.subscribe(address, Subscription.parse(arguments, Source.STATUS))
+
+    def listener_command_binary(self, listener, address, arguments):
+        """
+        Switches listener to binary format (see `BaseListener.FORMAT_BINARY`),
+        response `OK binary` is the last text line sent to listener
+        """
+        if listener.format != BaseListener.FORMAT_BINARY:
+            listener.format = BaseListener.FORMAT_BINARY
+            self.binary_listeners += 1
+            if self.binary_listeners == 1:
+                self.update_frames()
 
-    @gen.coroutine
-    def handler_SourceMessage(self, stream, address, header):
+    def remove_listener(self, address):
+        """
+        Removes listener and its subscription
+        :param address: address of listener
+        :return: None
+        """
+        listener = self.listeners.pop(address, None)
+        if listener is not None:
+            if self.idle_connections is not None:
+                self.idle_connections.remove(listener)
+            if listener.format == BaseListener.FORMAT_BINARY:
+                self.binary_listeners -= 1
+                if not self.binary_listeners:
+                    self.update_frames()
+            if self.bus is not None and not self.listeners:
+                self.bus.set_interest(False)
+        self.subscriptions.unsubscribe(address)
+
+    async def send_snapshot(self, listener):
+        """
+        Sends state of all sources to listener.
+        Lines of sources are assembled from snapshot prefixes kept by sources (see `Source.snapshot_line`)
+        by chunks of `SNAPSHOT_CHUNK_SIZE` sources, control is returned to IOLoop between chunks,
+        so connection of many listeners does not stall receiving of source messages.
+        Raises `ListenerClosedException` if listener is disconnected.
+        :param listener: listener :BaseListener
+        :return: None
+        """
+        if not self.sources:
+            listener.send(b'No sources yet\n')
+            return
+        sources = list(self.sources.values())
+        chunk_size = self.SNAPSHOT_CHUNK_SIZE
+        for start in range(0, len(sources), chunk_size):
+            if start:
+                await gen.moment
+            now = monotonic_ns()
+            lines = [source.snapshot_line(now) for source in sources[start:start + chunk_size]]
+            lines.append('')
+            listener.send('\n'.join(lines).encode())
+
+    async def handler_SourceMessage(self, stream, address, header):
         """
         Handler of SourceMessage instances
         :param stream: stream: tornado.iostream.IOStream
@@ -72,58 +529,539 @@ class ApplicationServer(BaseServer):
         :param header: header of message: int
         :return: future: tornado.concurrent.Future
         """
+        await self.handle_source_message(SourceMessage, stream, header)
+
+    async def handler_CRC32SourceMessage(self, stream, address, header):
+        """
+        Handler of CRC32SourceMessage instances
+        :param stream: stream: tornado.iostream.IOStream
+        :param address: address
+        :param header: header of message: int
+        :return: future: tornado.concurrent.Future
+        """
+        await self.handle_source_message(CRC32SourceMessage, stream, header)
+
+    async def handle_source_message(self, message_class, stream, header):
+        """
+        Decodes source message, updates source state, responses to source and notifies listeners
+        :param message_class: class of message (SourceMessage or its child)
+        :param stream: stream: tornado.iostream.IOStream
+        :param header: header of message: int
+        :return: future: tornado.concurrent.Future
+        """
+        try:
+            if self.frames_needed:
+                # raw frame is kept for write-ahead log, bus and binary listeners
+                frame = await message_class.read_frame(stream, header)
+                self.metrics.bytes_in += len(frame)
+                message = message_class.decode(frame)
+            else:
+                frame = None
+                message = await message_class.decode_stream(stream, header)
+                self.metrics.bytes_in += message.frame_length
+            if self._rate_limited:
+                delay = self.rate_limit(message, stream)
+                if delay:
+                    if self.RATE_LIMIT_POLICY == self.RATE_LIMIT_REJECT:
+                        await self.write_error(stream)
+                        return
+                    # next message is not read from stream until source is within limits
+                    await gen.sleep(delay)
+            self.accept_source_message(message, frame)
+            self.track_source(message.source_id, stream)
+        # invalid message or processing error
+        except InvalidMessageException:
+            self.metrics.decode_errors += 1
+            await self.write_error(stream)
+            return
+        except SourceException:
+            self.metrics.rejected += 1
+            await self.write_error(stream)
+            return
+        acknowledgement = self.acknowledgements.get(stream)
+        if acknowledgement is not None:
+            acknowledgement.add(message.num)
+            self.broadcast_message(message, frame)
+            return
+        # send response to source
+        written = stream.write(self.success_response(message))
+        # notify listeners
+        self.broadcast_message(message, frame)
+        await written
+
+    async def handler_AckModeMessage(self, stream, address, header):
+        """
+        Handler of AckModeMessage instances: sets mode of acknowledgements of connection
+        :param stream: stream: tornado.iostream.IOStream
+        :param address: address
+        :param header: header of message: int
+        :return: future: tornado.concurrent.Future
+        """
         try:
-            message = yield SourceMessage.decode_stream(stream, header)
+            message = await AckModeMessage.decode_stream(stream, header)
+        except InvalidMessageException:
+            self.metrics.decode_errors += 1
+            await self.write_error(stream)
+            return
+        await stream.write(self.set_ack_mode(stream, message))
 
-            source_id = message.source_id
-            status = message.status
+    def set_ack_mode(self, connection, message):
+        """
+        Sets mode of acknowledgements of connection, not written cumulative acknowledgement is written before
+        :param connection: stream: tornado.iostream.IOStream or asyncio.Transport
+        :param message: message: AckModeMessage
+        :return: confirmation :bytes
+        """
+        acknowledgement = self.acknowledgements.pop(connection, None)
+        if acknowledgement is not None:
+            acknowledgement.flush()
+        if message.mode == AckModeMessage.MODE_CUMULATIVE:
+            self.acknowledgements[connection] = CumulativeAcknowledgement(connection.write, message.batch)
+        return ServerMessage(message.mode, ServerMessage.HEADER_ACK_MODE).encode()
 
-            # TODO: add handshake (now source with same name could send wrong messages)
+    def write_error(self, connection):
+        """
+        Writes error response, cumulative acknowledgement of previous messages is written before
+        :param connection: stream: tornado.iostream.IOStream or asyncio.Transport
+        :return: result of `write` of connection
+        """
+        acknowledgement = self.acknowledgements.get(connection)
+        if acknowledgement is not None:
+            acknowledgement.flush()
+        return connection.write(self.error_response())
 
-            # create source instance and add it to _sources if not exists
-            source = self.sources.get(source_id)
-            if not source:
-                source = Source(source_id, status)
-                self.sources[source_id] = source
+    def accept_source_message(self, message, frame=None):
+        """
+        Updates state of message source and time series.
+        Frame is appended to write-ahead log and sent to other workers.
+        Raises `SourceException` if message could not be accepted by source
+        :param message: message: SourceMessage
+        :param frame: raw frame of message :bytes
+        :return: None
+        """
+        source_id = message.source_id
+        self.update_source(message)
+        received = message.received
+        if received is None:
+            received = monotonic_ns()
+        if message.data:
+            self.timeseries.append(source_id, received, message.data)
+        if frame is not None and (self.wal is not None or self.bus is not None):
+            timestamp = to_wall_ns(received)
+            if self.wal is not None:
+                self.wal.append(frame, source_id, timestamp)
+            if self.bus is not None:
+                self.own_sources.add(source_id)
+                self.bus.publish(frame, timestamp)
 
-            # push message to source
-            source.get_message(message)
+    def update_source(self, message):
+        """
+        Pushes message to its source, source is created on first message.
+        Raises `SourceException` if message could not be accepted by source
+        :param message: message: SourceMessage
+        :return: None
+        """
+        source_id = message.source_id
 
-            # send response to source
-            ok_message = ServerMessage(message.num, ServerMessage.HEADER_SUCCESS)
-            yield stream.write(ok_message.encode())
+        # TODO: add handshake (now source with same name could send wrong messages)
 
-            # notify listeners
-            yield self.broadcast_message(message)
+        # create source instance and add it to _sources if not exists
+        source = self.sources.get(source_id)
+        if not source:
+            source = Source(source_id, message.status, self.SOURCE_HISTORY_SIZE)
+            self.sources[source_id] = source
 
-        # invalid message or processing error
-        except (InvalidMessageException, SourceException):
-            print('exception')
-            error_message = ServerMessage(0, ServerMessage.HEADER_ERROR)
-            yield stream.write(error_message.encode())
+        # push message to source
+        source.get_message(message)
 
-    @gen.coroutine
-    def stream_closed_handler(self, stream, address):
+    def success_response(self, message):
         """
-        Stream closed handler
-        :param stream: stream: tornado.iostream.IOStream
-        :param address: connection address
+        Response to source for accepted message
+        :param message: message: SourceMessage
+        :return: response :bytes
+        """
+        return ServerMessage(message.num, ServerMessage.HEADER_SUCCESS).encode()
+
+    def error_response(self):
+        """
+        Response to source for invalid message
+        :return: response :bytes
+        """
+        return ServerMessage(0, ServerMessage.HEADER_ERROR).encode()
+
+    def create_source_protocol(self):
+        """
+        Factory of asyncio protocols for source port.
+        Use it with `create_server` of asyncio loop, tornado IOLoop must be based on this loop.
+        :return: protocol :base.protocol.MessageProtocol
+        """
+        protocol = MessageProtocol(self.ALLOWED_MESSAGES, self.source_protocol_message, self.source_protocol_error,
+                                   with_frames=self.frames_needed,
+                                   connection_handler=self.source_protocol_connection)
+        self.protocols.add(protocol)
+        return protocol
+
+    def source_protocol_message(self, message, transport, frame=None):
+        """
+        Handler of messages decoded by source protocol
+        :param message: message: SourceMessage or AckModeMessage
+        :param transport: transport: asyncio.Transport
+        :param frame: raw frame of message :bytes
         :return: None
         """
-        # TODO: removing of disconnected sources
-        pass
+        metrics = self.metrics
+        metrics.messages += 1
+        if metrics.messages & metrics.SAMPLE_MASK:
+            self.handle_protocol_message(message, transport, frame)
+            return
+        start = monotonic_ns()
+        self.handle_protocol_message(message, transport, frame)
+        metrics.record('source_protocol_message', monotonic_ns() - start)
+
+    def handle_protocol_message(self, message, transport, frame):
+        """
+        Sets mode of acknowledgements or accepts source message, responses to source and notifies listeners.
+        Messages of transport paused by rate limits are held back until it is resumed (see `pause_transport`)
+        :param message: message: SourceMessage or AckModeMessage
+        :param transport: transport: asyncio.Transport
+        :param frame: raw frame of message :bytes
+        :return: None
+        """
+        held = self.paused_transports.get(transport)
+        if held is not None:
+            held.append((message, frame))
+            return
+        if type(message) is AckModeMessage:
+            transport.write(self.set_ack_mode(transport, message))
+            return
+        self.metrics.bytes_in += message.frame_length if frame is None else len(frame)
+        if self._rate_limited:
+            delay = self.rate_limit(message, transport)
+            if delay:
+                if self.RATE_LIMIT_POLICY == self.RATE_LIMIT_REJECT:
+                    self.write_error(transport)
+                    return
+                self.pause_transport(transport, delay, message, frame)
+                return
+        self.accept_protocol_message(message, transport, frame)
+
+    def accept_protocol_message(self, message, transport, frame):
+        """
+        Accepts source message within rate limits, responses to source and notifies listeners
+        :param message: message: SourceMessage
+        :param transport: transport: asyncio.Transport
+        :param frame: raw frame of message :bytes
+        :return: None
+        """
+        try:
+            self.accept_source_message(message, frame)
+        except SourceException as e:
+            self.source_protocol_error(e, transport)
+            return
+        self.track_source(message.source_id, transport)
+        acknowledgement = self.acknowledgements.get(transport)
+        if acknowledgement is None:
+            transport.write(self.success_response(message))
+        else:
+            acknowledgement.add(message.num)
+        self.broadcast_message(message, frame)
+
+    def rate_limit(self, message, connection):
+        """
+        Takes tokens of message from buckets of its source and status and of connection.
+        With `RATE_LIMIT_PAUSE` policy tokens are taken from empty buckets too (message is accepted after pause),
+        with `RATE_LIMIT_REJECT` policy rejected message takes no tokens
+        :param message: message: SourceMessage
+        :param connection: IOStream or asyncio transport
+        :return: 0 if message is within limits, else time until source is within limits (seconds) :float
+        """
+        now = time.monotonic()
+        debt = self.RATE_LIMIT_POLICY == self.RATE_LIMIT_PAUSE
+        delay = 0
+        limits = self.SOURCE_RATE_LIMITS
+        key = None
+        if limits:
+            status = message.status if message.status in limits else None
+            limit = limits.get(status)
+            if limit is not None:
+                key = message.source_id, status
+                delay = self.source_buckets.take(key, limit[0], limit[1], now, debt)
+        limit = self.CONNECTION_RATE_LIMIT
+        if limit is not None and (debt or not delay):
+            connection_delay = self.connection_buckets.take(connection, limit[0], limit[1], now, debt)
+            if connection_delay and not debt and key is not None:
+                # message is rejected, token of source is returned
+                self.source_buckets.give(key)
+            delay = max(delay, connection_delay)
+        if delay:
+            if debt:
+                self.metrics.rate_paused += 1
+            else:
+                self.metrics.rate_limited += 1
+        return delay
 
-    @gen.coroutine
-    def broadcast_message(self, message):
+    def pause_transport(self, transport, delay, message, frame):
         """
-        Broadcast message to all connected listeners
+        Pauses reading of source protocol transport for `delay` seconds, over-limit message and following
+        messages of already received data are held back and handled in order when transport is resumed
+        :param transport: transport: asyncio.Transport
+        :param delay: seconds :float
+        :param message: over-limit message (its tokens are taken) :SourceMessage
+        :param frame: raw frame of message :bytes
+        :return: None
+        """
+        self.paused_transports[transport] = deque(((message, frame), ))
+        transport.pause_reading()
+        IOLoop.current().call_later(delay, self.resume_transport, transport)
+
+    def resume_transport(self, transport):
+        """
+        Handles messages held by `pause_transport` and resumes reading of transport,
+        transport is paused again if held message is over limits
+        :param transport: transport: asyncio.Transport
+        :return: None
+        """
+        held = self.paused_transports.pop(transport, None)
+        if held is None or transport.is_closing():
+            return
+        message, frame = held.popleft()
+        self.accept_protocol_message(message, transport, frame)
+        while held:
+            message, frame = held.popleft()
+            self.handle_protocol_message(message, transport, frame)
+            if transport in self.paused_transports:
+                self.paused_transports[transport].extend(held)
+                return
+        transport.resume_reading()
+
+    def source_protocol_error(self, exception, transport):
+        """
+        Handler of invalid messages received by source protocol
+        :param exception: exception: base.exceptions.MessageException or SourceException
+        :param transport: transport: asyncio.Transport
+        :return: None
+        """
+        if isinstance(exception, SourceException):
+            self.metrics.rejected += 1
+        else:
+            self.metrics.decode_errors += 1
+        self.write_error(transport)
+
+    def source_protocol_connection(self, transport, connected):
+        """
+        Handler of opening and loss of connections of source protocol
+        :param transport: transport: asyncio.Transport
+        :param connected: connection is opened :bool
+        :return: None
+        """
+        if not connected:
+            host = self.admitted_transports.pop(transport, None)
+            if host is not None:
+                self.admissions[self.SOURCE_PORT].release(host)
+            self.source_disconnected(transport)
+            return
+        if self._admission_enabled:
+            address = transport.get_extra_info('peername')
+            host = address[0] if isinstance(address, tuple) else address
+            admission, admitted = self.admit(self.SOURCE_PORT, host)
+            if not admitted:
+                transport.abort()
+                return
+            if admission is not None:
+                self.admitted_transports[transport] = host
+        if self.idle_connections is not None:
+            self.idle_connections.add(transport)
+
+    def track_source(self, source_id, connection):
+        """
+        Resets idle timeout of connection and binds source of accepted message to connection
+        :param source_id: id of source :str
+        :param connection: IOStream or asyncio transport
+        :return: None
+        """
+        if self.idle_connections is not None:
+            self.idle_connections.touch(connection)
+        source = self.sources.get(source_id)
+        if source is None or source.connection is connection:
+            return
+        source.connection = connection
+        source.disconnected = None
+        sources = self.connection_sources.get(connection)
+        if sources is None:
+            sources = self.connection_sources[connection] = set()
+        sources.add(source_id)
+        if self.stale_sources is not None:
+            self.stale_sources.remove(source_id)
+
+    def source_disconnected(self, connection):
+        """
+        Marks sources of lost connection stale, they are removed after `SOURCE_RETENTION` seconds
+        :param connection: IOStream or asyncio transport
+        :return: None
+        """
+        if self.idle_connections is not None:
+            self.idle_connections.remove(connection)
+        self.connection_buckets.remove(connection)
+        now = monotonic_ns()
+        for source_id in self.connection_sources.pop(connection, ()):
+            source = self.sources.get(source_id)
+            # source could be connected again by other connection
+            if source is None or source.connection is not connection:
+                continue
+            source.connection = None
+            source.disconnected = now
+            if self.SOURCE_RETENTION == 0:
+                self.evict_source(source_id)
+            elif self.stale_sources is not None:
+                self.stale_sources.add(source_id)
+
+    def source_retention_expired(self, source_id):
+        """
+        Handler of timer wheel of stale sources: removes source if it is not connected again
+        :param source_id: id of source :str
+        :return: None
+        """
+        source = self.sources.get(source_id)
+        if source is not None and source.stale:
+            self.evict_source(source_id)
+
+    def evict_source(self, source_id):
+        """
+        Removes source from `sources`
+        :param source_id: id of source :str
+        :return: None
+        """
+        for status in self.SOURCE_RATE_LIMITS:
+            self.source_buckets.remove((source_id, status))
+        self.own_sources.discard(source_id)
+        if self.sources.pop(source_id, None) is not None:
+            self.metrics.evicted_sources += 1
+
+    def connection_timeout(self, connection):
+        """
+        Handler of timer wheel of idle connections: closes connection of source,
+        listener is closed only if it is stalled (see `BaseListener.progressed`),
+        lost listener without data to send is closed by TCP keepalive (see `handle_listener`)
+        :param connection: IOStream, asyncio transport or listener :BaseListener
+        :return: True if timeout of connection is reset :bool
+        """
+        if isinstance(connection, BaseListener) and connection.progressed():
+            return True
+        self.metrics.idle_timeouts += 1
+        connection.close()
+
+    def broadcast_message(self, message, frame=None):
+        """
+        Broadcast message to listeners subscribed to it (see `base.subscriptions.SubscriptionIndex`).
+        Message is only put to queues of listeners, it is written by writer tasks of listeners.
+        Message is rendered once for each format of listeners, all listeners share the same bytes.
+        Each broadcast message gets next number of `sequence` (sent to binary listeners).
         :param message: message: AbstractMessage
-        :return: future: tornado.concurrent.Future
+        :param frame: raw frame of message (for binary listeners) :bytes
+        :return: None
         """
+        self.sequence = (self.sequence + 1) & 0xffffffff
+        metrics = self.metrics
+        metrics.broadcasts += 1
         if self.listeners:
-            for listener_id, listener in self.listeners.items():
+            start = None if self.sequence & metrics.SAMPLE_MASK else monotonic_ns()
+            closed = []
+            payloads = {}  # key - listener format, value - rendered message
+            listeners = self.listeners
+            for listener_id in self.subscriptions.match(message):
+                listener = listeners[listener_id]
+                payload = payloads.get(listener.format)
+                if payload is None:
+                    payload = payloads[listener.format] = self.render_message(message, listener.format, frame)
                 try:
-                    yield listener.send(str(message).encode())
+                    listener.send(payload)
                 except ListenerClosedException:
-                    # Remove listener if it no more exist
-                    self.listeners.pop(listener_id)
+                    closed.append(listener_id)
+            # Remove listeners if they no more exist
+            for listener_id in closed:
+                self.remove_listener(listener_id)
+            if start is not None:
+                metrics.record('broadcast_message', monotonic_ns() - start)
+
+    def render_message(self, message, listener_format, frame=None):
+        """
+        Renders message for listeners.
+        For binary listeners received frame is forwarded as it is with envelope (see `BaseListener.FORMAT_BINARY`)
+        :param message: message: AbstractMessage
+        :param listener_format: format of listener: BaseListener.FORMAT_* value
+        :param frame: raw frame of message, message is encoded if it is not passed :bytes
+        :return: rendered message: bytes
+        """
+        if listener_format == BaseListener.FORMAT_BINARY:
+            if frame is None:
+                frame = message.encode()
+            received = message.received
+            timestamp = to_wall_ns(monotonic_ns() if received is None else received)
+            return BaseListener.pack_record(BaseListener.RECORD_MESSAGE, timestamp, self.sequence, frame)
+        return str(message).encode()
+
+    def render_text(self, text, listener_format):
+        """
+        Renders text line (e.g. response to command) for listeners
+        :param text: text line :str
+        :param listener_format: format of listener: BaseListener.FORMAT_* value
+        :return: rendered text: bytes
+        """
+        if listener_format == BaseListener.FORMAT_BINARY:
+            return BaseListener.pack_record(BaseListener.RECORD_TEXT, to_wall_ns(monotonic_ns()), self.sequence,
+                                            text.encode())
+        return text.encode()
+
+    def get_stats(self):
+        """
+        Metrics of server (see `base.metrics.Metrics.snapshot`) with state of sources, listeners, log and bus
+        :return: stats :dict
+        """
+        listeners = list(self.listeners.values())
+        gauges = {
+            'worker_id': self.WORKER_ID,
+            'sources': len(self.sources),
+            'listeners': len(listeners),
+            'subscriptions': len(self.subscriptions),
+            'listener_queue_depth': sum(listener.queue_depth for listener in listeners),
+            'listener_queue_depth_max': max((listener.queue_depth for listener in listeners), default=0),
+            'listener_write_buffer': sum(listener.write_buffer_size for listener in listeners),
+            'listener_write_buffer_max': max((listener.write_buffer_size for listener in listeners), default=0),
+            'cumulative_acknowledgements': len(self.acknowledgements),
+        }
+        if self.wal is not None:
+            gauges['wal_batch_bytes'] = self.wal.batch_bytes
+            gauges['wal_removed_segments'] = self.wal.removed_segments
+        admissions = {str(port): admission.stats() for port, admission in self.admissions.items()
+                      if admission is not None}
+        if admissions:
+            gauges['admission'] = admissions
+        if self._rate_limited:
+            gauges['rate_limited_sources'] = len(self.source_buckets)
+            gauges['rate_limited_connections'] = len(self.connection_buckets)
+            gauges['paused_transports'] = len(self.paused_transports)
+        if self.idle_connections is not None:
+            gauges['idle_tracked_connections'] = len(self.idle_connections)
+        gauges['stale_sources'] = sum(1 for source in self.sources.values() if source.stale)
+        if self.profiler.running:
+            gauges['profiler_samples'] = self.profiler.samples
+        if self.bus is not None:
+            gauges['bus_received'] = self.bus.received
+            gauges['bus_dropped'] = self.bus.dropped
+            gauges['bus_failed'] = self.bus.failed
+            gauges['bus_interested_peers'] = len(self.bus.interested)
+            gauges['bus_own_sources'] = len(self.own_sources)
+        protocol_connections = sum(1 for protocol in self.protocols if protocol.transport is not None)
+        additions = {
+            'connections': protocol_connections,
+            'source_connections': protocol_connections,
+        }
+        return self.metrics.snapshot(gauges, additions)
+
+    def get_listeners_stats(self):
+        """
+        Stats of listeners queues
+        :return: dict: key - listener address, value - dict with `queue_depth` and `dropped` counts
+        """
+        return {address: {'queue_depth': listener.queue_depth, 'dropped': listener.dropped}
+                for address, listener in self.listeners.items()}
@@ -0,0 +1,62 @@
+from weakref import WeakMethod
+
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+
+from base.message import ServerMessage
+
+
+class CumulativeAcknowledgement:
+    """
+    Cumulative acknowledgements of connection (see `AckModeMessage.MODE_CUMULATIVE`).
+    The highest number of contiguous run of accepted messages is acknowledged when `batch` messages are accepted
+    or on next iteration of IOLoop, so one response is written for all messages received by one read.
+    If number of accepted message does not follow previous one (gap of numbers), run is acknowledged at once
+    and new run is started, so acknowledgement never covers numbers which were not accepted.
+    Errors must be written after `flush` (acknowledgement of run before failed message).
+    Connection is referenced weakly, so acknowledgements could be kept in weak dictionary by connection.
+    """
+
+    # numbers of messages are wrapped by this value (`num` of SourceMessage is 2 bytes)
+    SEQUENCE_LIMIT = 0x10000
+
+    def __init__(self, write, batch):
+        """
+        :param write: write method of connection (IOStream or asyncio transport)
+        :param batch: max count of messages per acknowledgement :int
+        """
+        self.write = WeakMethod(write)
+        self.batch = batch
+        self.num = None  # number of last message of contiguous run of accepted messages
+        self.count = 0  # count of not acknowledged messages of run
+        self.scheduled = False
+
+    def add(self, num):
+        """
+        Accepts message
+        :param num: number of message :int
+        :return: None
+        """
+        if self.count and num != (self.num + 1) % self.SEQUENCE_LIMIT:
+            self.flush()
+        self.num = num
+        self.count += 1
+        if self.count >= self.batch:
+            self.flush()
+        elif not self.scheduled:
+            self.scheduled = True
+            IOLoop.current().add_callback(self.flush)
+
+    def flush(self):
+        """
+        Writes acknowledgement of accepted messages if there are some
+        :return: None
+        """
+        self.scheduled = False
+        write = self.write()
+        if self.count and write is not None:
+            self.count = 0
+            try:
+                write(ServerMessage(self.num, ServerMessage.HEADER_SUCCESS).encode())
+            except StreamClosedError:
+                pass
@@ -0,0 +1,87 @@
+from base.clock import monotonic_ns
+
+
+class AdmissionControl:
+    """
+    Budget of connections of server port: max count of open connections, max count of open connections
+    of one remote address and max rate of accepted connections (token bucket of `burst` connections
+    refilled by `accept_rate` connections per second). Limit with None value is not checked.
+    `admit` is called for accepted connection before any other work on it, `release` - when admitted
+    connection is closed. Rejected connections are counted by reasons (`REJECT_*` values) in `rejected`.
+    """
+
+    REJECT_CONNECTIONS = 'connections'
+    REJECT_ADDRESS = 'address'
+    REJECT_RATE = 'rate'
+
+    def __init__(self, max_connections=None, max_per_address=None, accept_rate=None, burst=None):
+        """
+        :param max_connections: max count of open connections :int
+        :param max_per_address: max count of open connections of one remote address :int
+        :param accept_rate: max count of accepted connections per second :float
+        :param burst: count of connections accepted at once above rate (`accept_rate` by default) :int
+        """
+        self.max_connections = max_connections
+        self.max_per_address = max_per_address
+        self.accept_rate = accept_rate
+        self.burst = burst or max(accept_rate or 0, 1)
+        self.connections = 0
+        self.addresses = {}  # key - remote address, value - count of open connections
+        self.accepted = 0
+        self.rejected = {self.REJECT_CONNECTIONS: 0, self.REJECT_ADDRESS: 0, self.REJECT_RATE: 0}
+        self._tokens = self.burst
+        self._refilled = monotonic_ns()
+
+    @property
+    def enabled(self):
+        return self.max_connections is not None or self.max_per_address is not None or self.accept_rate is not None
+
+    def admit(self, host):
+        """
+        Checks limits for new connection and registers it if it is admitted
+        :param host: remote address :str
+        :return: True if connection is admitted :bool
+        """
+        if self.max_connections is not None and self.connections >= self.max_connections:
+            self.rejected[self.REJECT_CONNECTIONS] += 1
+            return False
+        count = self.addresses.get(host, 0)
+        if self.max_per_address is not None and count >= self.max_per_address:
+            self.rejected[self.REJECT_ADDRESS] += 1
+            return False
+        if self.accept_rate is not None:
+            now = monotonic_ns()
+            self._tokens = min(self._tokens + (now - self._refilled) * self.accept_rate / 1e9, self.burst)
+            self._refilled = now
+            if self._tokens < 1:
+                self.rejected[self.REJECT_RATE] += 1
+                return False
+            self._tokens -= 1
+        self.connections += 1
+        self.addresses[host] = count + 1
+        self.accepted += 1
+        return True
+
+    def release(self, host):
+        """
+        Unregisters closed connection
+        :param host: remote address :str
+        :return: None
+        """
+        self.connections -= 1
+        count = self.addresses.get(host, 0) - 1
+        if count > 0:
+            self.addresses[host] = count
+        else:
+            self.addresses.pop(host, None)
+
+    def stats(self):
+        """
+        :return: open and accepted connections, count of remote addresses and rejected connections by reasons :dict
+        """
+        return {
+            'connections': self.connections,
+            'addresses': len(self.addresses),
+            'accepted': self.accepted,
+            'rejected': dict(self.rejected),
+        }
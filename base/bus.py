@@ -0,0 +1,317 @@
+import os
+import socket
+import struct
+from functools import partial
+
+from tornado.ioloop import IOLoop
+from tornado.iostream import IOStream, StreamClosedError, StreamBufferFullError
+from tornado.log import app_log
+from tornado.netutil import bind_unix_socket, add_accept_handler
+
+from base.clock import from_wall_ns
+from base.exceptions import InvalidMessageException
+from base.message import header_table
+
+
+# record of bus: wall-clock time of receiving (ns), size of frame and kind of record, followed by raw frame of message,
+# state record has no frame, its first field is id of sending worker and size field is flag of its interest
+RECORD = struct.Struct('>QHB')
+
+KIND_MESSAGE = 0  # frame accepted by sending worker
+KIND_SNAPSHOT = 1  # frame of last message of source owned by sending worker
+KIND_STATE = 2  # interest of sending worker in messages
+
+SOCKET_NAME = 'worker-{}.sock'
+
+
+class MessageBus:
+    """
+    Local bus of worker processes of server based on Unix stream sockets.
+    Each worker listens socket `worker-<id>.sock` in directory `path` and sends frames accepted by it
+    only to workers interested in messages (e.g. workers with listeners, see `set_interest`),
+    received frames are decoded and passed to `handler(message, frame)`, so worker without interest
+    does not decode and apply messages of other workers.
+    Worker announces its interest by state record to all peers. Peer which gets interest of worker
+    sends to it records of sources owned by peer (`snapshot()` returns (frame, timestamp) of their last messages),
+    they are passed to `snapshot_handler(message, frame)`. State is announced when bus is opened,
+    interested worker answers state to the first record of each new connection, so workers started later
+    learn interest of running ones.
+    Frames published during one iteration of IOLoop are sent by one write (up to `BATCH_SIZE` bytes),
+    so cost of bus is one write per interested peer for batch of messages.
+    Connections to peers are opened on first send, data is queued until connection is established.
+    Data is dropped if connection fails (peer is not interested until it announces interest again)
+    or peer has `BUFFER_SIZE` bytes not sent, count of dropped frames is kept in `dropped`.
+    """
+
+    # max size of batch of records (bytes)
+    BATCH_SIZE = 65536
+
+    # max size of not sent data of connection to peer (bytes)
+    BUFFER_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, path, worker_id, workers, message_classes, handler, snapshot=None, snapshot_handler=None):
+        """
+        :param path: directory of sockets :str
+        :param worker_id: id of current worker (0 <= worker_id < workers) :int
+        :param workers: count of workers :int
+        :param message_classes: message classes of published frames :tuple
+        :param handler: callback of received messages
+        :param snapshot: callback returning records (frame, timestamp) of sources owned by worker
+        :param snapshot_handler: callback of received messages of snapshots (`handler` by default)
+        """
+        self.path = path
+        self.worker_id = worker_id
+        self.peers = {peer: None for peer in range(workers) if peer != worker_id}  # value - IOStream
+        # key - peer which connection is not established yet, value - list of queued (data, count of frames)
+        self.connecting = {}
+        self.interested = set()  # peers interested in messages
+        self.interest = False  # worker is interested in messages of peers
+        self.message_classes = header_table(message_classes)
+        self.handler = handler
+        self.snapshot = snapshot
+        self.snapshot_handler = snapshot_handler or handler
+        self.socket = None
+        self.connections = {}  # key - stream of connected peer, value - id of peer (None before its state record)
+        self.batch = []
+        self.batch_bytes = 0
+        self.dropped = 0
+        self.received = 0
+        self.failed = 0  # count of received messages failed by handlers
+
+    def address(self, worker_id):
+        return os.path.join(self.path, SOCKET_NAME.format(worker_id))
+
+    def open(self):
+        """
+        Starts listening of socket of worker
+        :return: None
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self.socket = bind_unix_socket(self.address(self.worker_id))
+        add_accept_handler(self.socket, self._accept)
+        for peer in self.peers:
+            self._send_state(peer)
+
+    def close(self):
+        """
+        Sends not sent batch, closes connections and removes socket of worker.
+        Directory of sockets is removed by the last worker.
+        :return: None
+        """
+        if self.socket is None:
+            return
+        self.flush()
+        IOLoop.current().remove_handler(self.socket.fileno())
+        self.socket.close()
+        self.socket = None
+        for stream in list(self.connections) + list(self.peers.values()):
+            if stream is not None:
+                stream.close()
+        try:
+            os.unlink(self.address(self.worker_id))
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+    def set_interest(self, interest):
+        """
+        Announces to peers whether worker is interested in their messages
+        :param interest: :bool
+        :return: None
+        """
+        if interest == self.interest:
+            return
+        self.interest = interest
+        if self.socket is not None:
+            for peer in self.peers:
+                self._send_state(peer)
+
+    def publish(self, frame, timestamp):
+        """
+        Adds frame to batch for interested workers, batch is sent on next iteration of IOLoop or when it is full
+        :param frame: raw frame of message :bytes
+        :param timestamp: wall-clock time of receiving (ns) :int
+        :return: None
+        """
+        if not self.interested:
+            return
+        size = RECORD.size + len(frame)
+        if self.batch_bytes + size > self.BATCH_SIZE:
+            self.flush()
+        if not self.batch:
+            IOLoop.current().add_callback(self.flush)
+        self.batch.append(RECORD.pack(timestamp, len(frame), KIND_MESSAGE))
+        self.batch.append(frame)
+        self.batch_bytes += size
+
+    def flush(self):
+        """
+        Sends batch to interested workers
+        :return: None
+        """
+        if not self.batch or self.socket is None:
+            return
+        data = b''.join(self.batch)
+        count = len(self.batch) // 2
+        self.batch = []
+        self.batch_bytes = 0
+        for peer in list(self.interested):
+            self._send(peer, data, count)
+
+    def _send_state(self, peer):
+        self._send(peer, RECORD.pack(self.worker_id, self.interest, KIND_STATE), 0)
+
+    def _send_snapshot(self, peer):
+        """
+        Sends records of sources owned by worker to peer
+        :param peer: id of worker :int
+        :return: None
+        """
+        records = []
+        for frame, timestamp in self.snapshot():
+            records.append(RECORD.pack(timestamp, len(frame), KIND_SNAPSHOT))
+            records.append(frame)
+        if records:
+            self._send(peer, b''.join(records), len(records) // 2)
+
+    def _send(self, peer, data, count):
+        """
+        Writes data to connection of peer, connection is opened if it is closed
+        :param peer: id of worker :int
+        :param data: records :bytes
+        :param count: count of frames in data :int
+        :return: None
+        """
+        queue = self.connecting.get(peer)
+        if queue is not None:
+            queue.append((data, count))
+            return
+        stream = self.peers[peer]
+        if stream is None or stream.closed():
+            self.connecting[peer] = [(data, count)]
+            self._connect(peer)
+            return
+        try:
+            stream.write(data)
+        except (StreamClosedError, StreamBufferFullError):
+            self.dropped += count
+
+    def _connect(self, peer):
+        """
+        Opens connection to peer, data is queued in `connecting` until connection is established
+        :param peer: id of worker :int
+        :return: None
+        """
+        stream = IOStream(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), max_write_buffer_size=self.BUFFER_SIZE)
+        stream.connect(self.address(peer)).add_done_callback(partial(self._connected, peer, stream))
+
+    def _connected(self, peer, stream, future):
+        """
+        Writes queued data to established connection or drops it if connection is failed
+        """
+        queue = self.connecting.pop(peer, ())
+        if future.exception() is not None or self.socket is None:
+            # peer is not started yet or it is stopped, it announces its interest again on start
+            stream.close()
+            self.peers[peer] = None
+            self.interested.discard(peer)
+            self.dropped += sum(count for _, count in queue)
+            return
+        self.peers[peer] = stream
+        for data, count in queue:
+            try:
+                stream.write(data)
+            except (StreamClosedError, StreamBufferFullError):
+                self.dropped += count
+
+    def _accept(self, connection, address):
+        stream = IOStream(connection)
+        self.connections[stream] = None
+        IOLoop.current().spawn_callback(self._read, stream)
+
+    def _peer_state(self, stream, peer, interest):
+        """
+        Handles state record of peer
+        :param stream: connection of peer :tornado.iostream.IOStream
+        :param peer: id of worker :int
+        :param interest: peer is interested in messages :bool
+        :return: None
+        """
+        if peer not in self.peers:
+            return
+        if stream is not None and self.connections.get(stream) is None:
+            # peer is started or connected again, it learns interest of worker by answer
+            self.connections[stream] = peer
+            if self.interest:
+                self._send_state(peer)
+        if not interest:
+            self.interested.discard(peer)
+        elif peer not in self.interested:
+            # published frames are sent to other peers, peer gets state of their sources by snapshot
+            self.flush()
+            self.interested.add(peer)
+            if self.snapshot is not None:
+                self._send_snapshot(peer)
+
+    async def _read(self, stream):
+        """
+        Reads records from connection of peer
+        :param stream: stream :tornado.iostream.IOStream
+        :return: None
+        """
+        buffer = b''
+        try:
+            while True:
+                data = await stream.read_bytes(self.BATCH_SIZE, partial=True)
+                buffer = buffer + data if buffer else data
+                buffer = buffer[self.decode(buffer, stream):]
+        except StreamClosedError:
+            pass
+        finally:
+            # peer connects again on next send
+            stream.close()
+            self.connections.pop(stream, None)
+
+    def decode(self, buffer, stream=None):
+        """
+        Decodes complete records of buffer and passes messages to handlers, invalid frames are skipped.
+        Exception of handler is logged and counted in `failed`, following records are decoded.
+        :param buffer: received data :bytes
+        :param stream: connection of peer which sent data :tornado.iostream.IOStream
+        :return: offset of first not decoded byte :int
+        """
+        view = memoryview(buffer)
+        offset = 0
+        size = len(view)
+        message_classes = self.message_classes
+        try:
+            while offset + RECORD.size <= size:
+                timestamp, frame_size, kind = RECORD.unpack_from(view, offset)
+                start = offset + RECORD.size
+                if kind == KIND_STATE:
+                    offset = start
+                    self._peer_state(stream, timestamp, bool(frame_size))
+                    continue
+                end = start + frame_size
+                if end > size:
+                    break
+                offset = end
+                message_class = message_classes.get(view[start]) if frame_size else None
+                if message_class is None:
+                    continue
+                try:
+                    message = message_class.decode_from(view, start, end)
+                except InvalidMessageException:
+                    continue
+                message.received = from_wall_ns(timestamp)
+                self.received += 1
+                handler = self.handler if kind == KIND_MESSAGE else self.snapshot_handler
+                try:
+                    handler(message, bytes(view[start:end]))
+                except Exception:
+                    self.failed += 1
+                    app_log.exception('message %s of source %s from bus is not handled',
+                                      message.num, message.source_id)
+        finally:
+            view.release()
+        return offset
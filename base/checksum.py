@@ -0,0 +1,53 @@
+import zlib
+from functools import reduce
+from operator import xor
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, it is used only for big buffers
+    numpy = None
+
+
+# min size of buffer (bytes) to calculate xor with numpy
+NUMPY_MIN_SIZE = 4096
+
+# max size of buffer (bytes) to calculate xor byte by byte, folding of integer is slower for short parts
+REDUCE_MAX_SIZE = 8
+
+# one byte bytes objects: index - value of byte
+SINGLE_BYTES = tuple(bytes((i, )) for i in range(256))
+
+
+def xor_checksum(bytes_data, value=0):
+    """
+    XOR of all bytes.
+    Bytes are loaded into one integer and folded by halves down to one 8-byte word,
+    so work is done by C-level integer operations instead of python loop over bytes.
+    :param bytes_data: bytes-like object :bytes
+    :param value: result of previous parts of data (to calculate check sum by parts) :int
+    :return: xor result in one byte :int
+    """
+    size = len(bytes_data)
+    if size <= REDUCE_MAX_SIZE:
+        return reduce(xor, bytes_data, value)
+    if numpy is not None and size >= NUMPY_MIN_SIZE:
+        return int(numpy.bitwise_xor.reduce(numpy.frombuffer(bytes_data, dtype=numpy.uint8))) ^ value
+    word = int.from_bytes(bytes_data, 'little')
+    while size > 8:
+        size = (size + 1) // 2
+        shift = size * 8
+        word = (word >> shift) ^ (word & ((1 << shift) - 1))
+    word ^= word >> 32
+    word ^= word >> 16
+    word ^= word >> 8
+    return (word & 0xff) ^ value
+
+
+def crc32_checksum(bytes_data, value=0):
+    """
+    CRC32 of bytes (zlib implementation)
+    :param bytes_data: bytes-like object :bytes
+    :param value: result of previous parts of data (to calculate check sum by parts) :int
+    :return: crc32 :int
+    """
+    return zlib.crc32(bytes_data, value)
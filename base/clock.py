@@ -0,0 +1,44 @@
+import time
+from datetime import datetime
+
+try:
+    from time import monotonic_ns
+except ImportError:  # python < 3.7
+    def monotonic_ns():
+        """
+        Monotonic clock in nanoseconds
+        :return: int
+        """
+        return int(time.monotonic() * 1000000000)
+
+
+# wall-clock time (ns) of `MONOTONIC_ANCHOR`, used to display monotonic timestamps
+WALL_ANCHOR = int(time.time() * 1000000000)
+MONOTONIC_ANCHOR = monotonic_ns()
+
+
+def to_wall_ns(timestamp):
+    """
+    Converts monotonic timestamp to wall-clock time
+    :param timestamp: monotonic time (ns) :int
+    :return: nanoseconds since epoch :int
+    """
+    return WALL_ANCHOR + timestamp - MONOTONIC_ANCHOR
+
+
+def to_datetime(timestamp):
+    """
+    Converts monotonic timestamp to local datetime
+    :param timestamp: monotonic time (ns) :int
+    :return: datetime
+    """
+    return datetime.fromtimestamp(to_wall_ns(timestamp) / 1000000000)
+
+
+def from_wall_ns(timestamp):
+    """
+    Converts wall-clock time to monotonic timestamp (see `to_wall_ns`)
+    :param timestamp: nanoseconds since epoch :int
+    :return: monotonic time (ns) :int
+    """
+    return MONOTONIC_ANCHOR + timestamp - WALL_ANCHOR
@@ -0,0 +1,217 @@
+import struct
+import threading
+
+from base.exceptions import EncodeMessageError, DecodeMessageError
+
+
+# struct format prefix for `BYTE_ORDER` values of messages
+BYTE_ORDER_FORMAT = {
+    'big': '>',
+    'little': '<',
+}
+
+
+class AbstractCodec:
+    """
+    Base class of codecs.
+    Codec keeps precompiled `struct.Struct` layouts of message frames for one byte order.
+    Use `for_byte_order` to get shared codec instance instead of creating it on every message.
+    """
+
+    # cache of codecs: key - (codec class, byte order), value - codec instance
+    _codecs = {}
+
+    def __init__(self, byte_order):
+        try:
+            self.byte_order = byte_order
+            self.order_format = BYTE_ORDER_FORMAT[byte_order]
+        except KeyError:
+            raise ValueError('unknown byte order "{}"'.format(byte_order))
+
+    @classmethod
+    def for_byte_order(cls, byte_order):
+        """
+        Returns shared codec instance for byte order
+        :param byte_order: 'big' or 'little' :str
+        :return: codec :AbstractCodec
+        """
+        key = (cls, byte_order)
+        codec = cls._codecs.get(key)
+        if codec is None:
+            codec = cls._codecs[key] = cls(byte_order)
+        return codec
+
+
+class SourceMessageCodec(AbstractCodec):
+    """
+    Codec of `SourceMessage` frames.
+    Frame layout: header(1), num(2), source_id(8), status(1), numfields(1), numfields * data chunk, check sum.
+    Data chunk layout: field name(8), value(4).
+    Frames are packed into reusable buffer, so only final bytes object is allocated.
+    Codec is shared by messages (see `for_byte_order`), so each thread packs into own buffer.
+    """
+
+    # max count of data chunks (numfields is one byte)
+    MAX_FIELDS = 0xff
+
+    # length of source_id and field names
+    NAME_SIZE = 8
+
+    # max count of cached encoded names
+    NAMES_CACHE_SIZE = 4096
+
+    def __init__(self, byte_order):
+        super().__init__(byte_order)
+        self.head = struct.Struct(self.order_format + 'BH8sBB')  # header, num, source_id, status, numfields
+        self.prefix = struct.Struct(self.order_format + 'H8sBB')  # head without header
+        self.chunk = struct.Struct(self.order_format + '8sI')  # field name, value
+        self.buffers = threading.local()  # `buffer` and its `view` of thread
+        self.names = {}  # cache of encoded names: key - name, value - trimmed bytes
+
+    def pack(self, header, num, source_id, status, data):
+        """
+        Packs message to bytes without check sum
+        :param header: message header :int
+        :param num: message number :int
+        :param source_id: source id :str
+        :param status: source status :int
+        :param data: message data :dict
+        :return: raw message :bytes
+        """
+        buffer, view = self.get_buffer()
+        num_fields = len(data) if data else 0
+        try:
+            self.head.pack_into(buffer, 0, header, num, self.encode_name(source_id), status, num_fields)
+        except struct.error:
+            raise EncodeMessageError(self._head_error(num, status, num_fields))
+        size = self.head.size
+        if num_fields:
+            size = self._pack_data_into(buffer, data, size)
+        return bytes(view[:size])
+
+    def pack_data(self, data):
+        """
+        Packs data chunks of message.
+        Data fields will be ordered by name.
+        :param data: message data :dict
+        :return: data chunks :bytes
+        """
+        if len(data) > self.MAX_FIELDS:
+            raise EncodeMessageError(self._head_error(0, 0, len(data)))
+        buffer, view = self.get_buffer()
+        return bytes(view[:self._pack_data_into(buffer, data, 0)])
+
+    def get_buffer(self):
+        """
+        Buffer of frame of current thread
+        :return: buffer and its view :tuple
+        """
+        buffers = self.buffers
+        try:
+            return buffers.buffer, buffers.view
+        except AttributeError:
+            buffers.buffer = bytearray(self.head.size + self.MAX_FIELDS * self.chunk.size)
+            buffers.view = memoryview(buffers.buffer)
+            return buffers.buffer, buffers.view
+
+    def unpack_prefix(self, prefix):
+        """
+        Unpacks prefix of message (part of head after header)
+        :param prefix: prefix :bytes
+        :return: num, source_id, status, numfields :tuple
+        """
+        num, source_id, status, num_fields = self.prefix.unpack_from(prefix)
+        return num, source_id.decode().replace('\0', ''), status, num_fields
+
+    def unpack_data(self, bytes_data, num_fields):
+        """
+        Unpacks data chunks of message
+        :param bytes_data: data chunks :bytes
+        :param num_fields: count of chunks :int
+        :return: data :dict
+        """
+        if len(bytes_data) != num_fields * self.chunk.size:
+            raise DecodeMessageError('invalid message data')
+        return {field.decode().replace('\0', ''): value for field, value in self.chunk.iter_unpack(bytes_data)}
+
+    def encode_name(self, name):
+        """
+        Encodes source id or field name to `NAME_SIZE` bytes
+        :param name: name :str
+        :return: name :bytes
+        """
+        names = self.names
+        try:
+            return names[name]
+        except KeyError:
+            if len(names) >= self.NAMES_CACHE_SIZE:
+                names.clear()
+            encoded = names[name] = trim_bytes(name.encode(), self.NAME_SIZE)
+            return encoded
+
+    def _pack_data_into(self, buffer, data, offset):
+        pack_into = self.chunk.pack_into
+        encode_name = self.encode_name
+        chunk_size = self.chunk.size
+        for key in sorted(data.keys()):  # define order of chunks of data by field name
+            try:
+                pack_into(buffer, offset, encode_name(key), data[key])
+            except struct.error:
+                raise EncodeMessageError('value of "{}" key is too long'.format(key))
+            offset += chunk_size
+        return offset
+
+    def _head_error(self, num, status, num_fields):
+        if not isinstance(num, int) or not 0 <= num <= 0xffff:
+            return '"num" value too long'
+        if not isinstance(status, int) or not 0 <= status <= 0xff:
+            return '"status" value too long'
+        if num_fields > self.MAX_FIELDS:
+            return 'too many data fields: {}'.format(num_fields)
+        return 'invalid message header'
+
+
+class AckModeMessageCodec(AbstractCodec):
+    """
+    Codec of `AckModeMessage` frames.
+    Frame layout: header(1), mode(1), batch(2), check sum.
+    """
+
+    def __init__(self, byte_order):
+        super().__init__(byte_order)
+        self.head = struct.Struct(self.order_format + 'BBH')  # header, mode, batch
+        self.body = struct.Struct(self.order_format + 'BH')  # mode, batch
+
+    def pack(self, header, mode, batch):
+        """
+        Packs message to bytes without check sum
+        :param header: message header :int
+        :param mode: mode of acknowledgements :int
+        :param batch: max count of messages per acknowledgement :int
+        :return: raw message :bytes
+        """
+        try:
+            return self.head.pack(header, mode, batch)
+        except struct.error:
+            raise EncodeMessageError('"mode" or "batch" value too long')
+
+    def unpack(self, bytes_data):
+        """
+        Unpacks body of message (after header)
+        :param bytes_data: body :bytes
+        :return: mode and batch :tuple
+        """
+        return self.body.unpack_from(bytes_data)
+
+
+def trim_bytes(bytes_data, num):
+    """
+    Helper method thar trim `bytes_data` to `num` bytes
+    :param bytes_data: bytes: bytes
+    :param num: count of bytes: int
+    :return: bytes: bytes
+    """
+    data = bytes_data[:num]
+    if len(data) < num:
+        data = bytes((num - len(data))) + data  # add empty bytes if need
+    return data
@@ -12,6 +12,20 @@ class ListenerClosedException(ListenerException):
     pass
 
 
+class ListenerCommandException(ListenerException):
+    """
+    Invalid command of listener
+    """
+    pass
+
+
+class SubscriptionException(ListenerCommandException):
+    """
+    Invalid subscription of listener
+    """
+    pass
+
+
 class MessageException(Exception):
     """
     Base message exception
@@ -51,4 +65,10 @@ class SourceException(Exception):
     """
     Base source exception
     """
-    pass
\ No newline at end of file
+    pass
+
+class WALException(Exception):
+    """
+    Base write-ahead log exception
+    """
+    pass
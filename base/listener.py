@@ -1,5 +1,9 @@
-from tornado import gen
+import struct
+from collections import deque
+
+from tornado.ioloop import IOLoop
 from tornado.iostream import StreamClosedError
+from tornado.locks import Event
 
 from base.exceptions import ListenerClosedException
 
@@ -7,24 +11,187 @@ from base.exceptions import ListenerClosedException
 class BaseListener:
     """
     Listener class for usage on server-side.
+    Sent data is put to bounded queue of listener and written to stream by own writer task (see `start`),
+    so slow listener does not delay sender.
+    When queue is full, `overflow_policy` is applied:
+     - `OVERFLOW_DROP_OLDEST` - oldest queued data is dropped
+     - `OVERFLOW_DROP_NEWEST` - sent data is dropped
+     - `OVERFLOW_DISCONNECT` - listener is disconnected
+    `queue_depth` and `dropped` show current size of queue and count of dropped sends,
+    `written` and `written_bytes` - count and size of data passed to stream.
+    With `metrics` each send is counted in `listener_messages`, `listener_bytes` and `listener_dropped`
+    counters of server metrics at once, so they include live listeners.
+    `format` defines representation of messages sent to listener, server renders message once for each format
+    and shares the same bytes between listeners.
+
+    In `FORMAT_BINARY` each record is `ENVELOPE` (kind of record, wall-clock time of receiving in ns,
+    sequence number of message on server, size of payload) followed by payload:
+    original frame of message for `RECORD_MESSAGE` or text line for `RECORD_TEXT` (responses to commands).
     """
 
-    def __init__(self, stream):
+    # formats of messages
+    FORMAT_TEXT = 'text'
+    FORMAT_BINARY = 'binary'
+
+    # envelope of binary record: kind, timestamp, sequence, size of payload
+    ENVELOPE = struct.Struct('>BQIH')
+
+    # kinds of binary records
+    RECORD_MESSAGE = 0x00
+    RECORD_TEXT = 0x01
+
+    OVERFLOW_DROP_OLDEST = 'drop_oldest'
+    OVERFLOW_DROP_NEWEST = 'drop_newest'
+    OVERFLOW_DISCONNECT = 'disconnect'
+
+    OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_DISCONNECT)
+
+    # default max size of queue (count of sends)
+    QUEUE_SIZE = 1024
+
+    # default overflow policy
+    OVERFLOW_POLICY = OVERFLOW_DROP_OLDEST
+
+    def __init__(self, stream, queue_size=None, overflow_policy=None, metrics=None):
         """
         Init source
         :param stream: tornado.iostream.IOStream
+        :param queue_size: max size of queue :int
+        :param overflow_policy: one of `OVERFLOW_POLICIES` :str
+        :param metrics: metrics of server :base.metrics.Metrics
         """
         self.stream = stream
+        self.metrics = metrics
+        self.queue_size = queue_size or self.QUEUE_SIZE
+        self.overflow_policy = overflow_policy or self.OVERFLOW_POLICY
+        if self.overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError('unknown overflow policy "{}"'.format(self.overflow_policy))
+        self.format = self.FORMAT_TEXT
+        self.queue = deque()
+        self.dropped = 0  # count of dropped sends
+        self.written = 0
+        self.written_bytes = 0
+        self.closed = False
+        self._checked_written = 0  # value of `written` at previous call of `progressed`
+        self._ready = Event()
+        self._started = False
+
+    @classmethod
+    def pack_record(cls, kind, timestamp, sequence, payload):
+        """
+        Binary record (see `FORMAT_BINARY`)
+        :param kind: `RECORD_MESSAGE` or `RECORD_TEXT` :int
+        :param timestamp: wall-clock time (ns) :int
+        :param sequence: sequence number of message :int
+        :param payload: frame of message or text :bytes
+        :return: record :bytes
+        """
+        return cls.ENVELOPE.pack(kind, timestamp, sequence, len(payload)) + payload
+
+    @property
+    def queue_depth(self):
+        """
+        Count of sends waiting in queue
+        :return: int
+        """
+        return len(self.queue)
+
+    @property
+    def write_buffer_size(self):
+        """
+        Size of data written to stream and not sent yet (bytes).
+        IOStream has no public accessor of it, so private attributes are read if they exist:
+        `_write_buffer_size` of tornado 4 or length of `_write_buffer` of tornado 5 and later.
+        :return: int
+        """
+        stream = self.stream
+        size = getattr(stream, '_write_buffer_size', None)
+        if size is None:
+            buffer = getattr(stream, '_write_buffer', None)
+            try:
+                size = len(buffer) if buffer is not None else 0
+            except TypeError:
+                size = 0
+        return size
+
+    def progressed(self):
+        """
+        Checks that listener is not stalled: it has nothing to send or it has written data since previous call
+        :return: bool
+        """
+        written = self.written
+        progressed = written != self._checked_written or (not self.queue and not self.write_buffer_size)
+        self._checked_written = written
+        return progressed
+
+    def start(self):
+        """
+        Starts writer task of listener on current IOLoop
+        :return: None
+        """
+        if not self._started:
+            self._started = True
+            IOLoop.current().spawn_callback(self._write_queue)
 
-    @gen.coroutine
     def send(self, bytes_data):
         """
-        Send bytes to listener.
+        Put bytes to queue of listener.
         Raises `ListenerClosedException` when connection with listener lost
         :param bytes_data:
-        :return: future: tornado.concurrent.Future
+        :return: False if data is dropped by overflow policy else True :bool
+        """
+        if self.closed or self.stream.closed():
+            self.close()
+            raise ListenerClosedException('Stream closed')
+        queue = self.queue
+        metrics = self.metrics
+        if len(queue) >= self.queue_size:
+            self.dropped += 1
+            if metrics is not None:
+                metrics.listener_dropped += 1
+            if self.overflow_policy == self.OVERFLOW_DROP_NEWEST:
+                return False
+            if self.overflow_policy == self.OVERFLOW_DISCONNECT:
+                self.close()
+                raise ListenerClosedException('Listener queue overflow')
+            queue.popleft()
+        queue.append(bytes_data)
+        if metrics is not None:
+            metrics.listener_messages += 1
+            metrics.listener_bytes += len(bytes_data)
+        self._ready.set()
+        return True
+
+    def close(self):
+        """
+        Close listener connection and drop queued data
+        :return: None
+        """
+        self.closed = True
+        self.queue.clear()
+        self._ready.set()
+        self.stream.close()
+
+    async def _write_queue(self):
+        """
+        Writer task: passes all queued data to stream and waits until it is flushed
+        :return: None
         """
+        queue = self.queue
+        stream = self.stream
         try:
-            self.stream.write(bytes_data)
-        except StreamClosedError as e:
-            raise ListenerClosedException('Stream closed') from e
+            while not self.closed:
+                if not queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                future = None
+                while queue:
+                    bytes_data = queue.popleft()
+                    self.written += 1
+                    self.written_bytes += len(bytes_data)
+                    future = stream.write(bytes_data)
+                await future
+        except StreamClosedError:
+            self.closed = True
+            queue.clear()
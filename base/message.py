@@ -1,8 +1,6 @@
-from datetime import datetime
-from functools import reduce
-
-from tornado import gen
-
+from base.checksum import xor_checksum, crc32_checksum, SINGLE_BYTES
+from base.clock import monotonic_ns, to_datetime
+from base.codec import SourceMessageCodec, AckModeMessageCodec, trim_bytes
 from base.exceptions import MessageException, InvalidMessageException, DecodeMessageError, EncodeMessageError
 
 
@@ -14,11 +12,18 @@ class AbstractMessage:
     Allowed message headers must be defined in `HEADERS`, default `DEFAULT_HEADER`
     To control big-endian/little-endian style use `BYTE_ORDER` as `big` and `little` accordingly.
     Default check sum method based on bitwise XOR. You could override `check_sum_method` for change it
+    (or incremental `check_sum_part`, it is faster for decoding),
+    size of check sum in bytes is defined by `CHECK_SUM_SIZE`
 
     To encode message to bytes use `encode` method
 
+    Messages use `__slots__`, child classes should define own `__slots__` for their fields.
+    Time of receiving is kept in `received` as monotonic nanoseconds (see base.clock),
+    it is set by decoders only, so messages created locally have no receive time.
     """
 
+    __slots__ = ('received', )
+
     # 'big' or 'little'
     BYTE_ORDER = 'big'
 
@@ -28,17 +33,58 @@ class AbstractMessage:
     # tuple of allowed headers (int)
     HEADERS = None
 
+    # codec class with precompiled layouts of message (child of base.codec.AbstractCodec)
+    CODEC_CLASS = None
+
+    # codec instance of class (see `get_codec`)
+    _codec = None
+
+    # size of check sum at the end of message (bytes)
+    CHECK_SUM_SIZE = 1
+
     def __init__(self):
-        self.date_received = datetime.now()
+        self.received = None
+
+    @property
+    def date_received(self):
+        """
+        Local date and time of receiving of message
+        :return: datetime or None if message is not received
+        """
+        if self.received is None:
+            return None
+        return to_datetime(self.received)
 
     def check_sum_method(self, bytes_data):
         """
         Default check sum implementation.
         Override this method for your own implementation.
         :param bytes_data: bytes: bytes
-        :return: check sum result: bytes
+        :return: check sum result: int
         """
-        return xor_checksum(bytes_data)
+        return self.check_sum_part(bytes_data)
+
+    # Incremental check sum `check_sum_part(bytes_data, value=0)`: result of previous part is passed as `value`,
+    # so check sum of received message is calculated by its parts without joining of them.
+    # Override it (instead of `check_sum_method`) to change check sum of encoding and decoding at once.
+    check_sum_part = staticmethod(xor_checksum)
+
+    def verify_check_sum(self, parts, check_sum):
+        """
+        Verify check sum of received message by its raw parts (without re-encoding of message).
+        If `check_sum_method` is overridden, it is called for joined parts as before.
+        :param parts: parts of raw message without check sum :tuple of bytes
+        :param check_sum: received check sum :bytes
+        :return: is valid :bool
+        """
+        if type(self).check_sum_method is AbstractMessage.check_sum_method:
+            value = 0
+            check_sum_part = self.check_sum_part
+            for part in parts:
+                value = check_sum_part(part, value)
+        else:
+            value = self.check_sum_method(b''.join(parts))
+        return value == int.from_bytes(check_sum, self.BYTE_ORDER)
 
     def check_sum(self, bytes_data=None):
         """
@@ -66,8 +112,8 @@ class AbstractMessage:
         :return: byte :byte
         """
         raw_body = self.get_raw()
-        check_sum = self.check_sum(raw_body)
-        return raw_body + bytes((check_sum,))
+        check_sum = self.check_sum_method(raw_body)
+        return raw_body + check_sum.to_bytes(self.CHECK_SUM_SIZE, self.BYTE_ORDER)
 
 
     @classmethod
@@ -90,14 +136,16 @@ class AbstractMessage:
         """
         raise MessageException('`decode_stream` method implemented')
 
-def xor_checksum(bytes_data):
-    """
-    Helper check sum function
-    :param bytes_data: bytes: bytes
-    :return: xor results in one byte: bytes
-    """
-    return reduce(lambda x, y: x ^ y, bytes_data)
-
+    @classmethod
+    def get_codec(cls):
+        """
+        Returns codec of message for `BYTE_ORDER`
+        :return: codec :base.codec.AbstractCodec
+        """
+        codec = cls._codec
+        if codec is None or codec.byte_order != cls.BYTE_ORDER or type(codec) is not cls.CODEC_CLASS:
+            codec = cls._codec = cls.CODEC_CLASS.for_byte_order(cls.BYTE_ORDER)
+        return codec
 
 class SourceMessage(AbstractMessage):
     """
@@ -120,6 +168,16 @@ class SourceMessage(AbstractMessage):
 
     HEADERS = (DEFAULT_HEADER, )
 
+    CODEC_CLASS = SourceMessageCodec
+
+    __slots__ = ('header', 'num', 'source_id', 'status', 'data')
+
+    # size of fixed part after header: num(2), source_id(8), status(1), numfields(1)
+    PREFIX_SIZE = 12
+
+    # size of one data chunk: field name(8), value(4)
+    CHUNK_SIZE = 12
+
     def __init__(self, num, source_id, status, header=None, data=None):
         """
         Construct message
@@ -142,23 +200,15 @@ class SourceMessage(AbstractMessage):
         self.data = data
 
     def get_raw(self):
-        message_data = []
-        message_data.append(self.header)  # header
-        try:
-            message_data += self.num.to_bytes(2, self.BYTE_ORDER)  # num
-        except OverflowError:
-            raise EncodeMessageError('"num" value too long')
-        message_data += trim_bytes(self.source_id.encode(), 8)  # source id limit to 8 bytes
-        try:
-            message_data += self.status.to_bytes(1, self.BYTE_ORDER)  # status
-        except:
-            raise EncodeMessageError('"status" value too long')
-        if self.data:
-            message_data.append(len(self.data))  # numfields
-            message_data += self._encode_data()  # data
-        else:
-            message_data.append(0x00)  # numfields = 0
-        return bytes(message_data)
+        return self.get_codec().pack(self.header, self.num, self.source_id, self.status, self.data)
+
+    @property
+    def frame_length(self):
+        """
+        Size of encoded frame of message (header and check sum included)
+        :return: size in bytes :int
+        """
+        return 1 + self.PREFIX_SIZE + len(self.data or ()) * self.CHUNK_SIZE + self.CHECK_SUM_SIZE
 
     @property
     def status_text(self):
@@ -175,48 +225,143 @@ class SourceMessage(AbstractMessage):
         :param bytes_data :bytes
         :return: message: Message
         """
-        header = int.from_bytes((bytes_data[0],), cls.BYTE_ORDER)
-        check_sum = int.from_bytes((bytes_data[-1],), cls.BYTE_ORDER)
-        data_body = bytes_data[1:-1]
-        num = int.from_bytes(data_body[0:2], cls.BYTE_ORDER)
-        source_id = data_body[2:10].decode().replace('\0', '')
-        status = int.from_bytes((data_body[10], ), cls.BYTE_ORDER)
-        num_fields = int.from_bytes((data_body[11], ), cls.BYTE_ORDER)
-        if num_fields > 0:
-            data = data_body[12:]
-            try:
-                data = cls._decode_data(data, num_fields)
-            except DecodeMessageError as e:
-                raise InvalidMessageException('Invalid message {} body from source {}'.format(num, source_id)) from e
-        else:
-            data = None
-        message = SourceMessage(num, source_id, status, header, data)
-        if message.check_sum() != check_sum:
-            raise InvalidMessageException('Invalid message {} from source {}'.format(num, source_id))
-        return message
+        view = memoryview(bytes_data)
+        return cls.decode_from(view, 0, len(view))
 
     @classmethod
-    @gen.coroutine
-    def decode_stream(cls, stream, header):
+    async def decode_stream(cls, stream, header):
         """
         Convert to message from tornado.iostream.IOStream
+        Frame is read by two calls: fixed size prefix and body with check sum.
         :param stream:
         :param header: message header :int
         :return:
         """
-        chunk_size = 12
-        byte_data = b''
-        byte_data += header.to_bytes(1, cls.BYTE_ORDER)  # header
-        byte_data += yield stream.read_bytes(2)  # num
-        byte_data += yield stream.read_bytes(8)  # source_id
-        byte_data += yield stream.read_bytes(1)  # status
-        num_fields = yield stream.read_bytes(1)  # numfields
-        byte_data += num_fields
-        num = int.from_bytes(num_fields, cls.BYTE_ORDER)
-        if num > 0:
-            byte_data += yield stream.read_bytes(num * chunk_size)  # data
-        byte_data += yield stream.read_bytes(1)  # check_sum
-        message = cls.decode(byte_data)
+        prefix = await stream.read_bytes(cls.PREFIX_SIZE)  # num, source_id, status, numfields
+        body = await stream.read_bytes(cls.body_size(prefix))  # data, check_sum
+        message = cls._decode_frame(header, memoryview(prefix), memoryview(body))
+        return message
+
+    @classmethod
+    async def read_frame(cls, stream, header):
+        """
+        Reads raw frame of message from tornado.iostream.IOStream by the same calls as `decode_stream`
+        :param stream:
+        :param header: message header :int
+        :return: frame with header and check sum :bytes
+        """
+        prefix = await stream.read_bytes(cls.PREFIX_SIZE)
+        body = await stream.read_bytes(cls.body_size(prefix))
+        return b''.join((SINGLE_BYTES[header], prefix, body))
+
+    @classmethod
+    def iter_decode(cls, buffer, offset=0):
+        """
+        Lazily decodes messages from buffer with back-to-back frames (header included).
+        Frames are parsed by the same rules as `decode_stream` without copying of buffer.
+        Generator returns offset of first not decoded byte: start of partial trailing frame
+        or end of buffer (see `decode_many`).
+        :param buffer: frames :bytes, bytearray, memoryview or mmap
+        :param offset: offset of first frame :int
+        :return: generator of messages :SourceMessage
+        """
+        view = memoryview(buffer)
+        try:
+            size = len(view)
+            headers = cls.HEADERS
+            frame_size = cls.frame_size
+            decode_from = cls.decode_from
+            while offset < size:
+                if view[offset] not in headers:
+                    raise InvalidMessageException('invalid message header {} at offset {}'.format(view[offset], offset))
+                end = frame_size(view, offset)
+                if end is None:
+                    break
+                end += offset
+                if end > size:
+                    break
+                yield decode_from(view, offset, end)
+                offset = end
+        finally:
+            view.release()
+        return offset
+
+    @classmethod
+    def decode_many(cls, buffer, offset=0):
+        """
+        Decodes all complete messages from buffer with back-to-back frames
+        :param buffer: frames :bytes, bytearray, memoryview or mmap
+        :param offset: offset of first frame :int
+        :return: list of messages and offset of partial trailing frame (or end of buffer) :tuple
+        """
+        messages = []
+        append = messages.append
+        frames = cls.iter_decode(buffer, offset)
+        while True:
+            try:
+                append(next(frames))
+            except StopIteration as stop:
+                return messages, stop.value
+
+    @classmethod
+    def frame_size(cls, view, offset=0):
+        """
+        Size of frame which starts at `offset` of buffer (header included)
+        :param view: buffer :memoryview
+        :param offset: offset of frame :int
+        :return: size in bytes or None if prefix of frame is not received yet :int
+        """
+        head_size = cls.PREFIX_SIZE + 1
+        if len(view) - offset < head_size:
+            return None
+        return head_size + cls.body_size(view[offset + 1:offset + head_size])
+
+    @classmethod
+    def decode_from(cls, view, offset, end):
+        """
+        Decodes complete frame from buffer (see `frame_size`)
+        :param view: buffer :memoryview
+        :param offset: offset of frame :int
+        :param end: end of frame :int
+        :return: message :SourceMessage
+        """
+        head_end = offset + cls.PREFIX_SIZE + 1
+        # frame is contiguous, so check sum is calculated in one pass
+        return cls._decode_frame(view[offset], view[offset + 1:head_end], view[head_end:end],
+                                 (view[offset:end - cls.CHECK_SUM_SIZE], ))
+
+    @classmethod
+    def body_size(cls, prefix):
+        """
+        Size of message body (data chunks and check sum) following the prefix
+        :param prefix: message prefix (without header) :bytes
+        :return: size in bytes :int
+        """
+        return prefix[cls.PREFIX_SIZE - 1] * cls.CHUNK_SIZE + cls.CHECK_SUM_SIZE
+
+    @classmethod
+    def _decode_frame(cls, header, prefix, body, parts=None):
+        """
+        Decodes message from parts of frame without copying it
+        :param header: message header :int
+        :param prefix: num, source_id, status and numfields :memoryview
+        :param body: data and check sum :memoryview
+        :param parts: raw message without check sum if it differs from header, prefix and data :tuple
+        :return: message :SourceMessage
+        """
+        num, source_id, status, num_fields = cls.get_codec().unpack_prefix(prefix)
+        data_size = len(body) - cls.CHECK_SUM_SIZE
+        if parts is None:
+            parts = (SINGLE_BYTES[header], prefix, body[:data_size])
+        message = cls(num, source_id, status, header)
+        if not message.verify_check_sum(parts, body[data_size:]):
+            raise InvalidMessageException('Invalid message {} from source {}'.format(num, source_id))
+        if num_fields > 0:
+            try:
+                message.data = cls._decode_data(body[:data_size], num_fields)
+            except DecodeMessageError as e:
+                raise InvalidMessageException('Invalid message {} body from source {}'.format(num, source_id)) from e
+        message.received = monotonic_ns()
         return message
 
     @classmethod
@@ -227,17 +372,7 @@ class SourceMessage(AbstractMessage):
         :param num_fields num fields :int
         :return: dict :dict
         """
-
-        chunk_size = 12
-        if len(bytes_data) != num_fields * chunk_size:
-            raise DecodeMessageError('invalid message data')
-        result = {}
-        chunks = [bytes_data[i*chunk_size:(i+1)*chunk_size] for i in range(num_fields)]
-        for chunk in chunks:
-            field = chunk[:8]
-            value = chunk[8:]
-            result[field.decode().replace('\0', '')] = int.from_bytes(value, cls.BYTE_ORDER)
-        return result
+        return cls.get_codec().unpack_data(bytes_data, num_fields)
 
     def _encode_data(self):
         """
@@ -245,15 +380,7 @@ class SourceMessage(AbstractMessage):
         Data fields will be ordered by name.
         :return:
         """
-        data = []
-        keys = sorted(self.data.keys())  # define order of chunks of data by field name
-        for key in keys:
-            try:
-                data += trim_bytes(key.encode(), 8)
-                data += self.data[key].to_bytes(4, self.BYTE_ORDER)
-            except OverflowError:
-                raise EncodeMessageError('value of "{}" key is too long'.format(key))
-        return data
+        return self.get_codec().pack_data(self.data)
 
     def __str__(self):
         result = '[{}] '.format(self.source_id)
@@ -262,6 +389,24 @@ class SourceMessage(AbstractMessage):
         return result+'\n'
 
 
+class CRC32SourceMessage(SourceMessage):
+    """
+    Source message with CRC32 check sum (4 bytes) instead of one byte XOR.
+    It has own header, so server could accept both integrity modes on the same port
+    and source chooses mode by class of sent messages.
+    """
+
+    DEFAULT_HEADER = 0x02
+
+    HEADERS = (DEFAULT_HEADER, )
+
+    CHECK_SUM_SIZE = 4
+
+    __slots__ = ()
+
+    check_sum_part = staticmethod(crc32_checksum)
+
+
 class ServerMessage(AbstractMessage):
     """
     Server message class implements interface of AbstractMessage.
@@ -272,12 +417,16 @@ class ServerMessage(AbstractMessage):
     # message headers
     HEADER_SUCCESS = 0x11
     HEADER_ERROR = 0x12
+    HEADER_ACK_MODE = 0x13  # confirmation of `AckModeMessage`, number is accepted mode
 
     DEFAULT_HEADER = HEADER_SUCCESS
 
-    HEADERS = (HEADER_SUCCESS, HEADER_ERROR)
+    HEADERS = (HEADER_SUCCESS, HEADER_ERROR, HEADER_ACK_MODE)
+
+    __slots__ = ('header', 'num')
 
     def __init__(self, num, header=None):
+        super().__init__()
         if not header:
             header = self.DEFAULT_HEADER
         if header not in self.HEADERS:
@@ -289,13 +438,11 @@ class ServerMessage(AbstractMessage):
         self.num = num
 
     def get_raw(self):
-        message_data = []
-        message_data.append(self.header)  # header
+        # frame is too short for struct layout to pay off, plain int conversion is faster
         try:
-            message_data += self.num.to_bytes(2, self.BYTE_ORDER)  # num
+            return SINGLE_BYTES[self.header] + self.num.to_bytes(2, self.BYTE_ORDER)
         except OverflowError:
             raise EncodeMessageError('"num" value too long')
-        return bytes(message_data)
 
     @classmethod
     def decode(cls, bytes_data):
@@ -304,19 +451,11 @@ class ServerMessage(AbstractMessage):
         :param bytes_data :bytes
         :return: message: Message
         """
-        header = int.from_bytes((bytes_data[0],), cls.BYTE_ORDER)
-        check_sum = int.from_bytes((bytes_data[-1],), cls.BYTE_ORDER)
-        data_body = bytes_data[1:-1]
-        num = int.from_bytes(data_body[0:2], cls.BYTE_ORDER)
-
-        message = ServerMessage(num, header)
-        if message.check_sum() != check_sum:
-            raise InvalidMessageException('Invalid message {} from source {}'.format(num))
-        return message
+        bytes_data = bytes(bytes_data)
+        return cls._decode_frame(bytes_data[0], bytes_data[1:])
 
     @classmethod
-    @gen.coroutine
-    def decode_stream(cls, stream, header):
+    async def decode_stream(cls, stream, header):
         """
         Decode message from tornado.iostream.IOStream
         Header of message must be specified
@@ -324,27 +463,148 @@ class ServerMessage(AbstractMessage):
         :param header: message header :int
         :return:
         """
-        bytes_data = b''
-        bytes_data += header.to_bytes(1, cls.BYTE_ORDER)  # header
-        bytes_data += yield stream.read_bytes(2)  # num
-        bytes_data += yield stream.read_bytes(1)  # checksum
-        message = cls.decode(bytes_data)
+        body = await stream.read_bytes(2 + cls.CHECK_SUM_SIZE)  # num, check_sum
+        message = cls._decode_frame(header, body)
+        return message
+
+    @classmethod
+    def _decode_frame(cls, header, body):
+        """
+        Decodes message from header and body of frame
+        :param header: message header :int
+        :param body: num and check sum :bytes
+        :return: message :ServerMessage
+        """
+        num_bytes = body[:2]
+        num = int.from_bytes(num_bytes, cls.BYTE_ORDER)
+        message = cls(num, header)
+        # raw message is one short part, so check sum is calculated at once
+        if message.check_sum_method(SINGLE_BYTES[header] + num_bytes) != int.from_bytes(body[2:], cls.BYTE_ORDER):
+            raise InvalidMessageException('Invalid message {}'.format(num))
+        message.received = monotonic_ns()
         return message
 
     def __str__(self):
         if self.header == self.HEADER_SUCCESS:
             return 'ok {}'.format(self.num)
+        elif self.header == self.HEADER_ACK_MODE:
+            return 'ack mode {}'.format(self.num)
         else:
             return 'err'
 
-def trim_bytes(bytes_data, num):
+
+class AckModeMessage(AbstractMessage):
+    """
+    Control message of source: mode of acknowledgements of following messages of connection.
+    In `MODE_EACH` (default) server responds to each message.
+    In `MODE_CUMULATIVE` server acknowledges last accepted message once per IOLoop iteration
+    or per `batch` messages, acknowledgement of message acknowledges all previous messages of connection.
+    Errors are reported for each message in both modes.
+    Server confirms mode by `ServerMessage` with `HEADER_ACK_MODE` and number equal to mode.
+    """
+
+    DEFAULT_HEADER = 0x03
+
+    HEADERS = (DEFAULT_HEADER, )
+
+    MODE_EACH = 0x00
+    MODE_CUMULATIVE = 0x01
+
+    MODES = (MODE_EACH, MODE_CUMULATIVE)
+
+    CODEC_CLASS = AckModeMessageCodec
+
+    __slots__ = ('header', 'mode', 'batch')
+
+    # size of body after header: mode(1), batch(2)
+    BODY_SIZE = 3
+
+    def __init__(self, mode, batch=0, header=None):
+        """
+        :param mode: mode of acknowledgements :int
+        :param batch: max count of messages per acknowledgement in `MODE_CUMULATIVE` :int
+        :param header: message header :int
+        """
+        super().__init__()
+        if not header:
+            header = self.DEFAULT_HEADER
+        if header not in self.HEADERS:
+            raise InvalidMessageException('invalid acknowledgement mode message header {}'.format(header))
+        if mode not in self.MODES:
+            raise InvalidMessageException('unknown acknowledgement mode {}'.format(mode))
+        if mode == self.MODE_CUMULATIVE and batch < 1:
+            raise InvalidMessageException('batch of cumulative acknowledgements must be positive')
+        self.header = header
+        self.mode = mode
+        self.batch = batch
+
+    def get_raw(self):
+        return self.get_codec().pack(self.header, self.mode, self.batch)
+
+    @classmethod
+    def decode(cls, bytes_data):
+        """
+        Decode bytes and return `AckModeMessage` instance
+        :param bytes_data :bytes
+        :return: message: AckModeMessage
+        """
+        bytes_data = bytes(bytes_data)
+        return cls._decode_frame(bytes_data[0], bytes_data[1:])
+
+    @classmethod
+    async def decode_stream(cls, stream, header):
+        """
+        Decode message from tornado.iostream.IOStream
+        :param stream: data :tornado.iostream.IOStream
+        :param header: message header :int
+        :return: message: AckModeMessage
+        """
+        body = await stream.read_bytes(cls.BODY_SIZE + cls.CHECK_SUM_SIZE)
+        return cls._decode_frame(header, body)
+
+    @classmethod
+    def frame_size(cls, view, offset=0):
+        """
+        Size of frame (see `SourceMessage.frame_size`), it is fixed
+        :return: size in bytes :int
+        """
+        return 1 + cls.BODY_SIZE + cls.CHECK_SUM_SIZE
+
+    @classmethod
+    def decode_from(cls, view, offset, end):
+        """
+        Decodes complete frame from buffer (see `SourceMessage.decode_from`)
+        :return: message :AckModeMessage
+        """
+        return cls._decode_frame(view[offset], bytes(view[offset + 1:end]))
+
+    @classmethod
+    def _decode_frame(cls, header, body):
+        """
+        Decodes message from header and body of frame
+        :param header: message header :int
+        :param body: mode, batch and check sum :bytes
+        :return: message :AckModeMessage
+        """
+        mode, batch = cls.get_codec().unpack(body)
+        message = cls(mode, batch, header)
+        if not message.verify_check_sum((SINGLE_BYTES[header] + body[:cls.BODY_SIZE], ), body[cls.BODY_SIZE:]):
+            raise InvalidMessageException('Invalid acknowledgement mode message')
+        message.received = monotonic_ns()
+        return message
+
+
+def header_table(message_classes, value=None):
     """
-    Helper method thar trim `bytes_data` to `num` bytes
-    :param bytes_data: bytes: bytes
-    :param num: count of bytes: int
-    :return: bytes: bytes
+    Builds table of message headers.
+    If header is listed in several messages classes, first class in `message_classes` is used.
+    :param message_classes: message classes :tuple
+    :param value: callback which returns value of table for message class, class itself by default
+    :return: dict, key - message header, value - message class or result of `value` :dict
     """
-    data = bytes_data[:num]
-    if len(data) < num:
-        data = bytes((num - len(data))) + data  # add empty bytes if need
-    return data
+    table = {}
+    for message_class in reversed(message_classes):
+        item = message_class if value is None else value(message_class)
+        for header in message_class.HEADERS:
+            table[header] = item
+    return table
@@ -0,0 +1,214 @@
+from array import array
+
+from base.clock import monotonic_ns
+
+
+class Histogram:
+    """
+    Histogram of latencies in HDR style: values are counted in log-linear buckets,
+    each power of two range is split into `1 << SUB_BUCKET_BITS` buckets,
+    so value is kept with relative error less than 1 / (1 << SUB_BUCKET_BITS) (about 3%)
+    in fixed array of counts for any value of 64 bits.
+    """
+
+    # bits of sub-bucket index
+    SUB_BUCKET_BITS = 5
+
+    SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+    # count of buckets for values of 64 bits
+    BUCKET_COUNT = (64 - SUB_BUCKET_BITS + 1) * SUB_BUCKET_COUNT
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * self.BUCKET_COUNT))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def bucket_index(cls, value):
+        """
+        :param value: not negative value :int
+        :return: index of bucket :int
+        """
+        sub_bucket_count = cls.SUB_BUCKET_COUNT
+        if value < 2 * sub_bucket_count:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return (shift + 1) * sub_bucket_count + (value >> shift) - sub_bucket_count
+
+    @classmethod
+    def bucket_range(cls, index):
+        """
+        :param index: index of bucket :int
+        :return: lowest and highest values of bucket :tuple
+        """
+        sub_bucket_count = cls.SUB_BUCKET_COUNT
+        if index < 2 * sub_bucket_count:
+            return index, index
+        shift = index // sub_bucket_count - 1
+        top = index % sub_bucket_count + sub_bucket_count
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, value):
+        """
+        Adds value to histogram, negative value is counted as 0
+        :param value: value :int
+        :return: None
+        """
+        if value < 0:
+            value = 0
+        self.counts[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, point):
+        """
+        Value below which `point` percent of values fall (highest value of bucket, but not more than max)
+        :param point: percentile (0-100) :float
+        :return: value or None if histogram is empty :int
+        """
+        if not self.count:
+            return None
+        target = max(self.count * point / 100, 1)
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            cumulative += count
+            if cumulative >= target:
+                return min(self.bucket_range(index)[1], self.max)
+        return self.max
+
+    def merge(self, other):
+        """
+        Adds values of other histogram
+        :param other: histogram :Histogram
+        :return: None
+        """
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def reset(self):
+        self.counts = array('Q', bytes(8 * self.BUCKET_COUNT))
+        self.count = self.total = 0
+        self.min = self.max = None
+
+    def summary(self, scale=1000):
+        """
+        :param scale: divider of values, e.g. 1000 for ns values in microseconds :int
+        :return: count, min, max, mean and percentiles of values :dict
+        """
+        def scaled(value):
+            return None if value is None else round(value / scale, 1)
+        return {
+            'count': self.count,
+            'min': scaled(self.min),
+            'max': scaled(self.max),
+            'mean': scaled(self.total / self.count if self.count else None),
+            'p50': scaled(self.percentile(50)),
+            'p90': scaled(self.percentile(90)),
+            'p99': scaled(self.percentile(99)),
+            'p999': scaled(self.percentile(99.9)),
+        }
+
+
+class Metrics:
+    """
+    Counters and latency histograms of server.
+    Counters are plain attributes incremented by server code, so hot path pays only attribute increments.
+    Latency is measured only for messages which number has zero bits of `SAMPLE_MASK`
+    (every 16th message), histograms are kept by name (e.g. name of handler) in nanoseconds.
+    `snapshot` returns all values with rates of counters since previous snapshot.
+    """
+
+    # mask of sequence numbers of messages which latency is measured (power of two minus one)
+    SAMPLE_MASK = 0xf
+
+    # names of counters and gauges (attributes)
+    COUNTERS = ('messages', 'bytes_in', 'decode_errors', 'rejected', 'broadcasts', 'listener_messages',
+                'listener_bytes', 'listener_dropped', 'connections', 'source_connections', 'idle_timeouts',
+                'evicted_sources', 'rejected_connections', 'rate_limited', 'rate_paused')
+
+    def __init__(self):
+        self.started = monotonic_ns()
+        self.messages = 0  # received frames (by header)
+        self.bytes_in = 0  # bytes of received source messages
+        self.decode_errors = 0  # invalid frames
+        self.rejected = 0  # messages not accepted by sources
+        self.broadcasts = 0  # messages sent to listeners
+        # sends to listeners counted by `BaseListener.send` (data put to queues and dropped sends)
+        self.listener_messages = 0
+        self.listener_bytes = 0
+        self.listener_dropped = 0
+        self.connections = 0  # open connections (gauge)
+        self.source_connections = 0  # open connections of sources (gauge)
+        self.idle_timeouts = 0  # connections closed by idle timeout
+        self.evicted_sources = 0  # disconnected sources removed after retention time
+        self.rejected_connections = 0  # connections rejected by limits of ports
+        self.rate_limited = 0  # messages rejected by rate limits of sources and connections
+        self.rate_paused = 0  # pauses of reading of connections by rate limits
+        self.histograms = {}
+        self._last_snapshot = None  # (time, counters) of previous snapshot
+
+    def histogram(self, name):
+        """
+        :param name: name of histogram :str
+        :return: histogram, it is created on first call :Histogram
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def record(self, name, value):
+        """
+        Adds value to histogram
+        :param name: name of histogram :str
+        :param value: latency (ns) :int
+        :return: None
+        """
+        self.histogram(name).record(value)
+
+    def counters(self):
+        return {name: getattr(self, name) for name in self.COUNTERS}
+
+    def snapshot(self, gauges=None, additions=None):
+        """
+        Values of metrics, latencies are in microseconds.
+        Rates are counted since previous snapshot (since start for the first one)
+        :param gauges: additional values of server :dict
+        :param additions: values added to counters (e.g. counts of connected listeners) :dict
+        :return: dict with `uptime`, `counters`, `rates`, `latency_us` and `gauges` :dict
+        """
+        now = monotonic_ns()
+        counters = self.counters()
+        for name, value in (additions or {}).items():
+            counters[name] += value
+        last_time, last_counters = self._last_snapshot or (self.started, {})
+        elapsed = (now - last_time) / 1e9
+        rates = {}
+        for name in ('messages', 'bytes_in', 'decode_errors', 'broadcasts', 'listener_messages', 'listener_bytes'):
+            rates[name + '_per_sec'] = round((counters[name] - last_counters.get(name, 0)) / elapsed, 1) \
+                if elapsed else None
+        self._last_snapshot = now, counters
+        return {
+            'uptime': round((now - self.started) / 1e9, 3),
+            'counters': counters,
+            'rates': rates,
+            'latency_us': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            'gauges': gauges or {},
+        }
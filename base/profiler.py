@@ -0,0 +1,184 @@
+import os
+import signal
+from collections import Counter
+
+from tornado.ioloop import IOLoop
+
+from base.clock import monotonic_ns
+
+
+# directory containing packages of application
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LoopLagMonitor:
+    """
+    Monitor of lag of event loop: callback is scheduled every `interval` seconds,
+    delay between its planned and actual time of call is recorded to histogram (ns).
+    Lag shows time of callbacks and handlers which block loop (e.g. long decoding or broadcast).
+    """
+
+    def __init__(self, histogram, interval=0.1):
+        """
+        :param histogram: histogram of lags :base.metrics.Histogram
+        :param interval: interval of checks (seconds) :float
+        """
+        self.histogram = histogram
+        self.interval = interval
+        self._planned = None  # monotonic time of next call (ns)
+        self._timeout = None
+        self._io_loop = None
+
+    @property
+    def running(self):
+        return self._timeout is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._io_loop = IOLoop.current()
+        self._schedule()
+
+    def stop(self):
+        if self.running:
+            self._io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+    def _schedule(self):
+        self._planned = monotonic_ns() + int(self.interval * 1e9)
+        self._timeout = self._io_loop.call_later(self.interval, self._check)
+
+    def _check(self):
+        self.histogram.record(monotonic_ns() - self._planned)
+        self._schedule()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler based on SIGPROF timer: every `interval` seconds of CPU time of process
+    stack of running code is sampled. Stack is reduced to frames of application packages (`PACKAGES`)
+    and the innermost frame (e.g. function of library or IOLoop), samples are counted by stacks.
+    Profiler works in main thread only and costs nothing when it is stopped: timer and signal handler
+    are installed by `start` and removed by `stop`.
+    `report` returns the most frequent stacks and functions, `collapsed` returns stacks in format
+    of flame graph tools (`frame;frame;frame count` lines).
+    """
+
+    # packages which frames are kept in stacks
+    PACKAGES = ('base', 'app')
+
+    # interval of sampling (seconds of CPU time)
+    INTERVAL = 0.005
+
+    def __init__(self, interval=None, packages=None):
+        """
+        :param interval: interval of sampling (seconds of CPU time) :float
+        :param packages: names of packages in directory `ROOT` :tuple
+        """
+        self.interval = interval or self.INTERVAL
+        self.paths = tuple(os.path.join(ROOT, package) + os.sep for package in packages or self.PACKAGES)
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.duration = 0  # duration of profiling (ns), excluding current run
+        self._labels = {}  # key - code object, value - (label, is frame of application)
+        self._previous_handler = None
+
+    @property
+    def running(self):
+        return self.started is not None
+
+    def start(self):
+        """
+        Starts sampling, collected samples are kept (use `reset` to clear them)
+        :return: None
+        """
+        if self.running:
+            return
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.started = monotonic_ns()
+
+    def stop(self):
+        if not self.running:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        self.duration += monotonic_ns() - self.started
+        self.started = None
+
+    def reset(self):
+        self.stacks.clear()
+        self.samples = 0
+        self.duration = 0
+        if self.running:
+            self.started = monotonic_ns()
+
+    def label(self, code):
+        """
+        :param code: code object of frame
+        :return: label of frame (`<path>:<function>`, path is relative to `ROOT` for application frames)
+          and flag of application frame :tuple
+        """
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            application = filename.startswith(self.paths)
+            path = os.path.relpath(filename, ROOT) if application else os.path.basename(filename)
+            label = self._labels[code] = '{}:{}'.format(path, code.co_name), application
+        return label
+
+    def _sample(self, signum, frame):
+        """
+        Handler of SIGPROF: counts stack of interrupted frame
+        """
+        if frame is None:
+            return
+        label = self.label
+        stack = [label(frame.f_code)[0]]
+        frame = frame.f_back
+        while frame is not None:
+            name, application = label(frame.f_code)
+            if application:
+                stack.append(name)
+            frame = frame.f_back
+        stack.reverse()
+        self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        """
+        :return: lines `frame;frame;frame count` of stacks, outer frames first :list
+        """
+        return ['{} {}'.format(';'.join(stack), count) for stack, count in self.stacks.most_common()]
+
+    def report(self, limit=20):
+        """
+        :param limit: count of reported stacks and functions :int
+        :return: dict with count of samples, duration, the most frequent stacks and functions
+          (`self` - samples of innermost frame, `total` - samples of stacks containing function) :dict
+        """
+        duration = self.duration
+        if self.running:
+            duration += monotonic_ns() - self.started
+        samples = self.samples
+
+        def percent(count):
+            return round(count * 100 / samples, 1) if samples else 0
+
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        return {
+            'running': self.running,
+            'samples': samples,
+            'duration': round(duration / 1e9, 3),
+            'interval': self.interval,
+            'stacks': [{'stack': ';'.join(stack), 'samples': count, 'percent': percent(count)}
+                       for stack, count in self.stacks.most_common(limit)],
+            'functions': [{'function': name, 'self': count, 'total': total[name], 'percent': percent(count)}
+                          for name, count in own.most_common(limit)],
+        }
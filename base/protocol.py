@@ -0,0 +1,98 @@
+import asyncio
+
+from base.exceptions import InvalidMessageException
+from base.message import header_table
+
+
+class MessageProtocol(asyncio.Protocol):
+    """
+    asyncio protocol for incoming messages without tornado.iostream.IOStream.
+    Received bytes are cut into frames by `frame_size` and decoded by `decode_from` of message classes,
+    so framing rules are the same as in `decode_stream`.
+    Bytes with unknown header are skipped one by one (as `BaseServer.handler_default` does).
+
+    Decoded message is passed to `message_handler(message, transport)`,
+    message with invalid body or check sum - to `error_handler(exception, transport)`.
+    With `with_frames` raw frame of message is passed too: `message_handler(message, transport, frame)`,
+    flag could be switched while connection is open.
+    Opening and loss of connection are passed to `connection_handler(transport, connected)`.
+    """
+
+    def __init__(self, message_classes, message_handler, error_handler=None, with_frames=False,
+                 connection_handler=None):
+        """
+        :param message_classes: allowed message classes (with `frame_size` and `decode_from`) :tuple
+        :param message_handler: callback of decoded messages
+        :param error_handler: callback of invalid messages
+        :param with_frames: pass raw frames to `message_handler` :bool
+        :param connection_handler: callback of opening and loss of connection
+        """
+        self.message_classes = header_table(message_classes)
+        self.message_handler = message_handler
+        self.error_handler = error_handler
+        self.with_frames = with_frames
+        self.connection_handler = connection_handler
+        self.transport = None
+        self.buffer = bytearray()  # partial frame left by previous calls of `data_received`
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.connection_handler is not None:
+            self.connection_handler(transport, True)
+
+    def connection_lost(self, exc):
+        transport = self.transport
+        self.transport = None
+        self.buffer.clear()
+        if self.connection_handler is not None:
+            self.connection_handler(transport, False)
+
+    def data_received(self, data):
+        buffer = self.buffer
+        if not buffer:
+            # data is decoded in place if there is no partial frame from previous call
+            offset = self.decode(data)
+            if offset < len(data):
+                buffer.extend(memoryview(data)[offset:])
+            return
+        # chunks of partial frame are appended to buffer in place, so large frame received in many chunks
+        # is not copied again on each chunk
+        buffer.extend(data)
+        offset = self.decode(buffer)
+        if offset:
+            del buffer[:offset]
+
+    def decode(self, buffer):
+        """
+        Decodes all complete frames of buffer
+        :param buffer: received data :bytes
+        :return: offset of first not decoded byte :int
+        """
+        view = memoryview(buffer)
+        size = len(view)
+        offset = 0
+        message_classes = self.message_classes
+        try:
+            while offset < size and self.transport is not None:
+                message_class = message_classes.get(view[offset])
+                if message_class is None:
+                    offset += 1
+                    continue
+                frame_size = message_class.frame_size(view, offset)
+                if frame_size is None or offset + frame_size > size:
+                    break
+                end = offset + frame_size
+                try:
+                    message = message_class.decode_from(view, offset, end)
+                except InvalidMessageException as e:
+                    if self.error_handler:
+                        self.error_handler(e, self.transport)
+                else:
+                    if self.with_frames:
+                        self.message_handler(message, self.transport, bytes(view[offset:end]))
+                    else:
+                        self.message_handler(message, self.transport)
+                offset = end
+        finally:
+            view.release()
+        return offset
@@ -0,0 +1,115 @@
+from array import array
+
+
+class TokenBuckets:
+    """
+    Token buckets of many keys (e.g. sources or connections) in compact storage:
+    state of bucket is two doubles (tokens and time of last update) in arrays, dict maps key to index of bucket,
+    so 100k buckets take about 1.6 MB of arrays besides dict. Indexes of removed buckets are reused.
+    Rate and burst are passed on each call, so keys with different limits share storage.
+    New bucket is full (`burst` tokens).
+    """
+
+    def __init__(self):
+        self.index = {}  # key - key of bucket, value - index in arrays
+        self.tokens = array('d')
+        self.updated = array('d')  # time of last update (seconds)
+        self._free = []  # indexes of removed buckets
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def take(self, key, rate, burst, now, debt=False):
+        """
+        Takes token from bucket of key
+        :param key: hashable key
+        :param rate: tokens added per second :float
+        :param burst: capacity of bucket :float
+        :param now: current time (seconds) :float
+        :param debt: token is taken from empty bucket too (count of tokens becomes negative) :bool
+        :return: 0 if bucket had token, else time until bucket has token (without debt) or until debt is paid
+          (seconds) :float
+        """
+        index = self.index.get(key)
+        if index is None:
+            index = self._free.pop() if self._free else len(self.tokens)
+            if index == len(self.tokens):
+                self.tokens.append(burst)
+                self.updated.append(now)
+            else:
+                self.tokens[index] = burst
+                self.updated[index] = now
+            self.index[key] = index
+        tokens = min(self.tokens[index] + (now - self.updated[index]) * rate, burst)
+        self.updated[index] = now
+        if tokens >= 1:
+            self.tokens[index] = tokens - 1
+            return 0
+        # with debt token is taken anyway, debt is paid at the same time as missing token is added
+        self.tokens[index] = tokens - 1 if debt else tokens
+        return (1 - tokens) / rate
+
+    def give(self, key, count=1):
+        """
+        Returns tokens to bucket (e.g. if action is cancelled by other limit)
+        :param key: key of bucket
+        :param count: count of tokens :float
+        :return: None
+        """
+        index = self.index.get(key)
+        if index is not None:
+            self.tokens[index] += count
+
+    def remove(self, key):
+        """
+        Removes bucket of key
+        :param key: key of bucket
+        :return: None
+        """
+        index = self.index.pop(key, None)
+        if index is not None:
+            self._free.append(index)
+
+
+def parse_rate_limit(text):
+    """
+    Parses limit in format `<rate>[:<burst>]`, burst is equal to rate by default (at least 1)
+    Raises `ValueError` for invalid limit
+    :param text: limit :str
+    :return: rate (per second) and burst :tuple
+    """
+    rate, _, burst = text.partition(':')
+    rate = float(rate)
+    burst = float(burst) if burst else max(rate, 1)
+    if rate <= 0 or burst < 1:
+        raise ValueError('invalid rate limit "{}"'.format(text))
+    return rate, burst
+
+
+def parse_rate_limits(text, statuses):
+    """
+    Parses limits of statuses in format `<status>=<rate>[:<burst>],...`, where status is name or integer value
+    of status or `default` for statuses without own limit.
+    Raises `ValueError` for invalid limits
+    :param text: limits, e.g. `default=100:200,RECHARGE=10` :str
+    :param statuses: names of statuses, key - status value, value - name :dict
+    :return: dict, key - status (None for `default`), value - (rate, burst) :dict
+    """
+    names = {name.upper(): value for value, name in statuses.items()}
+    limits = {}
+    for item in text.split(','):
+        status, separator, limit = item.strip().partition('=')
+        if not separator:
+            raise ValueError('invalid rate limit "{}"'.format(item))
+        status = status.strip()
+        if status.lower() == 'default':
+            key = None
+        elif status.upper() in names:
+            key = names[status.upper()]
+        else:
+            key = int(status, 0)
+        limits[key] = parse_rate_limit(limit)
+    return limits
@@ -1,8 +1,14 @@
+import socket
+import struct
+
 from tornado.tcpserver import TCPServer
-from tornado import gen
 from tornado.iostream import StreamClosedError
 
+from .admission import AdmissionControl
+from .clock import monotonic_ns
 from .exceptions import ServerException
+from .message import header_table
+from .metrics import Metrics
 
 class BaseServer(TCPServer):
     """
@@ -12,6 +18,8 @@ class BaseServer(TCPServer):
 
     For allowed message will be invoked 'handler_<MessageClassName>(stream, address, header)`
     of server class, so you must define all handlers for all allowed messages.
+    Handlers are resolved once on server creation into table of 256 headers,
+    missing handler raises `ServerException` on server creation.
     Signature of handler includes `stream` and `address` from `handle_stream` method of tornado TCPServer,
     and also `header` of incoming message.
     NOTE that header of message has already read, and stream contains message without it.
@@ -19,6 +27,18 @@ class BaseServer(TCPServer):
     To change handler prefix use `HANDLER_PREFIX` field of class.
 
     You could catch unhandled data by `default_handler`
+
+    Server methods are native coroutines. Handlers and `stream_closed_handler` of child classes
+    could be native coroutines, `tornado.gen.coroutine` functions or plain methods.
+
+    Count of received messages and open connections are kept in `metrics` (see base.metrics),
+    time of handling of sampled messages is recorded to histogram named by handler.
+
+    Accepted connections are checked by budget of port (see base.admission) before creation of IOStream:
+    `MAX_CONNECTIONS` open connections, `MAX_CONNECTIONS_PER_ADDRESS` connections of one remote address
+    and `MAX_ACCEPT_RATE` accepted connections per second (None - unlimited).
+    Over-limit connection is reset at once (without TIME_WAIT), count of rejected connections is kept in `metrics`.
+    Override `create_admission` for separate budgets of ports.
     """
 
     # tuple of messages classes
@@ -30,8 +50,121 @@ class BaseServer(TCPServer):
     # prefix for handler methods
     HANDLER_PREFIX = 'handler_'
 
-    @gen.coroutine
-    def catch_message(self, header, stream, address):
+    # max count of open connections of port (None - unlimited)
+    MAX_CONNECTIONS = None
+
+    # max count of open connections of one remote address to port (None - unlimited)
+    MAX_CONNECTIONS_PER_ADDRESS = None
+
+    # max count of accepted connections of port per second (None - unlimited)
+    MAX_ACCEPT_RATE = None
+
+    # linger option of rejected connections: reset instead of closing handshake
+    RESET_LINGER = struct.pack('ii', 1, 0)
+
+    # count of unanswered TCP keepalive probes before connection is dropped (see `set_keepalive`)
+    KEEPALIVE_PROBES = 3
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._handlers = self._build_handlers()
+        self.metrics = Metrics()
+        self.admissions = {}  # key - local port, value - AdmissionControl or None
+        # entries of connections admitted in `_handle_connection`, key - descriptor, value - (AdmissionControl, remote address)
+        self._admitted = {}
+        self._admission_enabled = self.admission_enabled()
+
+    def admission_enabled(self):
+        """
+        :return: True if any limit of connections is set :bool
+        """
+        return any(limit is not None for limit in (self.MAX_CONNECTIONS, self.MAX_CONNECTIONS_PER_ADDRESS,
+                                                   self.MAX_ACCEPT_RATE))
+
+    def create_admission(self, port):
+        """
+        Creates budget of connections of port, it is called on first connection of port
+        :param port: local port :int
+        :return: budget or None if connections of port are not limited :base.admission.AdmissionControl
+        """
+        admission = AdmissionControl(self.MAX_CONNECTIONS, self.MAX_CONNECTIONS_PER_ADDRESS, self.MAX_ACCEPT_RATE)
+        return admission if admission.enabled else None
+
+    def admit(self, port, host):
+        """
+        Checks budget of port for new connection
+        :param port: local port :int
+        :param host: remote address :str
+        :return: budget of port (None - not limited) and True if connection is admitted :tuple
+        """
+        try:
+            admission = self.admissions[port]
+        except KeyError:
+            admission = self.admissions[port] = self.create_admission(port)
+        if admission is None:
+            return None, True
+        if admission.admit(host):
+            return admission, True
+        self.metrics.rejected_connections += 1
+        return admission, False
+
+    def set_keepalive(self, stream, timeout):
+        """
+        Enables TCP keepalive probes of connection without traffic, so connection of peer which is lost
+        without closing (e.g. host is down) is dropped by system in about `timeout` seconds and stream is closed
+        :param stream: stream: tornado.iostream.IOStream
+        :param timeout: time of detection of lost peer (seconds) :float
+        :return: None
+        """
+        connection = stream.socket
+        try:
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, 'TCP_KEEPIDLE'):  # Linux options, other systems use default timings
+                idle = max(int(timeout / 2), 1)
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                                      max(int(idle / self.KEEPALIVE_PROBES), 1))
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, self.KEEPALIVE_PROBES)
+        except OSError:
+            pass
+
+    def _handle_connection(self, connection, address):
+        """
+        Checks budget of port before creation of IOStream.
+        NOTE: it overrides private method of tornado.tcpserver.TCPServer (tornado 4.5), public API has no hook
+        before creation of IOStream. Tornado creates IOStream and starts `handle_stream` in this call,
+        `handle_stream` takes entry of admitted connection at once. Entry left after the call means that
+        stream is not handled (e.g. TLS handshake or creation of IOStream failed), such connection is released here,
+        so entries are never left for reused descriptors.
+        """
+        if not self._admission_enabled:
+            super()._handle_connection(connection, address)
+            return
+        host = address[0] if isinstance(address, tuple) else address
+        try:
+            port = connection.getsockname()[1]
+        except (OSError, IndexError):
+            port = None
+        admission, admitted = self.admit(port, host)
+        if not admitted:
+            try:
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, self.RESET_LINGER)
+            except OSError:
+                pass
+            connection.close()
+            return
+        if admission is None:
+            super()._handle_connection(connection, address)
+            return
+        descriptor = connection.fileno()
+        self._admitted[descriptor] = admission, host
+        try:
+            super()._handle_connection(connection, address)
+        finally:
+            if self._admitted.pop(descriptor, None) is not None:
+                admission.release(host)
+
+    async def catch_message(self, header, stream, address):
         """
         This method "catches" incoming allowed message and invokes according handler of it.
         Uncaught messages could handled by `default_handler`.
@@ -40,32 +173,41 @@ class BaseServer(TCPServer):
         :param address: address
         :return: future: tornado.concurrent.Future
         """
-        if self.ALLOWED_MESSAGES:
-            for message_class in self.ALLOWED_MESSAGES:
-                if header in message_class.HEADERS:
-                    handler_func_name = self._get_message_handler(message_class)
-                    try:
-                        yield getattr(self, handler_func_name)(stream, address, header)
-                    except AttributeError:
-                        raise ServerException('No handler for message "{}"'.format(message_class.__name__))
-                    return
-        yield self.handler_default(stream, address, header)
+        handler = self._handlers[header]
+        metrics = self.metrics
+        metrics.messages += 1
+        if metrics.messages & metrics.SAMPLE_MASK:
+            result = handler(stream, address, header)
+            if result is not None:
+                await result
+            return
+        start = monotonic_ns()
+        result = handler(stream, address, header)
+        if result is not None:
+            await result
+        metrics.record(handler.__name__, monotonic_ns() - start)
 
-    @gen.coroutine
-    def handle_stream(self, stream, address):
+    async def handle_stream(self, stream, address):
         """
         Tornado TCPServer handler. It used for implement handling logic.
         :param stream: stream: tornado.iostream.IOStream
         :param address: address
         :return: future: tornado.concurrent.Future
         """
+        self.metrics.connections += 1
+        admitted = self._admitted.pop(stream.fileno().fileno(), None) if self._admitted else None
         try:
-            yield self.handle(stream, address)
+            await self.handle(stream, address)
         except StreamClosedError:
-            yield self.stream_closed_handler(stream, address)
+            result = self.stream_closed_handler(stream, address)
+            if result is not None:
+                await result
+        finally:
+            self.metrics.connections -= 1
+            if admitted is not None:
+                admitted[0].release(admitted[1])
 
-    @gen.coroutine
-    def handle(self, stream, address):
+    async def handle(self, stream, address):
         """
         Get header of incoming message and invoke `catch_message`.
         :param stream: stream: tornado.iostream.IOStream
@@ -73,12 +215,11 @@ class BaseServer(TCPServer):
         :return: future: tornado.concurrent.Future
         """
         while True:
-            byte_header = yield stream.read_bytes(1)
+            byte_header = await stream.read_bytes(1)
             header = int.from_bytes(byte_header, self.BYTE_ORDER)
-            yield self.catch_message(header, stream, address)
+            await self.catch_message(header, stream, address)
 
-    @gen.coroutine
-    def stream_closed_handler(self, stream, address):
+    async def stream_closed_handler(self, stream, address):
         """
         Handles lost connection.
         Override this method in child class.
@@ -88,8 +229,7 @@ class BaseServer(TCPServer):
         """
         pass
 
-    @gen.coroutine
-    def handler_default(self, stream, address, header):
+    async def handler_default(self, stream, address, header):
         """
         Default handler invokes if no handler were found or `ALLOWED_MESSAGES` is not specified.
         Override this method in child class.
@@ -101,4 +241,21 @@ class BaseServer(TCPServer):
         pass
 
     def _get_message_handler(self, message_class):
-        return self.HANDLER_PREFIX + str(message_class.__name__)
\ No newline at end of file
+        return self.HANDLER_PREFIX + str(message_class.__name__)
+
+    def _build_handlers(self):
+        """
+        Builds dispatch table: index - message header, value - bound handler.
+        If header is listed in several messages classes, first class in `ALLOWED_MESSAGES` is used.
+        :return: handlers :list
+        """
+        handlers = [self.handler_default] * 256
+        for header, handler in header_table(self.ALLOWED_MESSAGES or (), self._bound_message_handler).items():
+            handlers[header] = handler
+        return handlers
+
+    def _bound_message_handler(self, message_class):
+        handler = getattr(self, self._get_message_handler(message_class), None)
+        if handler is None:
+            raise ServerException('No handler for message "{}"'.format(message_class.__name__))
+        return handler
@@ -1,6 +1,7 @@
-from datetime import datetime
+from collections import deque
 
-from base.message import SourceMessage
+from base.clock import monotonic_ns
+from base.message import SourceMessage, CRC32SourceMessage
 from base.exceptions import *
 
 
@@ -34,7 +35,10 @@ class AbstractSource:
 class BaseSource(AbstractSource):
     """
     BaseSource implementing base source logic for application.
-    It includes list of sent/received messages (depending of using context), current status of source,
+    It includes history of sent/received messages (depending of using context), current status of source,
+    History is ring buffer of last `history_size` messages (`HISTORY_SIZE` by default),
+    with zero size only last message is kept.
+    Numbers of generated messages are taken from own sequence counter of source.
     """
 
     # source message class (must be child of SourceMessage)
@@ -49,9 +53,21 @@ class BaseSource(AbstractSource):
     # init value of status
     _status = None
 
-    def __init__(self, source_id, status=None):
+    # default max count of messages in history
+    HISTORY_SIZE = 100
+
+    # sequence of message numbers is wrapped by this value (`num` of SourceMessage is 2 bytes)
+    SEQUENCE_LIMIT = 0x10000
+
+    def __init__(self, source_id, status=None, history_size=None):
         self.source_id = source_id
-        self.messages = []  # list of messages
+        if history_size is None:
+            history_size = self.HISTORY_SIZE
+        self.messages = deque(maxlen=history_size)  # last messages
+        self.connection = None  # connection of server receiving messages of source
+        self.disconnected = None  # monotonic time (ns) of loss of connection, None - source is not stale
+        self._last_message = None
+        self._sequence = 0  # number of next generated message
         if not status:
             status = self.DEFAULT_STATUS
         self.status = status
@@ -62,8 +78,10 @@ class BaseSource(AbstractSource):
         :param data: message data: dict
         :return: message: SourceMessage
         """
-        message = self.MESSAGE_CLASS(len(self.messages), self.source_id, self.status, data=data)
+        message = self.MESSAGE_CLASS(self._sequence, self.source_id, self.status, data=data)
+        self._sequence = (self._sequence + 1) % self.SEQUENCE_LIMIT
         self.messages.append(message)
+        self._last_message = message
         return message
 
     def get_message(self, message):
@@ -74,6 +92,7 @@ class BaseSource(AbstractSource):
         """
         self.status = message.status
         self.messages.append(message)
+        self._last_message = message
 
     @property
     def status(self):
@@ -107,16 +126,21 @@ class BaseSource(AbstractSource):
             status_str = self._status
         return status_str
 
+    @property
+    def stale(self):
+        """
+        Connection of source is lost (on server)
+        :return: bool
+        """
+        return self.disconnected is not None
+
     @property
     def last_message(self):
         """
         Returns last source message
         :return: message
         """
-        try:
-            return self.messages[-1]
-        except IndexError:
-            return None
+        return self._last_message
 
 
 
@@ -143,10 +167,51 @@ class Source(BaseSource):
         STATUS_RECHARGE: 'RECHARGE'
     }
 
-    def __init__(self, source_id, status=None):
+    def __init__(self, source_id, status=None, history_size=None):
         if len(source_id) > self.SOURCE_NAME_LENGTH:
             raise SourceException('length of source_id more than {}'.format(self.SOURCE_NAME_LENGTH))
-        super().__init__(source_id, status)
+        self._snapshot_prefix = None
+        super().__init__(source_id, status, history_size)
+
+    def new_message(self, data=None):
+        message = super().new_message(data)
+        self._snapshot_prefix = None
+        return message
+
+    def get_message(self, message):
+        super().get_message(message)
+        self._snapshot_prefix = None
+
+    @BaseSource.status.setter
+    def status(self, value):
+        changed = value != self._status
+        BaseSource.status.fset(self, value)
+        if changed:
+            self._snapshot_prefix = None
+
+    def _render_snapshot_prefix(self):
+        """
+        Renders part of string representation which does not depend on current time
+        :return: prefix :str
+        """
+        last_message = self._last_message
+        num = last_message.num if last_message else '-'
+        prefix = self._snapshot_prefix = '[{}] {} | {} | '.format(self.source_id, num, self.status_str)
+        return prefix
+
+    def snapshot_line(self, now):
+        """
+        String representation of source (see `__str__`) at time `now`.
+        Only count of milliseconds from last message is rendered on every call, the rest is rendered
+        on first call after receiving of message or change of status and kept until the next change.
+        :param now: monotonic time (ns) :int
+        :return: str
+        """
+        prefix = self._snapshot_prefix or self._render_snapshot_prefix()
+        last_message = self._last_message
+        if last_message is None or last_message.received is None:
+            return prefix + '-'
+        return prefix + str((now - last_message.received) // 1000000)
 
     def __str__(self):
         """
@@ -156,9 +221,12 @@ class Source(BaseSource):
         `time` - count of milliseconds from last message
         :return:
         """
-        last_message = self.last_message
-        if last_message:
-            milliseconds = str(int((datetime.now() - last_message.date_received).total_seconds()*1000))
-        else:
-            milliseconds = '-'
-        return '[{}] {} | {} | {}'.format(self.source_id, last_message.num, self.status_str, milliseconds)
+        return self.snapshot_line(monotonic_ns())
+
+
+class CRC32Source(Source):
+    """
+    Source sending messages with CRC32 check sum (see `CRC32SourceMessage`)
+    """
+
+    MESSAGE_CLASS = CRC32SourceMessage
@@ -0,0 +1,226 @@
+from base.exceptions import SubscriptionException
+
+
+class Subscription:
+    """
+    Filter of messages for listener.
+    Message is accepted if its source is in `sources` or source id starts with one of `prefixes`,
+    its status is in `statuses` and its data has one of `fields`.
+    Empty filter accepts any value (subscription without filters accepts all messages).
+    """
+
+    def __init__(self, sources=None, prefixes=None, statuses=None, fields=None):
+        """
+        :param sources: ids of sources :iterable of str
+        :param prefixes: prefixes of source ids :iterable of str
+        :param statuses: statuses of sources :iterable of int
+        :param fields: data field names :iterable of str
+        """
+        self.sources = frozenset(sources or ())
+        self.prefixes = frozenset(prefixes or ())
+        self.statuses = frozenset(statuses or ())
+        self.fields = frozenset(fields or ())
+
+    @classmethod
+    def parse(cls, text, statuses):
+        """
+        Parses subscription from text in format `source=<id>,... prefix=<prefix>,... status=<status>,... field=<name>,...`
+        (each part is optional). Status could be name or integer value.
+        Raises `SubscriptionException` if text is invalid
+        :param text: subscription :str
+        :param statuses: allowed statuses, key - integer value, value - name :dict
+        :return: subscription :Subscription
+        """
+        names = {name.upper(): status for status, name in statuses.items()}
+        parts = {'source': [], 'prefix': [], 'status': [], 'field': []}
+        for part in text.split():
+            key, _, values = part.partition('=')
+            if key not in parts or not values:
+                raise SubscriptionException('invalid subscription part "{}"'.format(part))
+            parts[key].extend(value for value in values.split(',') if value)
+        status_values = []
+        for status in parts['status']:
+            if status.upper() in names:
+                status_values.append(names[status.upper()])
+            elif status.isdigit() and int(status) in statuses:
+                status_values.append(int(status))
+            else:
+                raise SubscriptionException('unknown status "{}"'.format(status))
+        return cls(parts['source'], parts['prefix'], status_values, parts['field'])
+
+    @property
+    def accepts_all(self):
+        """
+        Subscription without filters
+        :return: bool
+        """
+        return not (self.sources or self.prefixes or self.statuses or self.fields)
+
+    def accepts_source(self, source_id):
+        """
+        Check of source of message
+        :param source_id: source id :str
+        :return: bool
+        """
+        if not (self.sources or self.prefixes) or source_id in self.sources:
+            return True
+        return any(source_id.startswith(prefix) for prefix in self.prefixes)
+
+    def accepts_data(self, data):
+        """
+        Check of data fields of message
+        :param data: message data :dict
+        :return: bool
+        """
+        if not self.fields:
+            return True
+        return bool(data) and not self.fields.isdisjoint(data)
+
+
+class SubscriptionIndex:
+    """
+    Inverted index of subscriptions: source id, source id prefix and status map to keys of subscribers.
+    Subscribers matching source and status of message are found by index lookups and cached
+    by source and status, so work per message is proportional to count of matching subscribers.
+    Subscribers without filters (default subscription of listener) are kept apart from index and cache,
+    so their connects and disconnects do not touch cache. Change of other subscription removes only
+    cached results of sources and statuses accepted by it. Cache keeps results of at most
+    `MATCHES_CACHE_SIZE` sources.
+    """
+
+    # max count of sources in cache
+    MATCHES_CACHE_SIZE = 65536
+
+    def __init__(self):
+        self.subscriptions = {}  # key - subscriber key, value - Subscription
+        self.by_source = {}  # key - source id, value - set of subscriber keys
+        self.by_prefix = {}  # key - prefix, value - set of subscriber keys
+        self.any_source = set()  # subscribers without source filter (besides subscribers without filters)
+        self.by_status = {}  # key - status, value - set of subscriber keys
+        self.any_status = set()  # subscribers without status filter
+        self.with_fields = set()  # subscribers with filter of data fields
+        self.accept_all = ()  # subscribers without filters
+        self.prefix_sizes = ()  # sizes of prefixes in index (descending)
+        self._matches = {}  # cache, key - source_id, value - dict: key - status, value - tuple of subscriber keys
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def __contains__(self, key):
+        return key in self.subscriptions
+
+    def subscribe(self, key, subscription):
+        """
+        Adds or replaces subscription of subscriber
+        :param key: subscriber key (hashable)
+        :param subscription: subscription :Subscription
+        :return: None
+        """
+        self.unsubscribe(key)
+        self.subscriptions[key] = subscription
+        if subscription.accepts_all:
+            self.accept_all += (key, )
+            return
+        if subscription.sources or subscription.prefixes:
+            for source_id in subscription.sources:
+                self.by_source.setdefault(source_id, set()).add(key)
+            for prefix in subscription.prefixes:
+                self.by_prefix.setdefault(prefix, set()).add(key)
+        else:
+            self.any_source.add(key)
+        if subscription.statuses:
+            for status in subscription.statuses:
+                self.by_status.setdefault(status, set()).add(key)
+        else:
+            self.any_status.add(key)
+        if subscription.fields:
+            self.with_fields.add(key)
+        self._changed(subscription)
+
+    def unsubscribe(self, key):
+        """
+        Removes subscription of subscriber
+        :param key: subscriber key
+        :return: None
+        """
+        subscription = self.subscriptions.pop(key, None)
+        if subscription is None:
+            return
+        if subscription.accepts_all:
+            self.accept_all = tuple(other for other in self.accept_all if other != key)
+            return
+        for index, values in ((self.by_source, subscription.sources), (self.by_prefix, subscription.prefixes),
+                              (self.by_status, subscription.statuses)):
+            for value in values:
+                keys = index[value]
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+        self.any_source.discard(key)
+        self.any_status.discard(key)
+        self.with_fields.discard(key)
+        self._changed(subscription)
+
+    def match(self, message):
+        """
+        Keys of subscribers accepting message
+        :param message: message :SourceMessage
+        :return: list of subscriber keys :list
+        """
+        statuses = self._matches.get(message.source_id)
+        keys = statuses.get(message.status) if statuses is not None else None
+        if keys is None:
+            keys = self._match_source_status(message.source_id, message.status)
+        if not self.with_fields:
+            if not keys:
+                return self.accept_all
+            return keys + self.accept_all if self.accept_all else keys
+        with_fields = self.with_fields
+        subscriptions = self.subscriptions
+        data = message.data
+        result = [key for key in keys if key not in with_fields or subscriptions[key].accepts_data(data)]
+        result.extend(self.accept_all)
+        return result
+
+    def _match_source_status(self, source_id, status):
+        """
+        Finds subscribers with filters of source and status by index and caches result
+        :return: tuple of subscriber keys :tuple
+        """
+        keys = set(self.any_source)
+        keys.update(self.by_source.get(source_id, ()))
+        for size in self.prefix_sizes:
+            keys.update(self.by_prefix.get(source_id[:size], ()))
+        status_keys = self.by_status.get(status, ())
+        any_status = self.any_status
+        result = tuple(key for key in keys if key in any_status or key in status_keys)
+        matches = self._matches
+        statuses = matches.get(source_id)
+        if statuses is None:
+            if len(matches) >= self.MATCHES_CACHE_SIZE:
+                matches.clear()
+            statuses = matches[source_id] = {}
+        statuses[status] = result
+        return result
+
+    def _changed(self, subscription):
+        """
+        Removes cached results of sources and statuses accepted by added or removed subscription
+        :param subscription: subscription :Subscription
+        :return: None
+        """
+        if subscription.prefixes:
+            self.prefix_sizes = tuple(sorted({len(prefix) for prefix in self.by_prefix}, reverse=True))
+        matches = self._matches
+        if subscription.sources and not subscription.prefixes:
+            source_ids = [source_id for source_id in subscription.sources if source_id in matches]
+        else:
+            accepts_source = subscription.accepts_source
+            source_ids = [source_id for source_id in matches if accepts_source(source_id)]
+        for source_id in source_ids:
+            if subscription.statuses:
+                statuses = matches[source_id]
+                for status in subscription.statuses:
+                    statuses.pop(status, None)
+            else:
+                del matches[source_id]
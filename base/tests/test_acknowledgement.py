@@ -0,0 +1,45 @@
+import unittest
+
+from tornado import gen
+from tornado import testing
+
+from base.acknowledgement import CumulativeAcknowledgement
+from base.message import ServerMessage
+
+
+class MockConnection:
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(ServerMessage.decode(data).num)
+
+
+class CumulativeAcknowledgementTestCase(testing.AsyncTestCase):
+
+    @testing.gen_test
+    def test_batch_and_tick(self):
+        connection = MockConnection()
+        acknowledgement = CumulativeAcknowledgement(connection.write, 3)
+        for num in range(5):
+            acknowledgement.add(num)
+        self.assertEqual(connection.data, [2])
+        yield gen.moment
+        self.assertEqual(connection.data, [2, 4])
+        acknowledgement.flush()
+        self.assertEqual(connection.data, [2, 4])
+
+    @testing.gen_test
+    def test_gap(self):
+        connection = MockConnection()
+        acknowledgement = CumulativeAcknowledgement(connection.write, 10)
+        for num in (0xfffe, 0xffff, 0, 1, 5, 6, 8):
+            acknowledgement.add(num)
+        self.assertEqual(connection.data, [1, 6])
+        yield gen.moment
+        self.assertEqual(connection.data, [1, 6, 8])
+
+
+if __name__ == '__main__':
+    unittest.main()
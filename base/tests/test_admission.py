@@ -0,0 +1,102 @@
+import unittest
+
+from tornado import gen
+from tornado import testing
+from tornado.iostream import StreamClosedError
+from tornado.log import app_log
+from tornado.tcpclient import TCPClient
+from tornado.testing import ExpectLog
+
+from base.admission import AdmissionControl
+from base.server import BaseServer
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+
+    def test_unlimited(self):
+        admission = AdmissionControl()
+        self.assertFalse(admission.enabled)
+        self.assertTrue(all(admission.admit('a') for _ in range(100)))
+        self.assertEqual(admission.connections, 100)
+
+    def test_max_connections(self):
+        admission = AdmissionControl(max_connections=2)
+        self.assertTrue(admission.admit('a'))
+        self.assertTrue(admission.admit('b'))
+        self.assertFalse(admission.admit('c'))
+        admission.release('a')
+        self.assertTrue(admission.admit('c'))
+        self.assertEqual(admission.rejected[AdmissionControl.REJECT_CONNECTIONS], 1)
+        self.assertEqual(admission.stats()['addresses'], 2)
+
+    def test_max_per_address(self):
+        admission = AdmissionControl(max_per_address=2)
+        self.assertEqual([admission.admit('a') for _ in range(3)], [True, True, False])
+        self.assertTrue(admission.admit('b'))
+        admission.release('a')
+        admission.release('a')
+        self.assertNotIn('a', admission.addresses)
+        self.assertTrue(admission.admit('a'))
+        self.assertEqual(admission.rejected[AdmissionControl.REJECT_ADDRESS], 1)
+
+    def test_accept_rate(self):
+        admission = AdmissionControl(accept_rate=1, burst=3)
+        self.assertEqual([admission.admit('a') for _ in range(4)], [True, True, True, False])
+        # rate limits accepts, not open connections
+        admission.release('a')
+        self.assertFalse(admission.admit('a'))
+        self.assertEqual(admission.rejected[AdmissionControl.REJECT_RATE], 2)
+        self.assertEqual(admission.accepted, 3)
+
+
+class AdmissionServerTestCase(testing.AsyncTestCase):
+
+    @testing.gen_test
+    def test_max_connections_per_address(self):
+
+        class TestServer(BaseServer):
+            MAX_CONNECTIONS_PER_ADDRESS = 1
+
+        server = TestServer(io_loop=self.io_loop)
+        server.listen(8888)
+        client = TCPClient(io_loop=self.io_loop)
+        first = yield client.connect('127.0.0.1', 8888)
+        second = yield client.connect('127.0.0.1', 8888)
+        # rejected connection is closed by server
+        with self.assertRaises(StreamClosedError):
+            yield second.read_bytes(1)
+        self.assertEqual(server.metrics.rejected_connections, 1)
+        self.assertEqual(server.admissions[8888].connections, 1)
+        first.close()
+        yield gen.sleep(0.1)
+        self.assertEqual(server.admissions[8888].connections, 0)
+        third = yield client.connect('127.0.0.1', 8888)
+        yield gen.sleep(0.1)
+        self.assertFalse(third.closed())
+        self.assertEqual(server.admissions[8888].connections, 1)
+        third.close()
+        server.stop()
+        client.close()
+
+    @testing.gen_test
+    def test_connection_released_if_stream_fails(self):
+
+        class TestServer(BaseServer):
+            MAX_CONNECTIONS = 1
+
+        # IOStream can not be created with invalid buffer size
+        server = TestServer(io_loop=self.io_loop, max_buffer_size='invalid')
+        server.listen(8888)
+        client = TCPClient(io_loop=self.io_loop)
+        with ExpectLog(app_log, 'Error in connection callback'):
+            stream = yield client.connect('127.0.0.1', 8888)
+            yield gen.sleep(0.1)
+        self.assertEqual(server.admissions[8888].connections, 0)
+        self.assertEqual(server._admitted, {})
+        stream.close()
+        server.stop()
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
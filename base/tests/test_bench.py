@@ -0,0 +1,35 @@
+import unittest
+
+from tornado import testing
+
+from app.app_bench import ApplicationBenchmark
+from app.app_server import ApplicationServer
+
+
+class BenchServer(ApplicationServer):
+    SOURCE_PORT = 8895
+    LISTENER_PORT = 8896
+    LOOP_LAG_INTERVAL = None
+
+
+class ApplicationBenchmarkTestCase(testing.AsyncTestCase):
+
+    @testing.gen_test(timeout=30)
+    def test_many_sources(self):
+        server = BenchServer()
+        server.listen(BenchServer.SOURCE_PORT, '127.0.0.1')
+        server.listen(BenchServer.LISTENER_PORT, '127.0.0.1')
+        try:
+            benchmark = ApplicationBenchmark('127.0.0.1', BenchServer.SOURCE_PORT, BenchServer.LISTENER_PORT, sources=120, rate=20, duration=0.2)
+            report = yield benchmark.run()
+        finally:
+            server.stop()
+        self.assertEqual(benchmark.rejected, 0)
+        self.assertGreaterEqual(benchmark.acknowledged, 120)
+        self.assertEqual(len(server.sources), 120)
+        self.assertIn('b0000119', server.sources)
+        self.assertTrue(report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import tempfile
+import unittest
+
+from tornado import gen
+from tornado import testing
+from tornado.log import app_log
+from tornado.testing import ExpectLog
+
+from base.bus import MessageBus
+from base.clock import to_wall_ns
+from base.exceptions import SourceException
+from base.message import SourceMessage, CRC32SourceMessage
+
+
+class MessageBusTestCase(testing.AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.received = [[], [], []]
+        self.buses = []
+        for worker_id in range(3):
+            bus = MessageBus(os.path.join(self.directory.name, 'bus'), worker_id, 3,
+                             (SourceMessage, CRC32SourceMessage),
+                             lambda message, frame, worker_id=worker_id: self.received[worker_id].append(
+                                 (message, frame)))
+            bus.open()
+            self.buses.append(bus)
+
+    def tearDown(self):
+        for bus in self.buses:
+            bus.close()
+        self.directory.cleanup()
+        super().tearDown()
+
+    @gen.coroutine
+    def wait(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            yield gen.sleep(0.01)
+
+    @testing.gen_test
+    def test_publish(self):
+        self.buses[1].set_interest(True)
+        self.buses[2].set_interest(True)
+        yield self.wait(lambda: self.buses[0].interested == {1, 2})
+        self.assertEqual(self.buses[0].interested, {1, 2})
+        frames = [SourceMessage(1, 'a', 1, data={'x': 1}).encode(), CRC32SourceMessage(2, 'b', 2).encode()]
+        for frame in frames:
+            self.buses[0].publish(frame, 1000)
+        self.assertEqual(self.received, [[], [], []])
+        yield self.wait(lambda: all(self.received[1:]))
+        self.assertEqual(self.received[0], [])
+        for received in self.received[1:]:
+            self.assertEqual([frame for _, frame in received], frames)
+            self.assertEqual([message.source_id for message, _ in received], ['a', 'b'])
+            self.assertEqual(to_wall_ns(received[0][0].received) // 1000, 1)
+
+    @testing.gen_test
+    def test_not_interested(self):
+        self.buses[1].set_interest(True)
+        yield self.wait(lambda: 1 in self.buses[0].interested)
+        self.buses[1].set_interest(False)
+        yield self.wait(lambda: not self.buses[0].interested)
+        self.assertEqual(self.buses[0].interested, set())
+        self.buses[0].publish(SourceMessage(1, 'a', 1).encode(), 1000)
+        self.assertEqual(self.buses[0].batch, [])
+
+    @testing.gen_test
+    def test_snapshot(self):
+        frame = SourceMessage(1, 'a', 1).encode()
+        snapshots = []
+        self.buses[0].snapshot = lambda: [(frame, 1000)]
+        self.buses[1].snapshot_handler = lambda message, frame: snapshots.append(frame)
+        self.buses[1].set_interest(True)
+        yield self.wait(lambda: snapshots)
+        self.assertEqual(snapshots, [frame])
+        self.assertEqual(self.received[1], [])
+
+    @testing.gen_test
+    def test_peer_started_later(self):
+        self.buses[2].close()
+        self.buses[1].set_interest(True)
+        yield self.wait(lambda: 1 in self.buses[0].interested)
+        bus = MessageBus(os.path.join(self.directory.name, 'bus'), 2, 3, (SourceMessage, ), lambda *args: None)
+        bus.open()
+        self.buses.append(bus)
+        yield self.wait(lambda: 1 in bus.interested)
+        self.assertEqual(bus.interested, {1})
+
+    @testing.gen_test
+    def test_dropped_if_peer_stopped(self):
+        self.buses[1].set_interest(True)
+        yield self.wait(lambda: 1 in self.buses[0].interested)
+        self.buses[1].close()
+        self.buses[0].publish(SourceMessage(1, 'a', 1).encode(), 1000)
+        self.buses[0].flush()
+        yield self.wait(lambda: self.buses[0].dropped)
+        self.assertEqual(self.buses[0].dropped, 1)
+        self.assertEqual(self.buses[0].interested, set())
+
+    def test_handler_error(self):
+        frames = [SourceMessage(1, 'a', 1).encode(), SourceMessage(2, 'b', 1).encode()]
+        handled = []
+
+        def handler(message, frame):
+            if message.source_id == 'a':
+                raise SourceException('invalid message')
+            handled.append(frame)
+
+        self.buses[0].handler = handler
+        self.buses[1].interested.add(0)
+        for frame in frames:
+            self.buses[1].publish(frame, 1000)
+        data = b''.join(self.buses[1].batch)
+        with ExpectLog(app_log, 'message 1 of source a from bus is not handled'):
+            self.assertEqual(self.buses[0].decode(data), len(data))
+        self.assertEqual(handled, frames[1:])
+        self.assertEqual(self.buses[0].failed, 1)
+
+    def test_decode_invalid(self):
+        frame = SourceMessage(1, 'a', 1).encode()
+        broken = frame[:-1] + bytes((frame[-1] ^ 0xff, ))
+        self.buses[1].interested.add(0)
+        self.buses[1].publish(broken, 1000)
+        self.buses[1].publish(frame, 1000)
+        data = b''.join(self.buses[1].batch)
+        # partial record is left in buffer
+        self.assertEqual(self.buses[0].decode(data + data[:5]), len(data))
+        self.assertEqual([frame for _, frame in self.received[0]], [frame])
+
+if __name__ == '__main__':
+    unittest.main()
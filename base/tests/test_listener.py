@@ -0,0 +1,111 @@
+import unittest
+
+from tornado import gen
+from tornado import testing
+from tornado.concurrent import Future
+
+from base.exceptions import ListenerClosedException
+from base.listener import BaseListener
+from base.metrics import Metrics
+from base.message import SourceMessage
+
+
+class MockStream:
+
+    def __init__(self):
+        self.data = []
+        self.is_closed = False
+
+    def write(self, data):
+        self.data.append(data)
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def closed(self):
+        return self.is_closed
+
+    def close(self):
+        self.is_closed = True
+
+
+class ListenerQueueTestCase(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        listener = BaseListener(MockStream(), 2, BaseListener.OVERFLOW_DROP_OLDEST)
+        for data in (b'1', b'2', b'3'):
+            self.assertTrue(listener.send(data))
+        self.assertEqual(list(listener.queue), [b'2', b'3'])
+        self.assertEqual(listener.dropped, 1)
+
+    def test_drop_newest(self):
+        listener = BaseListener(MockStream(), 2, BaseListener.OVERFLOW_DROP_NEWEST)
+        results = [listener.send(data) for data in (b'1', b'2', b'3')]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(list(listener.queue), [b'1', b'2'])
+        self.assertEqual(listener.queue_depth, 2)
+        self.assertEqual(listener.dropped, 1)
+
+    def test_disconnect(self):
+        stream = MockStream()
+        listener = BaseListener(stream, 1, BaseListener.OVERFLOW_DISCONNECT)
+        listener.send(b'1')
+        with self.assertRaises(ListenerClosedException):
+            listener.send(b'2')
+        self.assertTrue(stream.is_closed)
+        with self.assertRaises(ListenerClosedException):
+            listener.send(b'3')
+
+    def test_progressed(self):
+        listener = BaseListener(MockStream(), 4)
+        # nothing to send
+        self.assertTrue(listener.progressed())
+        listener.send(b'1')
+        self.assertFalse(listener.progressed())
+        listener.queue.popleft()
+        listener.written += 1
+        listener.send(b'2')
+        self.assertTrue(listener.progressed())
+        self.assertFalse(listener.progressed())
+
+    def test_metrics(self):
+        metrics = Metrics()
+        listener = BaseListener(MockStream(), 2, BaseListener.OVERFLOW_DROP_NEWEST, metrics)
+        for data in (b'1', b'22', b'333'):
+            listener.send(data)
+        self.assertEqual((metrics.listener_messages, metrics.listener_bytes, metrics.listener_dropped), (2, 3, 1))
+
+    def test_write_buffer_size(self):
+        stream = MockStream()
+        self.assertEqual(BaseListener(stream).write_buffer_size, 0)
+        stream._write_buffer = b'abc'
+        self.assertEqual(BaseListener(stream).write_buffer_size, 3)
+        stream._write_buffer_size = 5
+        self.assertEqual(BaseListener(stream).write_buffer_size, 5)
+
+    def test_pack_record(self):
+        frame = SourceMessage(1, 'abc', 1, data={'a': 1}).encode()
+        record = BaseListener.pack_record(BaseListener.RECORD_MESSAGE, 10, 2, frame)
+        self.assertEqual(BaseListener.ENVELOPE.unpack(record[:BaseListener.ENVELOPE.size]),
+                         (BaseListener.RECORD_MESSAGE, 10, 2, len(frame)))
+        self.assertEqual(record[BaseListener.ENVELOPE.size:], frame)
+
+
+class ListenerWriterTestCase(testing.AsyncTestCase):
+
+    @testing.gen_test
+    def test_writer_task(self):
+        stream = MockStream()
+        listener = BaseListener(stream)
+        listener.send(b'1')
+        listener.start()
+        listener.send(b'2')
+        yield gen.moment
+        listener.send(b'3')
+        yield gen.sleep(0.01)
+        self.assertEqual(stream.data, [b'1', b'2', b'3'])
+        self.assertEqual(listener.queue_depth, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
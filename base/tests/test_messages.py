@@ -1,3 +1,4 @@
+import threading
 import unittest
 
 from tornado import gen
@@ -6,7 +7,9 @@ from tornado.iostream import StreamClosedError
 from tornado.tcpclient import TCPClient
 from tornado.tcpserver import TCPServer
 
-from base.message import SourceMessage, ServerMessage, InvalidMessageException, EncodeMessageError
+from base.checksum import xor_checksum, crc32_checksum
+from base.message import SourceMessage, CRC32SourceMessage, ServerMessage, AckModeMessage, InvalidMessageException, \
+    EncodeMessageError
 
 
 class TestMessage(unittest.TestCase):
@@ -124,6 +127,109 @@ class TestMessage(unittest.TestCase):
         with self.assertRaises(EncodeMessageError):
             message.encode()
 
+    def test_source_message_little_endian(self):
+
+        class LittleEndianMessage(SourceMessage):
+            BYTE_ORDER = 'little'
+
+        message = LittleEndianMessage(1, 'abc', 1, data={'abc': 0x010203})
+        message_bytes = message.encode()
+        self.assertEqual(bytes(self.bytes_data1[:1] + [0x01, 0x00] + self.bytes_data1[3:21] +
+                               [0x03, 0x02, 0x01, 0x00, 0x00]), message_bytes)
+        message1 = LittleEndianMessage.decode(message_bytes)
+        self.assertEqual(message1.num, 1)
+        self.assertEqual(message1.data, {'abc': 0x010203})
+        # big-endian codec is not affected
+        self.assertEqual(SourceMessage(1, 'abc', 1, data={'abc': 0x010203}).encode(), bytes(self.bytes_data1))
+
+    def test_source_message_too_many_fields(self):
+        message_data = {str(i): i for i in range(256)}
+        message = SourceMessage(1, 'abc', SourceMessage.STATUS_IDLE, data=message_data)
+        with self.assertRaises(EncodeMessageError):
+            message.encode()
+
+    def test_source_message_encode_in_threads(self):
+        messages = [SourceMessage(i, 'src{}'.format(i), 1, data={'f{}'.format(j): j for j in range(i)}) for i in range(8)]
+        expected = [message.encode() for message in messages]
+        results = [[] for _ in messages]
+
+        def encode(index):
+            for _ in range(2000):
+                results[index].append(messages[index].encode())
+
+        threads = [threading.Thread(target=encode, args=(index, )) for index in range(len(messages))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for frames, frame in zip(results, expected):
+            self.assertEqual(set(frames), {frame})
+
+    def test_xor_checksum(self):
+        for size in (1, 7, 8, 9, 13, 64, 100, 3073):
+            bytes_data = bytes((i * 37 + size) & 0xff for i in range(size))
+            expected = 0
+            for byte in bytes_data:
+                expected ^= byte
+            self.assertEqual(xor_checksum(bytes_data), expected)
+            # by parts
+            self.assertEqual(xor_checksum(bytes_data[size // 2:], xor_checksum(bytes_data[:size // 2])), expected)
+
+    def test_crc32_source_message(self):
+        message = CRC32SourceMessage(1, 'abc', 1, data={'abc': 0x010203})
+        message_bytes = message.encode()
+        self.assertEqual(message_bytes[0], CRC32SourceMessage.DEFAULT_HEADER)
+        self.assertEqual(message_bytes[-4:], crc32_checksum(message_bytes[:-4]).to_bytes(4, 'big'))
+        message1 = CRC32SourceMessage.decode(message_bytes)
+        self.assertEqual(message1.data, {'abc': 0x010203})
+
+        # xor of this message is not changed by swapping of two bytes, crc32 is
+        broken_bytes = bytearray(message_bytes)
+        broken_bytes[18], broken_bytes[19] = broken_bytes[19], broken_bytes[18]
+        with self.assertRaises(InvalidMessageException):
+            CRC32SourceMessage.decode(bytes(broken_bytes))
+
+    def test_source_message_frame_length(self):
+        for message in (SourceMessage(1, 'abc', 1), CRC32SourceMessage(1, 'abc', 1, data={'a': 1, 'b': 2})):
+            self.assertEqual(message.frame_length, len(message.encode()))
+
+    def test_source_message_check_sum_method_override(self):
+
+        class SumMessage(SourceMessage):
+            __slots__ = ()
+
+            def check_sum_method(self, bytes_data):
+                return sum(bytes_data) & 0xff
+
+        message = SumMessage(1, 'abc', 1, data={'abc': 0x010203})
+        message_bytes = message.encode()
+        self.assertEqual(message_bytes[-1], sum(message_bytes[:-1]) & 0xff)
+        self.assertEqual(SumMessage.decode(message_bytes).data, {'abc': 0x010203})
+        with self.assertRaises(InvalidMessageException):
+            SourceMessage.decode(message_bytes)
+
+    def test_source_messages_decode_many(self):
+        frames = bytes(self.bytes_data0 + self.bytes_data1 + self.bytes_data2)
+        messages, offset = SourceMessage.decode_many(frames + bytes(self.bytes_data2[:20]))
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(offset, len(frames))
+        self.assertIsNone(messages[0].data)
+        self.assertEqual(messages[2].data, {'abc': 0x010203, 'def': 0x030201})
+
+        # lazy decoding stops at broken frame
+        broken_frames = bytearray(frames)
+        broken_frames[-1] = 0x00
+        iterator = SourceMessage.iter_decode(broken_frames)
+        self.assertEqual(next(iterator).num, 1)
+        self.assertEqual(next(iterator).data, {'abc': 0x010203})
+        with self.assertRaises(InvalidMessageException):
+            next(iterator)
+
+        # frames from offset
+        messages, offset = SourceMessage.decode_many(frames, len(self.bytes_data0))
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(offset, len(frames))
+
     def test_server_message_success(self):
         original_bytes = self.server_message1
 
@@ -141,6 +247,19 @@ class TestMessage(unittest.TestCase):
         with self.assertRaises(InvalidMessageException):
             ServerMessage.decode(self.server_message3)
 
+    def test_ack_mode_message(self):
+        frame = AckModeMessage(AckModeMessage.MODE_CUMULATIVE, 0x0102).encode()
+        self.assertEqual(frame, bytes((0x03, 0x01, 0x01, 0x02, 0x03 ^ 0x01 ^ 0x01 ^ 0x02)))
+        message = AckModeMessage.decode(frame)
+        self.assertEqual((message.mode, message.batch), (AckModeMessage.MODE_CUMULATIVE, 0x0102))
+        self.assertEqual(AckModeMessage.frame_size(memoryview(frame)), len(frame))
+        with self.assertRaises(InvalidMessageException):
+            AckModeMessage.decode(frame[:-1] + b'\x00')
+        with self.assertRaises(InvalidMessageException):
+            AckModeMessage(AckModeMessage.MODE_CUMULATIVE, 0)
+        with self.assertRaises(InvalidMessageException):
+            AckModeMessage(AckModeMessage.MODE_EACH, header=SourceMessage.DEFAULT_HEADER)
+        self.assertEqual(ServerMessage.decode(ServerMessage(1, ServerMessage.HEADER_ACK_MODE).encode()).num, 1)
 
 
 class TestMessageAsync(testing.AsyncTestCase):
@@ -204,6 +323,36 @@ class TestMessageAsync(testing.AsyncTestCase):
         self.assertEqual(message.data['abc'], 0x00010203)
         server.stop()
 
+    @testing.gen_test
+    def test_message_decode_from_stream_in_pieces(self):
+
+        this = self
+
+        class SimpleServer(TCPServer):
+
+            @gen.coroutine
+            def handle_stream(self, stream, address):
+                try:
+                    # first frame byte by byte, second frame with broken check sum
+                    for byte in this.bytes_data2:
+                        yield stream.write(bytes((byte, )))
+                    yield stream.write(bytes(this.bytes_data2[:-1] + [0x00]))
+                except StreamClosedError:
+                    pass
+
+        server = SimpleServer(io_loop=self.io_loop)
+        server.listen(8888)
+
+        stream = yield TCPClient(io_loop=self.io_loop).connect('localhost', 8888)
+        header = yield stream.read_bytes(1)
+        message = yield SourceMessage.decode_stream(stream, header=header[0])
+        self.assertEqual(message.num, 1)
+        self.assertEqual(message.data, {'abc': 0x00010203, 'def': 0x00030201})
+        header = yield stream.read_bytes(1)
+        with self.assertRaises(InvalidMessageException):
+            yield SourceMessage.decode_stream(stream, header=header[0])
+        server.stop()
+
     @testing.gen_test
     def test_server_message_decode_from_stream(self):
         this = self
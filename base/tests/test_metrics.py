@@ -0,0 +1,83 @@
+import unittest
+
+from base.metrics import Histogram, Metrics
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_bucket_index(self):
+        previous = -1
+        for value in list(range(1000)) + [1 << 20, (1 << 20) + 12345, (1 << 63) + 1, (1 << 64) - 1]:
+            index = Histogram.bucket_index(value)
+            self.assertLess(index, Histogram.BUCKET_COUNT)
+            self.assertGreaterEqual(index, previous)
+            previous = index
+            low, high = Histogram.bucket_range(index)
+            self.assertTrue(low <= value <= high)
+            self.assertLessEqual(high - low, value / Histogram.SUB_BUCKET_COUNT)
+
+    def test_percentile(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        for value in range(1, 10001):
+            histogram.record(value * 1000)
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.min, 1000)
+        self.assertEqual(histogram.max, 10000000)
+        for point in (50, 90, 99, 99.9):
+            expected = point * 100 * 1000
+            self.assertAlmostEqual(histogram.percentile(point) / expected, 1, delta=1 / Histogram.SUB_BUCKET_COUNT)
+        self.assertEqual(histogram.percentile(100), 10000000)
+        histogram.record(-5)
+        self.assertEqual(histogram.min, 0)
+
+    def test_merge(self):
+        first = Histogram()
+        second = Histogram()
+        for value in (10, 20, 30):
+            first.record(value)
+        for value in (5, 40000):
+            second.record(value)
+        first.merge(second)
+        self.assertEqual(first.count, 5)
+        self.assertEqual(first.total, 40065)
+        self.assertEqual((first.min, first.max), (5, 40000))
+        self.assertEqual(first.percentile(100), 40000)
+        first.reset()
+        self.assertEqual(first.count, 0)
+        self.assertIsNone(first.max)
+
+    def test_summary(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.summary()['count'], 0)
+        self.assertIsNone(histogram.summary()['p99'])
+        for value in (1000, 2000, 3000):
+            histogram.record(value)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual((summary['min'], summary['max'], summary['mean']), (1.0, 3.0, 2.0))
+        self.assertEqual(summary['p50'], 2.0)
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_snapshot(self):
+        metrics = Metrics()
+        metrics.messages += 10
+        metrics.bytes_in += 260
+        metrics.record('handler', 5000)
+        snapshot = metrics.snapshot(gauges={'sources': 2}, additions={'listener_messages': 7})
+        self.assertEqual(snapshot['counters']['messages'], 10)
+        self.assertEqual(snapshot['counters']['listener_messages'], 7)
+        self.assertEqual(snapshot['gauges'], {'sources': 2})
+        self.assertEqual(snapshot['latency_us']['handler']['count'], 1)
+        self.assertGreater(snapshot['rates']['messages_per_sec'], 0)
+        # rates are counted since previous snapshot
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['rates']['messages_per_sec'], 0)
+        self.assertEqual(snapshot['counters']['listener_messages'], 0)
+        self.assertEqual(set(snapshot['counters']), set(Metrics.COUNTERS))
+
+
+if __name__ == '__main__':
+    unittest.main()
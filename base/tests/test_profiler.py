@@ -0,0 +1,63 @@
+import signal
+import time
+import unittest
+
+from tornado import gen
+from tornado import testing
+
+from base.checksum import xor_checksum
+from base.metrics import Histogram
+from base.profiler import LoopLagMonitor, SamplingProfiler
+
+
+class LoopLagMonitorTestCase(testing.AsyncTestCase):
+
+    @testing.gen_test
+    def test_lag(self):
+        histogram = Histogram()
+        monitor = LoopLagMonitor(histogram, 0.01)
+        monitor.start()
+        self.assertTrue(monitor.running)
+        yield gen.sleep(0.05)
+        # loop is blocked longer than interval
+        time.sleep(0.1)
+        yield gen.sleep(0.05)
+        monitor.stop()
+        self.assertFalse(monitor.running)
+        self.assertGreater(histogram.count, 2)
+        self.assertGreaterEqual(histogram.max, 50 * 1000 * 1000)
+        count = histogram.count
+        yield gen.sleep(0.03)
+        self.assertEqual(histogram.count, count)
+
+
+class SamplingProfilerTestCase(unittest.TestCase):
+
+    def test_profile(self):
+        profiler = SamplingProfiler(interval=0.001, packages=('base',))
+        previous_handler = signal.getsignal(signal.SIGPROF)
+        profiler.start()
+        self.assertTrue(profiler.running)
+        data = bytes(range(256)) * 4096
+        end = time.monotonic() + 0.3
+        while time.monotonic() < end and profiler.samples < 20:
+            xor_checksum(data)
+        profiler.stop()
+        self.assertFalse(profiler.running)
+        # timer and handler are removed by stop
+        self.assertEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+        self.assertEqual(signal.getsignal(signal.SIGPROF), previous_handler)
+        self.assertGreater(profiler.samples, 0)
+        report = profiler.report()
+        self.assertEqual(report['samples'], profiler.samples)
+        self.assertFalse(report['running'])
+        self.assertGreater(report['duration'], 0)
+        self.assertIn('base/checksum.py:xor_checksum', [item['function'] for item in report['functions']])
+        self.assertEqual(sum(int(line.rsplit(' ', 1)[1]) for line in profiler.collapsed()), profiler.samples)
+        profiler.reset()
+        self.assertEqual(profiler.report()['samples'], 0)
+        self.assertEqual(profiler.collapsed(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from base.message import SourceMessage, CRC32SourceMessage
+from base.protocol import MessageProtocol
+
+
+class MockTransport:
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+
+
+class MessageProtocolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = []
+        self.errors = []
+        self.protocol = MessageProtocol((SourceMessage, CRC32SourceMessage),
+                                        lambda message, transport: self.messages.append(message),
+                                        lambda exception, transport: self.errors.append(exception))
+        self.protocol.connection_made(MockTransport())
+
+    def test_frames_in_pieces(self):
+        frames = (SourceMessage(1, 'abc', 1, data={'a': 1}).encode() +
+                  CRC32SourceMessage(2, 'def', 2, data={'b': 2, 'c': 3}).encode())
+        for i in range(0, len(frames), 5):
+            self.protocol.data_received(frames[i:i + 5])
+        self.assertEqual([message.num for message in self.messages], [1, 2])
+        self.assertEqual(self.messages[1].data, {'b': 2, 'c': 3})
+        self.assertEqual(self.protocol.buffer, b'')
+
+    def test_large_frame_in_small_chunks(self):
+        data = {'f{}'.format(i): i for i in range(255)}
+        frame = SourceMessage(1, 'abc', 1, data=data).encode()
+        tail = SourceMessage(2, 'abc', 1).encode()
+        buffer = self.protocol.buffer
+        chunks = [frame[i:i + 7] for i in range(0, len(frame), 7)]
+        chunks[-1] += tail[:3]
+        for chunk in chunks:
+            self.protocol.data_received(chunk)
+        # partial frame is accumulated in the same buffer
+        self.assertIs(self.protocol.buffer, buffer)
+        self.assertEqual(self.protocol.buffer, tail[:3])
+        self.protocol.data_received(tail[3:])
+        self.assertEqual([message.num for message in self.messages], [1, 2])
+        self.assertEqual(self.messages[0].data, data)
+        self.assertEqual(self.protocol.buffer, b'')
+
+    def test_invalid_frames(self):
+        frame = SourceMessage(1, 'abc', 1).encode()
+        broken_frame = frame[:-1] + bytes((frame[-1] ^ 0xff, ))
+        self.protocol.data_received(b'\xff' + broken_frame + frame)
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(len(self.messages), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
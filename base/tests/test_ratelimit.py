@@ -0,0 +1,58 @@
+import unittest
+
+from base.ratelimit import TokenBuckets, parse_rate_limit, parse_rate_limits
+from base.source import Source
+
+
+class TokenBucketsTestCase(unittest.TestCase):
+
+    def test_take(self):
+        buckets = TokenBuckets()
+        self.assertEqual([buckets.take('a', 10, 3, 0.0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(buckets.take('a', 10, 3, 0.0), 0.1)
+        # rejected take does not use token
+        self.assertAlmostEqual(buckets.take('a', 10, 3, 0.05), 0.05)
+        self.assertEqual(buckets.take('a', 10, 3, 0.1), 0)
+        # bucket is refilled up to burst
+        self.assertGreater([buckets.take('a', 10, 3, 100.0) for _ in range(4)][3], 0)
+        # other key has own bucket
+        self.assertEqual(buckets.take('b', 10, 3, 0.1), 0)
+        self.assertEqual(len(buckets), 2)
+
+    def test_debt(self):
+        buckets = TokenBuckets()
+        buckets.take('a', 10, 1, 0.0)
+        self.assertAlmostEqual(buckets.take('a', 10, 1, 0.0, debt=True), 0.1)
+        # debt is paid before next token
+        self.assertAlmostEqual(buckets.take('a', 10, 1, 0.1, debt=True), 0.1)
+        self.assertEqual(buckets.take('a', 10, 1, 0.35, debt=True), 0)
+
+    def test_give_and_remove(self):
+        buckets = TokenBuckets()
+        buckets.take('a', 1, 1, 0.0)
+        buckets.give('a')
+        self.assertEqual(buckets.take('a', 1, 1, 0.0), 0)
+        buckets.remove('a')
+        self.assertNotIn('a', buckets)
+        # index of removed bucket is reused, new bucket is full
+        self.assertEqual(buckets.take('b', 1, 1, 0.0), 0)
+        self.assertEqual(len(buckets.tokens), 1)
+
+
+class ParseRateLimitsTestCase(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_rate_limit('100'), (100, 100))
+        self.assertEqual(parse_rate_limit('0.5'), (0.5, 1))
+        self.assertEqual(parse_rate_limit('10:50'), (10, 50))
+        self.assertEqual(parse_rate_limits('default=100:200, recharge=10, 2=5', Source.STATUS),
+                         {None: (100, 200), Source.STATUS_RECHARGE: (10, 10), Source.STATUS_ACTIVE: (5, 5)})
+        for text in ('0', '10:0', 'x'):
+            with self.assertRaises(ValueError):
+                parse_rate_limit(text)
+        with self.assertRaises(ValueError):
+            parse_rate_limits('default', Source.STATUS)
+
+
+if __name__ == '__main__':
+    unittest.main()
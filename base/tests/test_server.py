@@ -1,3 +1,4 @@
+import socket
 import unittest
 
 from time import time
@@ -238,5 +239,42 @@ class BaseServerHandlingTestCase(testing.AsyncTestCase):
 
         self.assertTrue(exception, 'exception not raised')
 
+    def test_no_message_handler_on_start(self):
+
+        class MockMessage(AbstractMessage):
+            HEADERS = (0x01, )
+            DEFAULT_HEADER = 0x01
+
+        class TestServer(BaseServer):
+            ALLOWED_MESSAGES = (MockMessage, )
+
+        with self.assertRaises(ServerException):
+            TestServer(io_loop=self.io_loop)
+
+    @testing.gen_test
+    def test_keepalive(self):
+        options = {}
+
+        class TestServer(BaseServer):
+            def handler_default(self, stream, address, header):
+                self.set_keepalive(stream, 6)
+                connection = stream.socket
+                options['keepalive'] = connection.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+                if hasattr(socket, 'TCP_KEEPIDLE'):
+                    options['idle'] = connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE)
+                    options['count'] = connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT)
+
+        server = TestServer(io_loop=self.io_loop)
+        server.listen(8888)
+        client = TCPClient(io_loop=self.io_loop)
+        stream = yield client.connect('127.0.0.1', 8888)
+        yield stream.write(bytes([0x01, ]))
+        yield gen.sleep(0.1)
+        server.stop()
+        client.close()
+        self.assertTrue(options['keepalive'])
+        if 'idle' in options:
+            self.assertEqual((options['idle'], options['count']), (3, TestServer.KEEPALIVE_PROBES))
+
 if __name__ == '__main__':
     unittest.main()
@@ -42,6 +42,50 @@ class SourceGetMessageTestCase(unittest.TestCase):
         with self.assertRaises(SourceException):
             source.get_message(message)
 
+    def test_source_history_size(self):
+        source = Source('abc', history_size=2)
+        messages = [SourceMessage(i, 'abc', Source.STATUS_IDLE) for i in range(3)]
+        for message in messages:
+            source.get_message(message)
+        self.assertEqual(list(source.messages), messages[1:])
+        self.assertEqual(source.last_message, messages[2])
+
+    def test_source_zero_history_size(self):
+        source = Source('abc', history_size=0)
+        message = SourceMessage(1, 'abc', Source.STATUS_IDLE)
+        source.get_message(message)
+        self.assertEqual(len(source.messages), 0)
+        self.assertEqual(source.last_message, message)
+
+    def test_source_str(self):
+        source = Source('abc')
+        self.assertEqual(str(source), '[abc] - | IDLE | -')
+        message = SourceMessage.decode(SourceMessage(7, 'abc', Source.STATUS_ACTIVE).encode())
+        self.assertIsNotNone(message.date_received)
+        source.get_message(message)
+        self.assertRegex(str(source), r'^\[abc\] 7 \| ACTIVE \| \d+$')
+
+    def test_snapshot_line(self):
+        source = Source('abc')
+        message = SourceMessage(7, 'abc', Source.STATUS_ACTIVE)
+        message.received = 1000000
+        source.get_message(message)
+        self.assertEqual(source.snapshot_line(6000000), '[abc] 7 | ACTIVE | 5')
+        source.status = Source.STATUS_RECHARGE
+        self.assertEqual(source.snapshot_line(6000000), '[abc] 7 | RECHARGE | 5')
+
+    def test_snapshot_prefix_rendered_on_demand(self):
+        source = Source('abc')
+        for num in range(3):
+            source.get_message(SourceMessage(num, 'abc', Source.STATUS_ACTIVE))
+            self.assertIsNone(source._snapshot_prefix)  # messages are not rendered until snapshot
+        self.assertEqual(source.snapshot_line(0), '[abc] 2 | ACTIVE | -')
+        prefix = source._snapshot_prefix
+        source.status = Source.STATUS_ACTIVE  # status is not changed
+        self.assertIs(source._snapshot_prefix, prefix)
+        self.assertEqual(source.new_message().num, 0)
+        self.assertEqual(source.snapshot_line(0), '[abc] 0 | ACTIVE | -')
+
 
 class SourceNewMessageTestCase(unittest.TestCase):
 
@@ -52,6 +96,7 @@ class SourceNewMessageTestCase(unittest.TestCase):
         self.assertEqual(message.source_id, source.source_id)
         self.assertEqual(message.status, source.status)
         self.assertIsNone(message.data)
+        self.assertIsNone(message.date_received)
 
     def test_source_new_message_with_data(self):
         source = Source('abc')
@@ -66,5 +111,13 @@ class SourceNewMessageTestCase(unittest.TestCase):
         self.assertIsNotNone(message.data)
         self.assertEqual(message.data, message_data)
 
+    def test_source_new_message_sequence(self):
+        source = Source('abc', history_size=0)
+        nums = [source.new_message().num for i in range(3)]
+        self.assertEqual(nums, [0, 1, 2])
+        source._sequence = Source.SEQUENCE_LIMIT - 1
+        nums = [source.new_message().num for i in range(2)]
+        self.assertEqual(nums, [Source.SEQUENCE_LIMIT - 1, 0])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from base.exceptions import SubscriptionException
+from base.message import SourceMessage
+from base.subscriptions import Subscription, SubscriptionIndex
+
+
+class SubscriptionTestCase(unittest.TestCase):
+
+    def test_parse(self):
+        subscription = Subscription.parse('source=a,b prefix=s status=RECHARGE,1 field=x', SourceMessage.STATUS)
+        self.assertEqual(subscription.sources, {'a', 'b'})
+        self.assertEqual(subscription.prefixes, {'s'})
+        self.assertEqual(subscription.statuses, {SourceMessage.STATUS_RECHARGE, SourceMessage.STATUS_IDLE})
+        self.assertEqual(subscription.fields, {'x'})
+
+    def test_parse_invalid(self):
+        for text in ('source', 'unknown=1', 'status=SLEEP', 'status=9'):
+            with self.assertRaises(SubscriptionException):
+                Subscription.parse(text, SourceMessage.STATUS)
+
+
+class SubscriptionIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SubscriptionIndex()
+        self.index.subscribe('all', Subscription())
+        self.index.subscribe('source', Subscription(sources=['abc']))
+        self.index.subscribe('prefix', Subscription(prefixes=['ab', 'x']))
+        self.index.subscribe('recharge', Subscription(statuses=[SourceMessage.STATUS_RECHARGE]))
+        self.index.subscribe('field', Subscription(prefixes=['a'], fields=['t']))
+
+    def match(self, source_id, status=SourceMessage.STATUS_IDLE, data=None):
+        return set(self.index.match(SourceMessage(1, source_id, status, data=data)))
+
+    def test_match(self):
+        self.assertEqual(self.match('abc'), {'all', 'source', 'prefix'})
+        self.assertEqual(self.match('abc', data={'t': 1}), {'all', 'source', 'prefix', 'field'})
+        self.assertEqual(self.match('xyz', SourceMessage.STATUS_RECHARGE), {'all', 'prefix', 'recharge'})
+        self.assertEqual(self.match('def'), {'all'})
+
+    def test_resubscribe_and_unsubscribe(self):
+        self.match('abc')
+        self.index.subscribe('source', Subscription(sources=['def']))
+        self.index.unsubscribe('all')
+        self.assertEqual(self.match('abc'), {'prefix'})
+        self.assertEqual(self.match('def'), {'source'})
+        self.assertNotIn('abc', self.index.by_source)
+        self.assertEqual(len(self.index), 4)
+
+    def test_cache_invalidation(self):
+        self.match('abc')
+        self.match('def')
+        self.match('xyz', SourceMessage.STATUS_RECHARGE)
+        cache = self.index._matches
+        # listener without filters does not touch cache
+        self.index.subscribe('all2', Subscription())
+        self.assertEqual(set(cache), {'abc', 'def', 'xyz'})
+        self.assertEqual(self.match('def'), {'all', 'all2'})
+        # only results of matching sources and statuses are removed
+        self.index.subscribe('def', Subscription(sources=['def'], statuses=[SourceMessage.STATUS_ACTIVE]))
+        self.assertEqual(cache['def'], {SourceMessage.STATUS_IDLE: ()})
+        self.assertEqual(self.match('def', SourceMessage.STATUS_ACTIVE), {'all', 'all2', 'def'})
+        self.index.subscribe('prefix2', Subscription(prefixes=['xy']))
+        self.assertEqual(set(cache), {'abc', 'def'})
+        self.assertEqual(self.match('xyz', SourceMessage.STATUS_RECHARGE), {'all', 'all2', 'prefix', 'prefix2',
+                                                                            'recharge'})
+        self.index.unsubscribe('all2')
+        self.assertEqual(self.match('abc'), {'all', 'source', 'prefix'})
+
+    def test_cache_size(self):
+        self.index.MATCHES_CACHE_SIZE = 10
+        for i in range(25):
+            self.assertEqual(self.match('s{}'.format(i)), {'all'})
+        self.assertLessEqual(len(self.index._matches), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from base.timerwheel import TimerWheel
+
+
+class TimerWheelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.expired = []
+        self.wheel = TimerWheel(3, self.expired.append)
+
+    def advance(self, ticks):
+        for _ in range(ticks):
+            self.wheel.advance()
+
+    def test_timeout(self):
+        self.wheel.add('a')
+        self.advance(1)
+        self.wheel.add('b')
+        self.assertEqual(len(self.wheel), 2)
+        # key added during tick expires after `timeout` complete ticks
+        self.advance(3)
+        self.assertEqual(self.expired, ['a'])
+        self.assertNotIn('a', self.wheel)
+        self.advance(1)
+        self.assertEqual(self.expired, ['a', 'b'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_touch(self):
+        self.wheel.add('a')
+        for _ in range(10):
+            self.advance(3)
+            self.wheel.touch('a')
+        self.assertEqual(self.expired, [])
+        self.advance(4)
+        self.assertEqual(self.expired, ['a'])
+        # removed key is not added by touch
+        self.wheel.touch('a')
+        self.assertNotIn('a', self.wheel)
+
+    def test_remove(self):
+        self.wheel.add('a')
+        self.wheel.add('b')
+        self.wheel.remove('a')
+        # removed key is not referenced by wheel
+        self.assertNotIn('a', set().union(*self.wheel.slots))
+        self.advance(1)
+        self.wheel.add('a')
+        self.advance(3)
+        self.assertEqual(self.expired, ['b'])
+        self.advance(1)
+        self.assertEqual(self.expired, ['b', 'a'])
+        self.assertEqual(sum(len(slot) for slot in self.wheel.slots), 0)
+
+    def test_small_wheel(self):
+        # timeout longer than wheel: key passes its slot several times
+        wheel = TimerWheel(10, self.expired.append, slots=4)
+        wheel.add('a')
+        for _ in range(10):
+            wheel.advance()
+        self.assertEqual(self.expired, [])
+        wheel.advance()
+        self.assertEqual(self.expired, ['a'])
+
+    def test_handler_resets_timeout(self):
+        calls = []
+
+        def handler(key):
+            calls.append(key)
+            return len(calls) < 2
+
+        wheel = TimerWheel(2, handler, tick=0.5)
+        self.assertEqual(wheel.timeout, 4)
+        wheel.add('a')
+        for _ in range(10):
+            wheel.advance()
+        self.assertEqual(calls, ['a', 'a'])
+        self.assertNotIn('a', wheel)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from base.timeseries import Series, TimeSeriesStore
+
+
+class SeriesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.series = Series(chunk_size=4)
+        for timestamp in range(10):
+            self.series.append(timestamp * 10, timestamp)
+
+    def test_chunks(self):
+        self.assertEqual(len(self.series.chunks), 3)
+        self.assertEqual(self.series.starts, [0, 40, 80])
+        self.assertEqual(len(self.series), 10)
+
+    def test_range(self):
+        timestamps, values = self.series.range(25, 75)
+        self.assertEqual(list(timestamps), [30, 40, 50, 60, 70])
+        self.assertEqual(list(values), [3, 4, 5, 6, 7])
+        self.assertEqual(list(self.series.range()[1]), list(range(10)))
+        self.assertEqual(len(self.series.range(91)[0]), 0)
+
+    def test_aggregate(self):
+        self.assertEqual(self.series.aggregate(20, 60), {'count': 4, 'min': 2, 'max': 5, 'mean': 3.5, 'last': 5})
+        self.assertEqual(self.series.aggregate(200)['count'], 0)
+        self.assertIsNone(self.series.aggregate(200)['mean'])
+
+    def test_equal_timestamps_on_chunk_border(self):
+        series = Series(chunk_size=2)
+        for value in range(5):
+            series.append(100, value)
+        self.assertEqual(list(series.range(100, 101)[1]), [0, 1, 2, 3, 4])
+
+    def test_max_chunks(self):
+        series = Series(chunk_size=4, max_chunks=2)
+        for timestamp in range(10):
+            series.append(timestamp, timestamp)
+        self.assertEqual(list(series.range()[1]), [4, 5, 6, 7, 8, 9])
+
+
+class TimeSeriesStoreTestCase(unittest.TestCase):
+
+    def test_store(self):
+        store = TimeSeriesStore()
+        store.append('abc', 1, {'b': 1, 'a': 10})
+        store.append('abc', 2, {'a': 20})
+        store.append('def', 2, {'a': 30})
+        self.assertEqual(store.fields('abc'), ['a', 'b'])
+        self.assertEqual(list(store.range('abc', 'a')[1]), [10, 20])
+        self.assertEqual(store.aggregate('abc', 'a')['mean'], 15)
+        self.assertEqual(store.aggregate('abc', 'unknown')['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
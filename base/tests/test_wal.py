@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+from base.message import SourceMessage, CRC32SourceMessage
+from base.wal import WriteAheadLog, WALReader, INDEX_SUFFIX, SEGMENT_SUFFIX
+
+
+class WALTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, count, **kwargs):
+        wal = WriteAheadLog(self.path, **kwargs)
+        frames = []
+        for i in range(count):
+            message_class = CRC32SourceMessage if i % 2 else SourceMessage
+            frame = message_class(i, 's{}'.format(i % 3), 1, data={'a': i}).encode()
+            wal.append(frame, 's{}'.format(i % 3), 1000 + i)
+            frames.append(frame)
+        wal.close()
+        return frames
+
+    def test_replay(self):
+        frames = self.write(20, batch_size=100)
+        records = list(WALReader(self.path, (SourceMessage, CRC32SourceMessage)).replay())
+        self.assertEqual([timestamp for timestamp, _ in records], list(range(1000, 1020)))
+        self.assertEqual([message.encode() for _, message in records], frames)
+        self.assertIsInstance(records[1][1], CRC32SourceMessage)
+
+    def test_segments_and_index(self):
+        self.write(50, segment_size=300, index_block_size=60)
+        reader = WALReader(self.path, (SourceMessage, CRC32SourceMessage))
+        self.assertGreater(len(reader.segments()), 1)
+        self.assertTrue(all(os.path.exists(segment[:-4] + INDEX_SUFFIX) for segment in reader.segments()))
+        nums = [message.num for _, message in reader.replay(source_id='s1', start=1010, end=1040)]
+        self.assertEqual(nums, [i for i in range(10, 40) if i % 3 == 1])
+
+    def test_partial_and_new_segment(self):
+        self.write(3, fsync_policy=WriteAheadLog.FSYNC_ALWAYS)
+        segment = WALReader(self.path, (SourceMessage, )).segments()[0]
+        with open(segment, 'ab') as segment_file:
+            segment_file.write(SourceMessage(3, 's', 1).encode()[:5])
+        os.remove(segment[:-4] + INDEX_SUFFIX)
+        wal = WriteAheadLog(self.path, WriteAheadLog.FSYNC_NEVER)
+        wal.append(SourceMessage(4, 's', 1).encode(), 's', 2000)
+        wal.flush()
+        reader = WALReader(self.path, (SourceMessage, CRC32SourceMessage))
+        self.assertEqual([message.num for _, message in reader.replay()], [0, 1, 2, 4])
+        self.assertEqual([message.num for _, message in reader.replay(source_id='s1')], [1])
+        wal.close()
+
+    def test_max_segments(self):
+        self.write(50, segment_size=300, max_segments=2)
+        reader = WALReader(self.path, (SourceMessage, CRC32SourceMessage))
+        segments = reader.segments()
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         sorted(os.path.basename(segment[:-4]) + suffix
+                                for segment in segments for suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX)))
+        nums = [message.num for _, message in reader.replay()]
+        self.assertEqual(nums, list(range(nums[0], 50)))
+        wal = WriteAheadLog(self.path, max_segments=2)
+        self.assertEqual(wal.removed_segments, 1)
+        self.assertNotIn(segments[0], reader.segments())
+        self.assertEqual([message.num for _, message in reader.replay()][-1], 49)
+        wal.close()
+
+    def test_segment_removed_while_reading(self):
+        self.write(50, segment_size=300)
+        reader = WALReader(self.path, (SourceMessage, CRC32SourceMessage))
+        segments = reader.segments()
+        replay = reader.replay(source_id='s1')
+        self.assertEqual(next(replay)[1].num, 1)
+        os.remove(segments[1])
+        nums = [message.num for _, message in replay]
+        self.assertEqual(nums[-1], 49)
+        self.assertLess(len(nums), len(range(4, 50, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from tornado.ioloop import PeriodicCallback
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel of timeouts of many keys (e.g. idle timeouts of connections).
+    Time is counted in ticks of `tick` seconds, key is kept in slot `deadline % slots` of wheel,
+    wheel is advanced by one slot each tick by one periodic callback (see `start`),
+    so cost of tick does not depend on count of keys in other slots.
+    `touch` only stores new deadline of key (one dict assignment), key is moved to slot of new deadline lazily,
+    when its old slot is reached. `remove` removes key from its slot at once, so wheel keeps no reference to it.
+    Key with passed deadline is removed and passed to `handler(key)`, if handler returns True, key is added again
+    with new timeout.
+    Timeout is detected with precision of one tick: key expires after `timeout` to `timeout + tick` seconds.
+    """
+
+    def __init__(self, timeout, handler, tick=1.0, slots=None):
+        """
+        :param timeout: timeout of keys (seconds) :float
+        :param handler: callback of expired keys
+        :param tick: duration of tick (seconds) :float
+        :param slots: count of slots of wheel (by default keys are not moved until expiry) :int
+        """
+        self.tick = tick
+        self.timeout = max(int(round(timeout / tick)), 1)  # ticks
+        self.handler = handler
+        self.slots = [set() for _ in range(slots or self.timeout + 2)]
+        self.deadlines = {}  # key - key, value - tick of deadline
+        self.positions = {}  # key - key, value - index of slot of key
+        self.current = 0  # current tick
+        self.expiry = self.timeout + 1  # deadline of key touched in current tick (current tick is not complete)
+        self._callback = None
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def add(self, key):
+        """
+        Adds key or resets its timeout
+        :param key: hashable key
+        :return: None
+        """
+        deadlines = self.deadlines
+        if key not in deadlines:
+            position = self.positions[key] = self.expiry % len(self.slots)
+            self.slots[position].add(key)
+        deadlines[key] = self.expiry
+
+    def touch(self, key):
+        """
+        Resets timeout of added key, other keys are ignored
+        :param key: hashable key
+        :return: None
+        """
+        if key in self.deadlines:
+            self.deadlines[key] = self.expiry
+
+    def remove(self, key):
+        """
+        Removes key
+        :param key: hashable key
+        :return: None
+        """
+        if self.deadlines.pop(key, None) is not None:
+            self.slots[self.positions.pop(key)].discard(key)
+
+    def advance(self):
+        """
+        Advances wheel by one tick and passes expired keys of reached slot to handler
+        :return: count of expired keys :int
+        """
+        self.current += 1
+        self.expiry = self.current + self.timeout + 1
+        slots = self.slots
+        position = self.current % len(slots)
+        slot = slots[position]
+        if not slot:
+            return 0
+        deadlines = self.deadlines
+        positions = self.positions
+        expired = []
+        for key in list(slot):
+            deadline = deadlines[key]
+            if deadline <= self.current:
+                slot.discard(key)
+                del deadlines[key]
+                del positions[key]
+                expired.append(key)
+            elif deadline % len(slots) != position:
+                slot.discard(key)
+                position_of_key = positions[key] = deadline % len(slots)
+                slots[position_of_key].add(key)
+        for key in expired:
+            if self.handler(key):
+                self.add(key)
+        return len(expired)
+
+    def start(self):
+        """
+        Starts advancing of wheel by IOLoop every tick
+        :return: None
+        """
+        if self._callback is None:
+            self._callback = PeriodicCallback(self.advance, self.tick * 1000)
+            self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
@@ -0,0 +1,217 @@
+from array import array
+from bisect import bisect_left
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, it is used only for aggregates over big chunks
+    numpy = None
+
+
+# min count of samples in slice to aggregate it with numpy
+NUMPY_MIN_SIZE = 256
+
+# typecodes of columns: timestamps - signed 8 bytes (monotonic ns), values - unsigned 4 bytes (as in message)
+TIMESTAMP_TYPECODE = 'q'
+VALUE_TYPECODE = 'I'
+
+if numpy is not None:
+    VALUE_DTYPE = numpy.dtype(VALUE_TYPECODE)
+
+
+class Series:
+    """
+    Time series of one data field of source.
+    Samples are kept in two columns (timestamps and values) split into chunks of `chunk_size` samples,
+    each column of chunk is `array.array`, so sample takes 12 bytes instead of dict entry and int objects.
+    Timestamps of series must not decrease, range queries find chunks and samples by bisection.
+    With `max_chunks` oldest chunk is dropped when new chunk is started.
+    """
+
+    def __init__(self, chunk_size, max_chunks=None):
+        """
+        :param chunk_size: count of samples in chunk :int
+        :param max_chunks: max count of chunks kept in series (None - unlimited) :int
+        """
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = []  # list of (timestamps, values) arrays
+        self.starts = []  # first timestamp of each chunk
+        self.last_timestamp = None
+        self.last_value = None
+        # columns of current chunk and count of its samples
+        self._timestamps = self._values = None
+        self._size = chunk_size
+
+    def __len__(self):
+        return sum(len(timestamps) for timestamps, _ in self.chunks)
+
+    def append(self, timestamp, value):
+        """
+        Adds sample to series
+        :param timestamp: monotonic time (ns) :int
+        :param value: value of field :int
+        :return: None
+        """
+        last_timestamp = self.last_timestamp
+        if last_timestamp is not None and timestamp < last_timestamp:
+            timestamp = last_timestamp
+        if self._size >= self.chunk_size:
+            self._new_chunk(timestamp)
+        self._timestamps.append(timestamp)
+        self._values.append(value)
+        self._size += 1
+        self.last_timestamp = timestamp
+        self.last_value = value
+
+    def _new_chunk(self, timestamp):
+        """
+        Starts new chunk, oldest chunk is dropped if series has `max_chunks` chunks
+        :param timestamp: first timestamp of chunk :int
+        :return: None
+        """
+        chunks = self.chunks
+        if self.max_chunks and len(chunks) >= self.max_chunks:
+            del chunks[0]
+            del self.starts[0]
+        self._timestamps = array(TIMESTAMP_TYPECODE)
+        self._values = array(VALUE_TYPECODE)
+        self._size = 0
+        chunks.append((self._timestamps, self._values))
+        self.starts.append(timestamp)
+
+    def slices(self, start=None, end=None):
+        """
+        Generator of column slices of chunks with samples in time window [start, end)
+        :param start: min timestamp (None - from first sample) :int
+        :param end: max timestamp, not included (None - up to last sample) :int
+        :return: generator of (timestamps, values) arrays
+        """
+        starts = self.starts
+        first = 0 if start is None else max(bisect_left(starts, start) - 1, 0)
+        last = len(starts) if end is None else bisect_left(starts, end)
+        for timestamps, values in self.chunks[first:last]:
+            left = 0 if start is None or timestamps[0] >= start else bisect_left(timestamps, start)
+            right = len(timestamps) if end is None or timestamps[-1] < end else bisect_left(timestamps, end)
+            if left < right:
+                if left == 0 and right == len(timestamps):
+                    yield timestamps, values
+                else:
+                    yield timestamps[left:right], values[left:right]
+
+    def range(self, start=None, end=None):
+        """
+        Samples in time window [start, end)
+        :param start: min timestamp (None - from first sample) :int
+        :param end: max timestamp, not included (None - up to last sample) :int
+        :return: timestamps and values :(array.array, array.array)
+        """
+        result_timestamps = array(TIMESTAMP_TYPECODE)
+        result_values = array(VALUE_TYPECODE)
+        for timestamps, values in self.slices(start, end):
+            result_timestamps.extend(timestamps)
+            result_values.extend(values)
+        return result_timestamps, result_values
+
+    def aggregate(self, start=None, end=None):
+        """
+        Aggregates of values in time window [start, end).
+        Each chunk slice is aggregated by C-level builtins (or numpy for big slices if it is installed)
+        :param start: min timestamp (None - from first sample) :int
+        :param end: max timestamp, not included (None - up to last sample) :int
+        :return: dict with `count`, `min`, `max`, `mean`, `last` keys (None values for empty window) :dict
+        """
+        count = total = 0
+        minimum = maximum = last = None
+        for timestamps, values in self.slices(start, end):
+            size = len(values)
+            if numpy is not None and size >= NUMPY_MIN_SIZE:
+                column = numpy.frombuffer(values, dtype=VALUE_DTYPE)
+                low, high, part = int(column.min()), int(column.max()), int(column.sum(dtype=numpy.uint64))
+            else:
+                low, high, part = min(values), max(values), sum(values)
+            minimum = low if minimum is None else min(minimum, low)
+            maximum = high if maximum is None else max(maximum, high)
+            total += part
+            count += size
+            last = values[-1]
+        return {
+            'count': count,
+            'min': minimum,
+            'max': maximum,
+            'mean': total / count if count else None,
+            'last': last,
+        }
+
+
+class TimeSeriesStore:
+    """
+    Columnar in-memory store of data fields of sources.
+    Each pair (source_id, field name) has own `Series` of (timestamp, value) samples.
+    """
+
+    # default count of samples in chunk of series
+    CHUNK_SIZE = 1024
+
+    # default max count of chunks in series (None - unlimited)
+    MAX_CHUNKS = None
+
+    def __init__(self, chunk_size=None, max_chunks=None):
+        """
+        :param chunk_size: count of samples in chunk :int
+        :param max_chunks: max count of chunks in each series :int
+        """
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.max_chunks = max_chunks or self.MAX_CHUNKS
+        self.series = {}  # key - (source_id, field), value - Series
+
+    def append(self, source_id, timestamp, data):
+        """
+        Adds values of data fields of source
+        :param source_id: id of source :str
+        :param timestamp: monotonic time (ns) :int
+        :param data: data of message, key - field name, value - value of field :dict
+        :return: None
+        """
+        series = self.series
+        for field, value in data.items():
+            try:
+                series[source_id, field].append(timestamp, value)
+            except KeyError:
+                field_series = series[source_id, field] = Series(self.chunk_size, self.max_chunks)
+                field_series.append(timestamp, value)
+
+    def get_series(self, source_id, field):
+        """
+        :param source_id: id of source :str
+        :param field: field name :str
+        :return: series or None :Series
+        """
+        return self.series.get((source_id, field))
+
+    def fields(self, source_id):
+        """
+        Field names of source
+        :param source_id: id of source :str
+        :return: sorted list of field names :list
+        """
+        return sorted(field for series_source_id, field in self.series if series_source_id == source_id)
+
+    def range(self, source_id, field, start=None, end=None):
+        """
+        Samples of field of source in time window [start, end) (see `Series.range`)
+        :return: timestamps and values :(array.array, array.array)
+        """
+        series = self.get_series(source_id, field)
+        if series is None:
+            return array(TIMESTAMP_TYPECODE), array(VALUE_TYPECODE)
+        return series.range(start, end)
+
+    def aggregate(self, source_id, field, start=None, end=None):
+        """
+        Aggregates of field of source in time window [start, end) (see `Series.aggregate`)
+        :return: dict with `count`, `min`, `max`, `mean`, `last` keys :dict
+        """
+        series = self.get_series(source_id, field)
+        if series is None:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'last': None}
+        return series.aggregate(start, end)
@@ -0,0 +1,406 @@
+import json
+import mmap
+import os
+import struct
+import time
+
+from base.clock import from_wall_ns
+from base.exceptions import WALException, InvalidMessageException
+from base.message import header_table
+
+
+# record of log: wall-clock time of receiving (ns) followed by raw frame of message as it was received
+TIMESTAMP = struct.Struct('>Q')
+
+SEGMENT_SUFFIX = '.wal'
+INDEX_SUFFIX = '.idx'
+
+
+def segment_name(number):
+    return '{:012d}{}'.format(number, SEGMENT_SUFFIX)
+
+
+def list_segments(path):
+    """
+    Segments of log in order of writing
+    :param path: directory of log :str
+    :return: list of segment paths :list
+    """
+    if not os.path.isdir(path):
+        return []
+    names = sorted(name for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(path, name) for name in names]
+
+
+class SegmentIndex:
+    """
+    Sparse index of segment.
+    Segment is split into blocks of at least `block_size` bytes (borders are at starts of records),
+    for each block index keeps its offset and time range, for each source - numbers of blocks with its records.
+    Index of closed segment is saved near segment in JSON file with `INDEX_SUFFIX`.
+    """
+
+    # default min size of block (bytes)
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or self.BLOCK_SIZE
+        self.blocks = []  # list of [offset, min timestamp, max timestamp]
+        self.sources = {}  # key - source id, value - list of block numbers
+
+    def add(self, offset, timestamp, source_id):
+        """
+        Adds record to index
+        :param offset: offset of record in segment :int
+        :param timestamp: wall-clock time of record (ns) :int
+        :param source_id: id of source :str
+        :return: None
+        """
+        blocks = self.blocks
+        if not blocks or offset - blocks[-1][0] >= self.block_size:
+            blocks.append([offset, timestamp, timestamp])
+        else:
+            block = blocks[-1]
+            if timestamp < block[1]:
+                block[1] = timestamp
+            elif timestamp > block[2]:
+                block[2] = timestamp
+        number = len(blocks) - 1
+        source_blocks = self.sources.get(source_id)
+        if source_blocks is None:
+            self.sources[source_id] = [number]
+        elif source_blocks[-1] != number:
+            source_blocks.append(number)
+
+    def ranges(self, size, source_id=None, start=None, end=None):
+        """
+        Byte ranges of blocks which could contain records of source in time window [start, end)
+        :param size: size of segment :int
+        :param source_id: id of source (None - any source) :str
+        :param start: min wall-clock time (ns) :int
+        :param end: max wall-clock time (ns), not included :int
+        :return: list of (offset, end offset) :list
+        """
+        blocks = self.blocks
+        numbers = range(len(blocks)) if source_id is None else self.sources.get(source_id, ())
+        ranges = []
+        for number in numbers:
+            offset, first, last = blocks[number]
+            if (start is not None and last < start) or (end is not None and first >= end):
+                continue
+            block_end = blocks[number + 1][0] if number + 1 < len(blocks) else size
+            if ranges and ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], block_end)  # join neighbour blocks
+            else:
+                ranges.append((offset, block_end))
+        return ranges
+
+    def save(self, path):
+        with open(path, 'w') as index_file:
+            json.dump({'block_size': self.block_size, 'blocks': self.blocks, 'sources': self.sources}, index_file)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as index_file:
+            data = json.load(index_file)
+        index = cls(data['block_size'])
+        index.blocks = data['blocks']
+        index.sources = data['sources']
+        return index
+
+
+class WriteAheadLog:
+    """
+    Append-only log of received frames split into segment files of `segment_size` bytes.
+    Record of log is wall-clock time of receiving (see `TIMESTAMP`) and raw frame of message.
+    Records are collected into batch and written to file when batch reaches `batch_size` bytes
+    or on `flush` call (server calls it periodically).
+    Sync of file with disk is defined by `fsync_policy`:
+     - `FSYNC_ALWAYS` - each record is written and synced immediately
+     - `FSYNC_INTERVAL` - written batch is synced if last sync was more than `fsync_interval` seconds ago
+     - `FSYNC_NEVER` - sync is left to operating system
+    Log is never appended to existing segment, new segment is started on opening.
+    If `max_segments` is set, the oldest segments (with their indexes) above this count are removed
+    when new segment is started, so log keeps at most `max_segments * segment_size` bytes.
+    Use `WALReader` to read log.
+    """
+
+    FSYNC_ALWAYS = 'always'
+    FSYNC_INTERVAL = 'interval'
+    FSYNC_NEVER = 'never'
+
+    FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+    # default max size of segment (bytes)
+    SEGMENT_SIZE = 64 * 1024 * 1024
+
+    # default size of batch written at once (bytes)
+    BATCH_SIZE = 64 * 1024
+
+    # default sync policy
+    FSYNC_POLICY = FSYNC_INTERVAL
+
+    # default min interval between syncs for `FSYNC_INTERVAL` policy (seconds)
+    FSYNC_INTERVAL_TIME = 1.0
+
+    # default max count of kept segments including current one (None - segments are not removed)
+    MAX_SEGMENTS = None
+
+    def __init__(self, path, fsync_policy=None, segment_size=None, batch_size=None, fsync_interval=None,
+                 index_block_size=None, max_segments=None):
+        """
+        :param path: directory of log :str
+        :param fsync_policy: one of `FSYNC_POLICIES` :str
+        :param segment_size: max size of segment :int
+        :param batch_size: size of batch :int
+        :param fsync_interval: min interval between syncs (seconds) :float
+        :param index_block_size: min size of block of segment index (see `SegmentIndex`) :int
+        :param max_segments: max count of kept segments including current one :int
+        """
+        self.path = path
+        self.fsync_policy = fsync_policy or self.FSYNC_POLICY
+        if self.fsync_policy not in self.FSYNC_POLICIES:
+            raise ValueError('unknown fsync policy "{}"'.format(self.fsync_policy))
+        self.segment_size = segment_size or self.SEGMENT_SIZE
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.fsync_interval = self.FSYNC_INTERVAL_TIME if fsync_interval is None else fsync_interval
+        self.index_block_size = index_block_size
+        self.max_segments = max_segments or self.MAX_SEGMENTS
+        self.removed_segments = 0  # count of segments removed by retention
+        os.makedirs(path, exist_ok=True)
+        segments = list_segments(path)
+        self.segment_number = int(os.path.basename(segments[-1])[:-len(SEGMENT_SUFFIX)]) + 1 if segments else 0
+        self.batch = []
+        self.batch_bytes = 0
+        self.last_sync = time.monotonic()
+        self.file = None
+        self.index = None
+        self.offset = 0  # size of current segment including not written batch
+        self._open_segment()
+
+    @property
+    def segment_path(self):
+        return os.path.join(self.path, segment_name(self.segment_number))
+
+    def append(self, frame, source_id, timestamp):
+        """
+        Adds frame to log
+        :param frame: raw frame of message :bytes
+        :param source_id: id of message source (for index) :str
+        :param timestamp: wall-clock time of receiving (ns) :int
+        :return: None
+        """
+        if self.file is None:
+            raise WALException('Log is closed')
+        if self.offset >= self.segment_size:
+            self.rotate()
+        self.index.add(self.offset, timestamp, source_id)
+        self.batch.append(TIMESTAMP.pack(timestamp))
+        self.batch.append(frame)
+        size = TIMESTAMP.size + len(frame)
+        self.offset += size
+        self.batch_bytes += size
+        if self.fsync_policy == self.FSYNC_ALWAYS or self.batch_bytes >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes batch to segment file and syncs it according to `fsync_policy`
+        :return: None
+        """
+        if self.batch:
+            self.file.write(b''.join(self.batch))
+            self.file.flush()
+            self.batch.clear()
+            self.batch_bytes = 0
+            if self.fsync_policy == self.FSYNC_ALWAYS:
+                self._sync()
+            elif self.fsync_policy == self.FSYNC_INTERVAL and time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def rotate(self):
+        """
+        Closes current segment and starts next one
+        :return: None
+        """
+        self._close_segment()
+        self.segment_number += 1
+        self._open_segment()
+
+    def close(self):
+        """
+        Writes batch and closes log
+        :return: None
+        """
+        if self.file is not None:
+            self._close_segment()
+
+    def remove_old_segments(self):
+        """
+        Removes the oldest segments and their indexes above `max_segments`
+        :return: count of removed segments :int
+        """
+        if not self.max_segments:
+            return 0
+        removed = list_segments(self.path)[:-self.max_segments]
+        for segment_path in removed:
+            for path in (segment_path, segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.removed_segments += len(removed)
+        return len(removed)
+
+    def _open_segment(self):
+        self.file = open(self.segment_path, 'ab')
+        self.index = SegmentIndex(self.index_block_size)
+        self.offset = 0
+        self.remove_old_segments()
+
+    def _close_segment(self):
+        self.flush()
+        if self.fsync_policy != self.FSYNC_NEVER:
+            self._sync()
+        self.file.close()
+        self.file = None
+        self.index.save(self.segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+
+    def _sync(self):
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+
+class WALReader:
+    """
+    Reader of log written by `WriteAheadLog`.
+    Segments are mapped to memory and frames are decoded in place by `frame_size` and `decode_from`
+    of message classes (as `base.protocol.MessageProtocol` does).
+    `received` of replayed message is restored from its record.
+    Reading of segment stops on partial trailing record (not finished write) or invalid record,
+    count of invalid records is kept in `errors`.
+    """
+
+    def __init__(self, path, message_classes):
+        """
+        :param path: directory of log :str
+        :param message_classes: message classes of logged frames :tuple
+        """
+        self.path = path
+        self.message_classes = header_table(message_classes)
+        self.errors = 0
+        self._indexes = {}  # indexes of segments without saved index, key - segment path, value - (size, index)
+
+    def segments(self):
+        return list_segments(self.path)
+
+    def replay(self, source_id=None, start=None, end=None):
+        """
+        Generator of logged messages in order of writing.
+        With `source_id` or time window only blocks found by segment indexes are read.
+        :param source_id: id of source (None - all sources) :str
+        :param start: min wall-clock time (ns) :int
+        :param end: max wall-clock time (ns), not included :int
+        :return: generator of (timestamp, message) :tuple
+        """
+        filtered = source_id is not None or start is not None or end is not None
+        segments = self.segments()
+        for segment_path in set(self._indexes).difference(segments):
+            del self._indexes[segment_path]  # segment is removed by retention of log
+        for segment_path in segments:
+            ranges = None
+            try:
+                if filtered:
+                    index = self.get_index(segment_path)
+                    ranges = index.ranges(os.path.getsize(segment_path), source_id, start, end)
+                    if not ranges:
+                        continue
+                buffer = self.map_segment(segment_path)
+            except FileNotFoundError:
+                continue  # segment is removed by retention of log
+            for _, timestamp, message in self.read_segment(segment_path, ranges, buffer):
+                if source_id is not None and message.source_id != source_id:
+                    continue
+                if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+                    continue
+                yield timestamp, message
+
+    @staticmethod
+    def map_segment(segment_path):
+        """
+        :param segment_path: path of segment :str
+        :return: memory map of segment or None for empty segment :mmap.mmap
+        """
+        if os.path.getsize(segment_path) == 0:
+            return None
+        with open(segment_path, 'rb') as segment_file:
+            return mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_segment(self, segment_path, ranges=None, buffer=None):
+        """
+        Generator of records of segment
+        :param segment_path: path of segment :str
+        :param ranges: byte ranges of segment to read (None - whole segment) :list of (offset, end offset)
+        :param buffer: memory map of segment (see `map_segment`), it is closed by generator :mmap.mmap
+        :return: generator of (offset, timestamp, message) :tuple
+        """
+        if buffer is None:
+            buffer = self.map_segment(segment_path)
+            if buffer is None:
+                return
+        view = memoryview(buffer)
+        try:
+            for offset, end in ranges or ((0, len(view)), ):
+                if not (yield from self._read_range(view, offset, end)):
+                    break
+        finally:
+            view.release()
+            buffer.close()
+
+    def get_index(self, segment_path):
+        """
+        Index of segment: saved one or built by scan of segment (for segment of running or crashed log)
+        :param segment_path: path of segment :str
+        :return: index :SegmentIndex
+        """
+        index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        if os.path.exists(index_path):
+            return SegmentIndex.load(index_path)
+        size = os.path.getsize(segment_path)
+        cached = self._indexes.get(segment_path)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        index = SegmentIndex()
+        for offset, timestamp, message in self.read_segment(segment_path):
+            index.add(offset, timestamp, message.source_id)
+        self._indexes[segment_path] = (size, index)
+        return index
+
+    def _read_range(self, view, offset, end):
+        """
+        Generator of records in byte range of segment.
+        Generator returns False if segment has no more valid records.
+        """
+        message_classes = self.message_classes
+        record_size = TIMESTAMP.size
+        unpack_timestamp = TIMESTAMP.unpack_from
+        while offset + record_size < end:
+            frame_offset = offset + record_size
+            message_class = message_classes.get(view[frame_offset])
+            if message_class is None:
+                self.errors += 1
+                return False
+            frame_size = message_class.frame_size(view, frame_offset)
+            if frame_size is None or frame_offset + frame_size > len(view):
+                return False
+            frame_end = frame_offset + frame_size
+            try:
+                message = message_class.decode_from(view, frame_offset, frame_end)
+            except InvalidMessageException:
+                self.errors += 1
+                return False
+            timestamp = unpack_timestamp(view, offset)[0]
+            message.received = from_wall_ns(timestamp)
+            yield offset, timestamp, message
+            offset = frame_end
+        return True
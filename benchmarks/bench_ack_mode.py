@@ -0,0 +1,60 @@
+"""
+Pipelined source client with acknowledgement of each message versus cumulative acknowledgements.
+Server runs in process, link latency is simulated by proxy (see `bench_pipeline`).
+Run: python -m benchmarks.bench_ack_mode [latency ms] [messages]
+"""
+import sys
+import time
+
+from tornado.ioloop import IOLoop
+
+from app.app_client import ApplicationSourceClient
+from app.app_server import ApplicationServer
+from base.message import AckModeMessage, ServerMessage
+from base.source import Source
+from benchmarks.bench_pipeline import DelayProxy, SERVER_PORT, PROXY_PORT
+from benchmarks.common import print_table
+
+WINDOW = 256
+
+
+class CountingClient(ApplicationSourceClient):
+
+    responses = 0
+
+    def acknowledge(self, response):
+        if response.header == ServerMessage.HEADER_SUCCESS:
+            self.responses += 1
+        super().acknowledge(response)
+
+
+async def run_client(batch, messages, number):
+    client = CountingClient(Source('c{}'.format(number)), WINDOW)
+    await client.connect('127.0.0.1', PROXY_PORT)
+    if batch:
+        await client.set_ack_mode(AckModeMessage.MODE_CUMULATIVE, batch)
+    start = time.perf_counter()
+    for i in range(messages):
+        await client.send_message({'a': i})
+    await client.flush()
+    elapsed = time.perf_counter() - start
+    client.stop()
+    return elapsed, client.responses
+
+
+def main(latency_ms=5, messages=10000):
+    server = ApplicationServer()
+    server.SOURCE_PORT = SERVER_PORT
+    server.listen(SERVER_PORT, '127.0.0.1')
+    DelayProxy(latency_ms / 1000).listen(PROXY_PORT, '127.0.0.1')
+    io_loop = IOLoop.current()
+    rows = []
+    for number, batch in enumerate((0, 16, 64, 256)):
+        elapsed, responses = io_loop.run_sync(lambda: run_client(batch, messages, number))
+        rows.append((batch or 'each', messages, responses, int(messages / elapsed)))
+    print('one way latency {} ms, window {}'.format(latency_ms, WINDOW))
+    print_table(('batch', 'messages', 'acknowledgements', 'messages/sec'), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
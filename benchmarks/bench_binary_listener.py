@@ -0,0 +1,49 @@
+"""
+Listener formats: text (message rendered by str on server and parsed back by consumer)
+versus binary (received frame forwarded with envelope and decoded by message codec on consumer).
+Run: python -m benchmarks.bench_binary_listener
+"""
+from app.app_server import ApplicationServer
+from benchmarks.common import ns_per_op, print_table
+from base.listener import BaseListener
+from base.message import SourceMessage
+
+
+def parse_text(line):
+    # consumer of text format has to parse line back: "[<source_id>] <field> | <value>\r\n..."
+    head, _, rest = line.decode().partition('] ')
+    data = {}
+    for part in rest.strip().split('\r\n'):
+        if part:
+            field, _, value = part.partition(' | ')
+            data[field] = int(value)
+    return head[1:], data
+
+
+def parse_binary(record):
+    envelope = BaseListener.ENVELOPE
+    kind, timestamp, sequence, size = envelope.unpack_from(record)
+    return SourceMessage.decode(record[envelope.size:envelope.size + size])
+
+
+def main():
+    server = ApplicationServer()
+    rows = []
+    for fields in (1, 4, 16):
+        frame = SourceMessage(1, 'source', SourceMessage.STATUS_ACTIVE,
+                              data={'f{}'.format(i): i * 1000 for i in range(fields)}).encode()
+        message = SourceMessage.decode(frame)
+        text = server.render_message(message, BaseListener.FORMAT_TEXT)
+        record = server.render_message(message, BaseListener.FORMAT_BINARY, frame)
+        rows.append((fields,
+                     int(ns_per_op(lambda: server.render_message(message, BaseListener.FORMAT_TEXT))),
+                     int(ns_per_op(lambda: server.render_message(message, BaseListener.FORMAT_BINARY, frame))),
+                     int(ns_per_op(lambda: parse_text(text))),
+                     int(ns_per_op(lambda: parse_binary(record))),
+                     len(text), len(record)))
+    print_table(('fields', 'text render ns', 'binary render ns', 'text parse ns', 'binary decode ns',
+                 'text bytes', 'binary bytes'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Cost of fan-out of one message to listeners: message rendered for every listener
+versus message rendered once (ApplicationServer.broadcast_message).
+Run: python -m benchmarks.bench_broadcast
+"""
+from tornado.concurrent import Future
+
+from app.app_server import ApplicationServer
+from benchmarks.common import ns_per_op, print_table
+from base.exceptions import ListenerClosedException
+from base.listener import BaseListener
+from base.message import SourceMessage
+from base.subscriptions import Subscription, SubscriptionIndex
+
+
+class NullStream:
+
+    def __init__(self):
+        self.future = Future()
+        self.future.set_result(None)
+
+    def write(self, data):
+        return self.future
+
+    def closed(self):
+        return False
+
+    def close(self):
+        pass
+
+
+def legacy_broadcast(listeners, message):
+    # rendering inside of listeners loop as it was before
+    for listener_id, listener in listeners.items():
+        try:
+            listener.send(str(message).encode())
+        except ListenerClosedException:
+            pass
+
+
+def main():
+    server = ApplicationServer()
+    message = SourceMessage(1, 'source', SourceMessage.STATUS_ACTIVE,
+                            data={'f{}'.format(i): i for i in range(16)})
+    rows = []
+    for count in (1, 10, 100, 500):
+        listeners = {i: BaseListener(NullStream(), queue_size=1, overflow_policy=BaseListener.OVERFLOW_DROP_OLDEST)
+                     for i in range(count)}
+        server.listeners = listeners
+        server.subscriptions = SubscriptionIndex()
+        for listener_id in listeners:
+            server.subscriptions.subscribe(listener_id, Subscription())
+        old_ns = ns_per_op(lambda: legacy_broadcast(listeners, message))
+        new_ns = ns_per_op(lambda: server.broadcast_message(message))
+        rows.append((count, int(old_ns / count), int(new_ns / count), '{:.2f}x'.format(old_ns / new_ns)))
+    print_table(('listeners', 'render per listener ns', 'render once ns', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+Throughput of bulk decoding of captured frames.
+Run: python -m benchmarks.bench_bulk_decode [count of frames]
+"""
+import sys
+import time
+
+from benchmarks.common import print_table
+from base.message import SourceMessage
+
+
+def make_capture(count, num_fields):
+    data = {'f{}'.format(i): i for i in range(num_fields)}
+    return b''.join(SourceMessage(i & 0xffff, 's{}'.format(i % 100), SourceMessage.STATUS_ACTIVE, data=data).encode()
+                    for i in range(count))
+
+
+def main(count=100000):
+    rows = []
+    for num_fields in (0, 2, 16):
+        capture = make_capture(count, num_fields)
+        start = time.perf_counter()
+        decoded = 0
+        for _ in SourceMessage.iter_decode(capture):
+            decoded += 1
+        elapsed = time.perf_counter() - start
+        assert decoded == count
+        rows.append((num_fields, count, '{:.3f}'.format(elapsed), int(count / elapsed)))
+    print_table(('fields', 'frames', 'seconds', 'frames/sec'), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,44 @@
+"""
+Compares struct based codec of messages with previous field by field coding.
+Run: python -m benchmarks.bench_codec
+"""
+from benchmarks import legacy
+from benchmarks.common import ns_per_op, print_table
+from base.checksum import xor_checksum
+from base.message import SourceMessage, ServerMessage
+
+
+def make_message(num_fields):
+    data = {'f{}'.format(i): i * 1000 for i in range(num_fields)}
+    return SourceMessage(1, 'source', SourceMessage.STATUS_ACTIVE, data=data)
+
+
+def main():
+    rows = []
+    for num_fields in (0, 1, 16, 255):
+        message = make_message(num_fields)
+        frame = message.encode()
+        assert frame == legacy.source_encode(message), 'frames differ'
+        cases = (
+            ('encode', lambda: legacy.source_encode(message), message.encode),
+            ('decode', lambda: legacy.source_decode(frame), lambda: SourceMessage.decode(frame)),
+            ('xor', lambda: legacy.xor_checksum(frame), lambda: xor_checksum(frame)),
+        )
+        for name, old, new in cases:
+            old_ns, new_ns = ns_per_op(old), ns_per_op(new)
+            rows.append(('source {} {} fields'.format(name, num_fields), int(old_ns), int(new_ns),
+                         '{:.2f}x'.format(old_ns / new_ns)))
+
+    message = ServerMessage(1, ServerMessage.HEADER_SUCCESS)
+    frame = message.encode()
+    assert frame == legacy.server_encode(message), 'frames differ'
+    for name, old, new in (('encode', lambda: legacy.server_encode(message), message.encode),
+                           ('decode', lambda: legacy.server_decode(frame), lambda: ServerMessage.decode(frame))):
+        old_ns, new_ns = ns_per_op(old), ns_per_op(new)
+        rows.append(('server {}'.format(name), int(old_ns), int(new_ns), '{:.2f}x'.format(old_ns / new_ns)))
+
+    print_table(('case', 'legacy ns/op', 'codec ns/op', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
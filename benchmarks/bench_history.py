@@ -0,0 +1,54 @@
+"""
+Memory of messages history of sources on server.
+Measures memory of decoded messages and extrapolates it to `sources` x `messages` load.
+Run: python -m benchmarks.bench_history [sources] [messages per source]
+"""
+import sys
+import tracemalloc
+
+from benchmarks.common import print_table
+from base.message import SourceMessage
+from base.source import Source
+
+
+def measure(history_size, sources, messages):
+    """
+    Memory of sources after receiving of messages
+    :return: bytes
+    """
+    frames = [SourceMessage(i, 's{}'.format(s), SourceMessage.STATUS_ACTIVE, data={'a': i, 'b': s}).encode()
+              for s in range(sources) for i in range(messages)]
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    if history_size is None:
+        # unbounded list of messages as it was before
+        history = {s: [] for s in range(sources)}
+        for i, frame in enumerate(frames):
+            history[i // messages].append(SourceMessage.decode(frame))
+    else:
+        history = {s: Source('s{}'.format(s), history_size=history_size) for s in range(sources)}
+        for i, frame in enumerate(frames):
+            history[i // messages].get_message(SourceMessage.decode(frame))
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return size
+
+
+def main(total_sources=10000, total_messages=1000000):
+    sources, messages = 100, 200
+    rows = []
+    for history_size in (None, 100, 10, 0):
+        size = measure(history_size, sources, messages)
+        if history_size is None:
+            per_source = size / sources / messages * total_messages
+        else:
+            # memory of source with ring history is constant after `history_size` messages
+            per_source = size / sources
+        rows.append(('unbounded list' if history_size is None else 'ring {}'.format(history_size),
+                     int(size / sources), '{:.1f} MB'.format(per_source * total_sources / 2 ** 20)))
+    print_table(('history', 'bytes per source ({} msgs)'.format(messages),
+                 'estimated for {} sources x {} msgs'.format(total_sources, total_messages)), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,60 @@
+"""
+Idle timeouts of many connections: timer wheel versus one IOLoop timeout per connection.
+With timeout per connection each received message removes timeout of connection and adds new one,
+with timer wheel it only stores new deadline of connection.
+Measures cost of reset of timeout on message and time of one tick (1 second) of wheel.
+Run: python -m benchmarks.bench_idle_timeouts [connections]
+"""
+import sys
+import time
+
+from tornado.ioloop import IOLoop
+
+from base.timerwheel import TimerWheel
+from benchmarks.common import ns_per_op, print_table
+
+TIMEOUT = 60
+
+
+def main(connections=100000):
+    io_loop = IOLoop.current()
+    keys = [object() for _ in range(connections)]
+    handles = {key: io_loop.call_later(TIMEOUT, lambda: None) for key in keys}
+    wheel = TimerWheel(TIMEOUT, lambda key: None)
+    for key in keys:
+        wheel.add(key)
+    position = [0]
+
+    def reset_call_later():
+        key = keys[position[0] % connections]
+        position[0] += 1
+        io_loop.remove_timeout(handles[key])
+        handles[key] = io_loop.call_later(TIMEOUT, lambda: None)
+
+    def reset_wheel():
+        key = keys[position[0] % connections]
+        position[0] += 1
+        wheel.touch(key)
+
+    rows = [
+        ('call_later per connection', int(ns_per_op(reset_call_later))),
+        ('timer wheel', int(ns_per_op(reset_wheel))),
+    ]
+    print_table(('reset of timeout on message ({} connections)'.format(connections), 'ns/op'), rows)
+
+    # all connections are active: each tick moves keys of reached slot to slots of their deadlines
+    ticks = wheel.timeout + 2
+    start = time.perf_counter()
+    for tick in range(ticks):
+        for key in keys[tick::ticks]:
+            wheel.touch(key)
+        wheel.advance()
+    elapsed = time.perf_counter() - start
+    print('tick of wheel with {} active connections: {:.1f} us (including touches)'.format(
+        connections, elapsed / ticks * 1e6))
+    for handle in handles.values():
+        io_loop.remove_timeout(handle)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,56 @@
+"""
+Allocations, memory and construction time of source messages:
+message with instance dict and datetime versus `__slots__` message with monotonic timestamp.
+Run: python -m benchmarks.bench_message_memory
+"""
+import tracemalloc
+
+from benchmarks import legacy
+from benchmarks.common import ns_per_op, print_table
+from base.clock import monotonic_ns
+from base.message import SourceMessage
+
+
+def received_message():
+    message = SourceMessage(1, 'source', SourceMessage.STATUS_ACTIVE, data=None)
+    message.received = monotonic_ns()
+    return message
+
+
+def legacy_message():
+    return legacy.SourceMessageWithDict(1, 'source', SourceMessage.STATUS_ACTIVE, data=None)
+
+
+def local_message():
+    return SourceMessage(1, 'source', SourceMessage.STATUS_ACTIVE, data=None)
+
+
+def measure_memory(factory, count=100000):
+    """
+    :return: bytes and count of memory blocks per message
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    messages = [factory() for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    size = sum(stat.size_diff for stat in stats)
+    blocks = sum(stat.count_diff for stat in stats)
+    # list of messages itself is not counted
+    size -= len(messages) * 8
+    return size / count, blocks / count
+
+
+def main():
+    rows = []
+    for name, factory in (('dict + datetime', legacy_message),
+                          ('slots + monotonic ns (received)', received_message),
+                          ('slots (created locally)', local_message)):
+        size, blocks = measure_memory(factory)
+        rows.append((name, int(size), '{:.2f}'.format(blocks), int(ns_per_op(factory))))
+    print_table(('message', 'bytes/msg', 'blocks/msg', 'ns/msg'), rows)
+
+
+if __name__ == '__main__':
+    main()
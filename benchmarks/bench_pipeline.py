@@ -0,0 +1,88 @@
+"""
+Throughput of source client: strict request/response versus pipelined sends with window of acknowledgements.
+Server runs in process, link latency is simulated by proxy delaying data in both directions.
+Run: python -m benchmarks.bench_pipeline [latency ms] [messages]
+"""
+import sys
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+from tornado.tcpserver import TCPServer
+
+from app.app_client import ApplicationSourceClient
+from app.app_server import ApplicationServer
+from benchmarks.common import print_table
+from base.source import Source
+
+SERVER_PORT = 9200
+PROXY_PORT = 9201
+
+
+class DelayProxy(TCPServer):
+    """
+    Forwards data to server and back with delay (one way latency)
+    """
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+
+    async def handle_stream(self, stream, address):
+        upstream = await TCPClient().connect('127.0.0.1', SERVER_PORT)
+        stream.set_nodelay(True)
+        upstream.set_nodelay(True)
+        IOLoop.current().spawn_callback(self.pipe, upstream, stream)
+        await self.pipe(stream, upstream)
+
+    async def pipe(self, source, target):
+        io_loop = IOLoop.current()
+        try:
+            while True:
+                data = await source.read_bytes(65536, partial=True)
+                io_loop.call_later(self.latency, self.forward, target, data)
+        except StreamClosedError:
+            io_loop.call_later(self.latency, target.close)
+
+    @staticmethod
+    def forward(target, data):
+        if not target.closed():
+            target.write(data)
+
+
+async def run_client(window, messages, number):
+    client = ApplicationSourceClient(Source('b{}'.format(number)), window)
+    await client.connect('127.0.0.1', PROXY_PORT)
+    start = time.perf_counter()
+    if window:
+        for i in range(messages):
+            await client.send_message({'a': i})
+        await client.flush()
+    else:
+        for i in range(messages):
+            await client.send_message({'a': i})
+            await client.listen()
+    elapsed = time.perf_counter() - start
+    client.stop()
+    return elapsed
+
+
+def main(latency_ms=5, messages=1000):
+    server = ApplicationServer()
+    server.SOURCE_PORT = SERVER_PORT
+    server.listen(SERVER_PORT, '127.0.0.1')
+    DelayProxy(latency_ms / 1000).listen(PROXY_PORT, '127.0.0.1')
+    io_loop = IOLoop.current()
+    rows = []
+    for number, window in enumerate((None, 8, 64, 256)):
+        count = messages if window else max(messages // 10, 10)
+        elapsed = io_loop.run_sync(lambda: run_client(window, count, number))
+        rows.append((window or 'strict', count, int(count / elapsed)))
+    print('one way latency {} ms'.format(latency_ms))
+    print_table(('window', 'messages', 'messages/sec'), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,69 @@
+"""
+Memory and speed of token buckets of sources: compact arrays (`base.ratelimit.TokenBuckets`)
+versus dict of bucket objects.
+Run: python -m benchmarks.bench_ratelimit [sources]
+"""
+import sys
+import tracemalloc
+
+from base.ratelimit import TokenBuckets
+from benchmarks.common import ns_per_op, print_table
+
+
+class Bucket:
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class ObjectBuckets:
+    """
+    Bucket object per key
+    """
+
+    def __init__(self):
+        self.buckets = {}
+
+    def take(self, key, rate, burst, now, debt=False):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(burst, now)
+        tokens = min(bucket.tokens + (now - bucket.updated) * rate, burst)
+        bucket.updated = now
+        if tokens >= 1:
+            bucket.tokens = tokens - 1
+            return 0
+        bucket.tokens = tokens - 1 if debt else tokens
+        return (1 - tokens) / rate
+
+
+def measure(buckets_class, keys):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    buckets = buckets_class()
+    for number, key in enumerate(keys):
+        buckets.take(key, 100.0, 200.0, number / 1000)
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    position = [0]
+    count = len(keys)
+
+    def take():
+        position[0] += 1
+        buckets.take(keys[position[0] % count], 100.0, 200.0, position[0] / 1000)
+
+    return size, ns_per_op(take)
+
+
+def main(sources=100000):
+    keys = ['source-{}'.format(number) for number in range(sources)]
+    rows = []
+    for name, buckets_class in (('dict of objects', ObjectBuckets), ('TokenBuckets (arrays)', TokenBuckets)):
+        size, ns = measure(buckets_class, keys)
+        rows.append((name, '{:.1f} MB'.format(size / 2 ** 20), int(size / sources), int(ns)))
+    print_table(('{} sources'.format(sources), 'memory', 'bytes per source', 'take ns/op'), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
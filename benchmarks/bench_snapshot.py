@@ -0,0 +1,83 @@
+"""
+Snapshot of sources sent to new listener: full rendering of sources on each connect
+versus pre-rendered snapshot prefixes of sources, and the longest block of IOLoop with chunked writes.
+Run: python -m benchmarks.bench_snapshot [sources]
+"""
+import sys
+import time
+
+from tornado.ioloop import IOLoop
+
+from benchmarks import legacy
+from benchmarks.common import print_table
+from app.app_server import ApplicationServer
+from base.clock import monotonic_ns
+from base.message import SourceMessage
+from base.source import Source
+
+
+class MockListener:
+
+    def __init__(self):
+        self.sent = []
+        self.last_send = None
+        self.max_block = 0
+
+    def send(self, bytes_data):
+        now = time.perf_counter()
+        if self.last_send is not None:
+            self.max_block = max(self.max_block, now - self.last_send)
+        self.sent.append(bytes_data)
+        self.last_send = time.perf_counter()
+
+
+def make_sources(count):
+    sources = {}
+    for i in range(count):
+        source = Source('s{}'.format(i))
+        message = SourceMessage(i % 0x10000, source.source_id, Source.STATUS_ACTIVE)
+        message.received = monotonic_ns()
+        source.get_message(message)
+        sources[source.source_id] = source
+    return sources
+
+
+def rebuild(sources):
+    return ('\n'.join([legacy.source_str(source) for source in sources.values()]) + '\n').encode()
+
+
+def best_of(func, repeat=5):
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        result = elapsed if result is None else min(result, elapsed)
+    return result
+
+
+def main(count=50000):
+    sources = make_sources(count)
+    server = ApplicationServer()
+    server.sources = sources
+    io_loop = IOLoop.current()
+
+    def chunked():
+        listener = MockListener()
+        io_loop.run_sync(lambda: server.send_snapshot(listener))
+        return listener
+
+    listener = chunked()
+    assert b''.join(listener.sent).count(b'\n') == count
+    rebuild_time = best_of(lambda: rebuild(sources))
+    rows = [
+        ('rebuild with str(source)', '{:.2f}'.format(rebuild_time * 1000), '{:.2f}'.format(rebuild_time * 1000)),
+        ('snapshot prefixes, chunked', '{:.2f}'.format(best_of(chunked) * 1000),
+         '{:.2f}'.format(listener.max_block * 1000)),
+    ]
+    print('{} sources'.format(count))
+    print_table(('snapshot', 'total ms', 'max ms without yield'), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
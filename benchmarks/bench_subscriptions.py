@@ -0,0 +1,52 @@
+"""
+Broadcast of message to listeners subscribed to few sources:
+check of subscription of every listener versus inverted index (ApplicationServer.broadcast_message).
+Run: python -m benchmarks.bench_subscriptions
+"""
+from app.app_server import ApplicationServer
+from benchmarks.bench_broadcast import NullStream
+from benchmarks.common import ns_per_op, print_table
+from base.listener import BaseListener
+from base.message import SourceMessage
+from base.subscriptions import Subscription, SubscriptionIndex
+
+# count of sources listeners are subscribed to
+SOURCES = 1000
+
+
+def scan_broadcast(server, subscriptions, message):
+    # every listener is checked
+    payload = None
+    for listener_id, listener in server.listeners.items():
+        subscription = subscriptions[listener_id]
+        if subscription.sources and message.source_id not in subscription.sources:
+            continue
+        if subscription.statuses and message.status not in subscription.statuses:
+            continue
+        if payload is None:
+            payload = server.render_message(message, listener.format)
+        listener.send(payload)
+
+
+def main():
+    server = ApplicationServer()
+    message = SourceMessage(1, 's1', SourceMessage.STATUS_ACTIVE, data={'a': 1})
+    rows = []
+    for count in (100, 1000, 10000):
+        server.listeners = {}
+        server.subscriptions = SubscriptionIndex()
+        subscriptions = {}
+        for i in range(count):
+            server.listeners[i] = BaseListener(NullStream(), queue_size=1)
+            subscriptions[i] = Subscription(sources=['s{}'.format(i % SOURCES)])
+            server.subscriptions.subscribe(i, subscriptions[i])
+        scan_ns = ns_per_op(lambda: scan_broadcast(server, subscriptions, message))
+        index_ns = ns_per_op(lambda: server.broadcast_message(message))
+        matching = len(server.subscriptions.match(message))
+        rows.append((count, matching, int(scan_ns), int(index_ns), '{:.1f}x'.format(scan_ns / index_ns)))
+    print('listeners subscribed to one of {} sources'.format(SOURCES))
+    print_table(('listeners', 'matching', 'scan ns/message', 'index ns/message', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Columnar time series store versus data dicts of kept messages:
+memory per sample, time of append and time of aggregates over time window.
+Run: python -m benchmarks.bench_timeseries [samples]
+"""
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import print_table
+from base.timeseries import TimeSeriesStore
+
+FIELDS = ('temp', 'press', 'volt', 'amp')
+
+
+def make_data(samples):
+    return [(i * 1000, {field: (i * 7 + n) % 100000 for n, field in enumerate(FIELDS)}) for i in range(samples)]
+
+
+def dict_history(data):
+    # data dicts of messages kept in list as decoded messages do
+    return [(timestamp, dict(values)) for timestamp, values in data]
+
+
+def store_history(data):
+    store = TimeSeriesStore()
+    for timestamp, values in data:
+        store.append('source', timestamp, values)
+    return store
+
+
+def dict_aggregate(history, field, start, end):
+    values = [values[field] for timestamp, values in history if start <= timestamp < end]
+    return min(values), max(values), sum(values) / len(values), values[-1]
+
+
+def store_aggregate(store, field, start, end):
+    return store.aggregate('source', field, start, end)
+
+
+def measure_memory(build, data):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    history = build(data)
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return history, size
+
+
+def timed(func, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(samples=200000):
+    data = make_data(samples)
+    start, end = samples * 1000 // 4, samples * 1000 * 3 // 4  # half of samples
+    rows = []
+    for name, build, aggregate in (('dicts of messages', dict_history, dict_aggregate),
+                                   ('columnar store', store_history, store_aggregate)):
+        history, size = measure_memory(build, data)
+        rows.append((name,
+                     '{:.1f}'.format(size / (samples * len(FIELDS))),
+                     '{:.0f}'.format(timed(build, data, repeat=1) * 1e9 / samples),
+                     '{:.2f}'.format(timed(aggregate, history, 'volt', start, end) * 1000)))
+    print('{} samples of {} fields, aggregate over half of samples'.format(samples, len(FIELDS)))
+    print_table(('history', 'bytes/sample', 'append ns/message', 'aggregate ms'), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
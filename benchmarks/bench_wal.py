@@ -0,0 +1,67 @@
+"""
+Write-ahead log: append time per fsync policy, replay speed and indexed read of one source.
+Run: python -m benchmarks.bench_wal [messages] [sources]
+Timestamps of records are numbers of messages.
+"""
+import sys
+import tempfile
+import time
+
+from benchmarks.common import print_table
+from base.message import SourceMessage
+from base.wal import WriteAheadLog, WALReader
+
+
+# count of successive messages of one source (sources send in bursts)
+BURST = 500
+
+
+def make_frames(messages, sources):
+    frames = []
+    for i in range(messages):
+        source_id = 's{}'.format(i // BURST % sources)
+        frames.append((source_id, SourceMessage(i % 0x10000, source_id, 1, data={'a': i, 'b': i % 7}).encode()))
+    return frames
+
+
+def write(path, frames, fsync_policy):
+    wal = WriteAheadLog(path, fsync_policy, segment_size=4 * 1024 * 1024)
+    start = time.perf_counter()
+    for i, (source_id, frame) in enumerate(frames):
+        wal.append(frame, source_id, i)
+    wal.close()
+    return time.perf_counter() - start
+
+
+def read(path, **kwargs):
+    reader = WALReader(path, (SourceMessage, ))
+    start = time.perf_counter()
+    count = sum(1 for _ in reader.replay(**kwargs))
+    return time.perf_counter() - start, count
+
+
+def main(messages=200000, sources=100):
+    frames = make_frames(messages, sources)
+    rows = []
+    for fsync_policy in (WriteAheadLog.FSYNC_NEVER, WriteAheadLog.FSYNC_INTERVAL, WriteAheadLog.FSYNC_ALWAYS):
+        count = messages if fsync_policy != WriteAheadLog.FSYNC_ALWAYS else min(messages, 2000)
+        with tempfile.TemporaryDirectory() as path:
+            elapsed = write(path, frames[:count], fsync_policy)
+        rows.append(('append, fsync {}'.format(fsync_policy), count, '{:.0f}'.format(elapsed * 1e9 / count)))
+    with tempfile.TemporaryDirectory() as path:
+        write(path, frames, WriteAheadLog.FSYNC_NEVER)
+        elapsed, count = read(path)
+        rows.append(('replay all', count, '{:.0f}'.format(elapsed * 1e9 / count)))
+        elapsed, count = read(path, start=messages // 2, end=messages // 2 + messages // 100)
+        rows.append(('replay 1% time window (index)', count, '{:.0f}'.format(elapsed * 1e9 / count)))
+        elapsed, count = read(path, source_id='s1')
+        rows.append(('replay one source (index)', count, '{:.0f}'.format(elapsed * 1e9 / count)))
+        start = time.perf_counter()
+        count = sum(1 for _, message in WALReader(path, (SourceMessage, )).replay() if message.source_id == 's1')
+        elapsed = time.perf_counter() - start
+        rows.append(('replay one source (scan)', count, '{:.0f}'.format(elapsed * 1e9 / count)))
+    print_table(('operation', 'messages', 'ns/message'), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,107 @@
+"""
+Ingestion throughput of server started with different count of worker processes.
+Server is started by start.py, sources are run in separate processes with pipelined clients,
+one listener is connected to check that messages of all workers are delivered.
+Run: python -m benchmarks.bench_workers [sources] [messages per source]
+"""
+import multiprocessing
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+
+from app.app_client import ApplicationSourceClient, ApplicationListenerClient
+from base.message import AckModeMessage
+from base.source import Source
+from benchmarks.common import print_table
+
+SOURCE_PORT = 9210
+LISTENER_PORT = 9211
+WINDOW = 256
+
+
+async def send_messages(number, messages):
+    client = ApplicationSourceClient(Source('w{}'.format(number)), WINDOW)
+    await client.connect('127.0.0.1', SOURCE_PORT)
+    await client.set_ack_mode(AckModeMessage.MODE_CUMULATIVE, 64)
+    for i in range(messages):
+        await client.send_message({'a': i})
+    await client.flush()
+    client.stop()
+
+
+def run_source(number, messages):
+    IOLoop.current().run_sync(lambda: send_messages(number, messages))
+
+
+async def wait_processes(processes):
+    start = time.perf_counter()
+    while any(process.is_alive() for process in processes):
+        await gen.sleep(0.01)
+    return time.perf_counter() - start
+
+
+async def receive_messages(listener, processes):
+    """
+    Counts messages received by listener while sources are running
+    :return: time of sending and count of received messages :tuple
+    """
+    received = 0
+    sending = gen.convert_yielded(wait_processes(processes))
+    elapsed = None
+    line = None
+    while True:
+        if sending.done():
+            elapsed = sending.result()
+        if line is None:
+            line = gen.convert_yielded(listener.listen())
+        try:
+            await gen.with_timeout(timedelta(seconds=1), line, quiet_exceptions=StreamClosedError)
+        except gen.TimeoutError:
+            if elapsed is not None:
+                return elapsed, received
+            continue
+        line, data = None, line.result()
+        if data.startswith(b'['):
+            received += 1
+
+
+def run(workers, sources, messages):
+    server = subprocess.Popen([sys.executable, 'start.py', '--type=server', '--host=127.0.0.1',
+                               '--port={},{}'.format(SOURCE_PORT, LISTENER_PORT), '--workers={}'.format(workers),
+                               '--listener_queue={}'.format(sources * messages), '--logging=none'])
+    try:
+        time.sleep(1.5)
+        io_loop = IOLoop.current()
+        listener = ApplicationListenerClient()
+        io_loop.run_sync(lambda: listener.connect('127.0.0.1', LISTENER_PORT))
+        io_loop.run_sync(lambda: gen.sleep(0.1))
+        # sources are spawned, forked process would share IOLoop of listener
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=run_source, args=(number, messages)) for number in range(sources)]
+        for process in processes:
+            process.start()
+        elapsed, received = io_loop.run_sync(lambda: receive_messages(listener, processes))
+        listener.stop()
+        return int(sources * messages / elapsed), received
+    finally:
+        server.terminate()
+        server.wait()
+        time.sleep(1.5)
+
+
+def main(sources=4, messages=20000):
+    rows = []
+    for workers in (1, 2, 4):
+        rate, received = run(workers, sources, messages)
+        rows.append((workers, sources * messages, rate, received))
+    print('cpu count {}'.format(multiprocessing.cpu_count()))
+    print_table(('workers', 'messages', 'messages/sec', 'received by listener'), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
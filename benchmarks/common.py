@@ -0,0 +1,56 @@
+import timeit
+import tracemalloc
+
+
+def ns_per_op(func, repeat=5, min_time=0.2):
+    """
+    Measures `func` call time.
+    Number of calls per run is chosen to take at least `min_time` seconds, best of `repeat` runs is returned.
+    :param func: function without arguments
+    :param repeat: count of runs :int
+    :param min_time: min duration of one run in seconds :float
+    :return: nanoseconds per call :float
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+
+def print_table(header, rows):
+    """
+    Prints rows aligned by columns
+    :param header: column names :tuple
+    :param rows: list of tuples
+    :return: None
+    """
+    rows = [tuple(str(value) for value in row) for row in [header] + list(rows)]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print('  '.join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def alloc_bytes_per_op(func, repeat=5):
+    """
+    Measures peak size of memory allocated by one `func` call (tracemalloc), objects which are freed
+    during the call are counted too. Min of `repeat` calls is returned, so it does not depend on warm caches.
+    :param func: function without arguments
+    :param repeat: count of calls :int
+    :return: bytes per call :int
+    """
+    started = tracemalloc.is_tracing()
+    if not started:
+        tracemalloc.start()
+    try:
+        func()
+        result = None
+        for _ in range(repeat):
+            tracemalloc.clear_traces()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            result = peak if result is None else min(result, peak)
+        return result
+    finally:
+        if not started:
+            tracemalloc.stop()
@@ -0,0 +1,146 @@
+"""
+Reference implementations of message coding as it was before codec layer.
+Used by benchmarks to compare current code paths with previous ones.
+"""
+from datetime import datetime
+
+from base.clock import monotonic_ns
+from functools import reduce
+
+from base.codec import trim_bytes
+from base.exceptions import EncodeMessageError, DecodeMessageError, InvalidMessageException
+from base.message import SourceMessage, ServerMessage
+
+
+def xor_checksum(bytes_data):
+    return reduce(lambda x, y: x ^ y, bytes_data)
+
+
+def encode_data(message):
+    data = []
+    keys = sorted(message.data.keys())
+    for key in keys:
+        try:
+            data += trim_bytes(key.encode(), 8)
+            data += message.data[key].to_bytes(4, message.BYTE_ORDER)
+        except OverflowError:
+            raise EncodeMessageError('value of "{}" key is too long'.format(key))
+    return data
+
+
+def source_get_raw(message):
+    message_data = []
+    message_data.append(message.header)
+    try:
+        message_data += message.num.to_bytes(2, message.BYTE_ORDER)
+    except OverflowError:
+        raise EncodeMessageError('"num" value too long')
+    message_data += trim_bytes(message.source_id.encode(), 8)
+    try:
+        message_data += message.status.to_bytes(1, message.BYTE_ORDER)
+    except:
+        raise EncodeMessageError('"status" value too long')
+    if message.data:
+        message_data.append(len(message.data))
+        message_data += encode_data(message)
+    else:
+        message_data.append(0x00)
+    return bytes(message_data)
+
+
+def source_encode(message):
+    raw_body = source_get_raw(message)
+    return raw_body + bytes((xor_checksum(raw_body),))
+
+
+def decode_data(bytes_data, num_fields, byte_order='big'):
+    chunk_size = 12
+    if len(bytes_data) != num_fields * chunk_size:
+        raise DecodeMessageError('invalid message data')
+    result = {}
+    chunks = [bytes_data[i*chunk_size:(i+1)*chunk_size] for i in range(num_fields)]
+    for chunk in chunks:
+        field = chunk[:8]
+        value = chunk[8:]
+        result[field.decode().replace('\0', '')] = int.from_bytes(value, byte_order)
+    return result
+
+
+def source_decode(bytes_data, byte_order='big'):
+    header = int.from_bytes((bytes_data[0],), byte_order)
+    check_sum = int.from_bytes((bytes_data[-1],), byte_order)
+    data_body = bytes_data[1:-1]
+    num = int.from_bytes(data_body[0:2], byte_order)
+    source_id = data_body[2:10].decode().replace('\0', '')
+    status = int.from_bytes((data_body[10], ), byte_order)
+    num_fields = int.from_bytes((data_body[11], ), byte_order)
+    if num_fields > 0:
+        data = decode_data(data_body[12:], num_fields, byte_order)
+    else:
+        data = None
+    message = SourceMessage(num, source_id, status, header, data)
+    if xor_checksum(source_get_raw(message)) != check_sum:
+        raise InvalidMessageException('Invalid message {} from source {}'.format(num, source_id))
+    return message
+
+
+def server_get_raw(message):
+    message_data = []
+    message_data.append(message.header)
+    try:
+        message_data += message.num.to_bytes(2, message.BYTE_ORDER)
+    except OverflowError:
+        raise EncodeMessageError('"num" value too long')
+    return bytes(message_data)
+
+
+def server_encode(message):
+    raw_body = server_get_raw(message)
+    return raw_body + bytes((xor_checksum(raw_body),))
+
+
+def server_decode(bytes_data, byte_order='big'):
+    header = int.from_bytes((bytes_data[0],), byte_order)
+    check_sum = int.from_bytes((bytes_data[-1],), byte_order)
+    num = int.from_bytes(bytes_data[1:3], byte_order)
+    message = ServerMessage(num, header)
+    if xor_checksum(server_get_raw(message)) != check_sum:
+        raise InvalidMessageException('Invalid message {}'.format(num))
+    return message
+
+
+class SourceMessageWithDict:
+    """
+    Source message with instance dict and datetime of receiving created in constructor
+    """
+
+    STATUS = SourceMessage.STATUS
+    HEADERS = SourceMessage.HEADERS
+    DEFAULT_HEADER = SourceMessage.DEFAULT_HEADER
+
+    def __init__(self, num, source_id, status, header=None, data=None):
+        self.date_received = datetime.now()
+        if not header:
+            header = self.DEFAULT_HEADER
+        if header not in self.HEADERS:
+            raise InvalidMessageException('invalid message {} header {} of source {}'.format(num, header, source_id))
+        self.header = header
+        self.num = num
+        self.source_id = source_id
+        if status not in self.STATUS:
+            raise InvalidMessageException('Unknown source {} status "{}"'.format(source_id, status))
+        self.status = status
+        self.data = data
+
+
+def source_str(source):
+    """
+    String representation of source rendered completely on each call
+    """
+    last_message = source.last_message
+    if last_message and last_message.received is not None:
+        milliseconds = str((monotonic_ns() - last_message.received) // 1000000)
+    else:
+        milliseconds = '-'
+    num = last_message.num if last_message else '-'
+    return '[{}] {} | {} | {}'.format(source.source_id, num, source.status_str, milliseconds)
@@ -0,0 +1,222 @@
+"""
+Micro-benchmark suite of message coding with baseline and regression check.
+Each case is measured in ns/op (best of runs) and peak allocated bytes/op (see `common.alloc_bytes_per_op`).
+Runs of case are interleaved with runs of `reference` function (pure Python loop) and check compares
+ratio of their times, so it does not depend on speed of machine and on its changes during measuring
+(e.g. on shared virtual machine). Baseline saved on one machine could be checked on another one
+with similar interpreter.
+Run:
+ python -m benchmarks.suite - measure and print results
+ python -m benchmarks.suite --save - measure and save results to baseline file
+ python -m benchmarks.suite --check [--threshold=10] - measure and compare with baseline,
+   exit status is 1 if time or allocations of any case grow more than threshold (percent)
+Baseline must match the tree: commit which changes measured paths (codec, messages, check sums)
+reruns `--save` and commits baseline together with the change.
+"""
+import argparse
+import json
+import statistics
+import os
+import sys
+import timeit
+
+from benchmarks.common import alloc_bytes_per_op, print_table
+from base.checksum import xor_checksum
+from base.message import SourceMessage, ServerMessage
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# counts of data fields of messages
+FIELDS = (0, 1, 16, 255)
+
+# growth of allocations smaller than this is not a regression (bytes)
+ALLOC_TOLERANCE = 64
+
+
+class MemoryStream:
+    """
+    In-memory stream with `read_bytes` of tornado.iostream.IOStream, reads never wait
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    async def read_bytes(self, num_bytes):
+        offset = self.offset
+        self.offset = offset + num_bytes
+        return self.data[offset:offset + num_bytes]
+
+
+def run_coroutine(coroutine):
+    """
+    Runs coroutine which does not wait for IOLoop (e.g. decoding from `MemoryStream`)
+    :return: result of coroutine
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError('coroutine is waiting')
+
+
+def decode_stream(message_class, frame):
+    """
+    Decodes frame by `decode_stream` of message class, header is read before as server does
+    """
+    stream = MemoryStream(frame[1:])
+    return run_coroutine(message_class.decode_stream(stream, frame[0]))
+
+
+def reference():
+    return [i * 2 for i in range(100)]
+
+
+def get_cases():
+    """
+    Cases of suite
+    :return: list of (name, function) :list
+    """
+    cases = []
+    for num_fields in FIELDS:
+        data = {'f{}'.format(i): i * 1000 for i in range(num_fields)}
+        message = SourceMessage(1, 'source', SourceMessage.STATUS_ACTIVE, data=data)
+        frame = message.encode()
+        assert decode_stream(SourceMessage, frame).encode() == frame
+        bytes_data = message._encode_data() if num_fields else b''
+        cases.extend((
+            ('source encode {}'.format(num_fields), message.encode),
+            ('source decode {}'.format(num_fields), lambda frame=frame: SourceMessage.decode(frame)),
+            ('source decode_stream {}'.format(num_fields),
+             lambda frame=frame: decode_stream(SourceMessage, frame)),
+            ('xor_checksum {}'.format(num_fields), lambda frame=frame: xor_checksum(frame)),
+        ))
+        if num_fields:
+            cases.extend((
+                ('source _encode_data {}'.format(num_fields), message._encode_data),
+                ('source _decode_data {}'.format(num_fields),
+                 lambda bytes_data=bytes_data, num_fields=num_fields: SourceMessage._decode_data(bytes_data,
+                                                                                                  num_fields)),
+            ))
+    server_message = ServerMessage(1, ServerMessage.HEADER_SUCCESS)
+    server_frame = server_message.encode()
+    cases.extend((
+        ('server round trip', lambda: ServerMessage.decode(server_message.encode())),
+        ('server decode_stream', lambda: decode_stream(ServerMessage, server_frame)),
+    ))
+    return cases
+
+
+def calibrate(timer, min_time):
+    """
+    :return: number of calls taking at least `min_time` seconds :int
+    """
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return number
+
+
+def measure_case(func, repeat, min_time=0.05):
+    """
+    Measures time of function and time of `reference` in interleaved runs
+    :param func: function without arguments
+    :param repeat: count of runs :int
+    :param min_time: min duration of one run in seconds :float
+    :return: best ns/op of function and median of ratios of its time to time of reference in adjacent runs :tuple
+    """
+    timer = timeit.Timer(func)
+    reference_timer = timeit.Timer(reference)
+    number = calibrate(timer, min_time)
+    reference_number = calibrate(reference_timer, min_time)
+    values = []
+    ratios = []
+    for _ in range(repeat):
+        value = timer.timeit(number) / number
+        values.append(value)
+        ratios.append(value / (reference_timer.timeit(reference_number) / reference_number))
+    return min(values) * 1e9, statistics.median(ratios)
+
+
+def measure(cases, repeat):
+    """
+    :return: dict, key - case name, value - dict with `ns`, `relative` (to reference) and `alloc` :dict
+    """
+    results = {}
+    for name, func in cases:
+        ns, relative = measure_case(func, repeat)
+        results[name] = {'ns': round(ns, 1), 'relative': round(relative, 4), 'alloc': alloc_bytes_per_op(func)}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares results with baseline by times relative to reference, expected ns/op is baseline relative time
+    multiplied by current time of reference
+    :param results: measured results :dict
+    :param baseline: baseline results :dict
+    :param threshold: allowed growth (percent) :float
+    :return: rows of table and list of regressed cases :tuple
+    """
+    limit = 1 + threshold / 100
+    rows = []
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        expected_ns = result['ns'] * base['relative'] / result['relative']
+        slower = result['relative'] > base['relative'] * limit
+        more_alloc = result['alloc'] > base['alloc'] * limit and result['alloc'] - base['alloc'] > ALLOC_TOLERANCE
+        if slower or more_alloc:
+            regressions.append(name)
+        change = '{:+.1f}%'.format((result['ns'] / expected_ns - 1) * 100)
+        rows.append((name, int(expected_ns), int(result['ns']), change, base['alloc'], result['alloc'],
+                     'REGRESSION' if slower or more_alloc else 'ok'))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of message coding')
+    parser.add_argument('--save', action='store_true', help='save results as baseline')
+    parser.add_argument('--check', action='store_true', help='compare results with baseline')
+    parser.add_argument('--threshold', type=float, default=10, help='allowed regression (percent)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file')
+    parser.add_argument('--repeat', type=int, default=9, help='count of runs of each case')
+    parser.add_argument('--retries', type=int, default=2, help='count of measurements of regressed cases')
+    parser.add_argument('--filter', default='', help='run only cases containing this text')
+    args = parser.parse_args()
+
+    cases = [(name, func) for name, func in get_cases() if args.filter in name]
+    results = measure(cases, args.repeat)
+    if args.check:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['cases']
+        rows, regressions = compare(results, baseline, args.threshold)
+        # regressed cases are measured again, so single slow run does not fail check
+        for _ in range(args.retries):
+            if not regressions:
+                break
+            functions = dict(cases)
+            for name, result in measure([(name, functions[name]) for name in regressions], args.repeat).items():
+                best = results[name]
+                for key in ('ns', 'relative', 'alloc'):
+                    best[key] = min(best[key], result[key])
+            rows, regressions = compare(results, baseline, args.threshold)
+        print_table(('case', 'baseline ns/op', 'ns/op', 'change', 'baseline bytes/op', 'bytes/op', 'status'), rows)
+        if regressions:
+            print('{} cases regressed more than {}%: {}'.format(len(regressions), args.threshold,
+                                                                ', '.join(regressions)))
+            sys.exit(1)
+        return
+    print_table(('case', 'ns/op', 'bytes/op'),
+                [(name, int(result['ns']), result['alloc']) for name, result in results.items()])
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump({'python': sys.version.split()[0], 'cases': results}, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print('baseline saved to {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,41 @@
-from tornado import gen
-from tornado.ioloop import IOLoop
+import asyncio
+import json
+import os
+import signal
+import tempfile
+
+from tornado.ioloop import IOLoop, PeriodicCallback
 from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_sockets
 from tornado.options import define, options
+from tornado.process import fork_processes
 
+from app.app_bench import ApplicationBenchmark
 from app.app_client import ApplicationSourceClient, ApplicationListenerClient, ClientException
 from app.app_server import ApplicationServer
-from base.source import Source
+from base.listener import BaseListener
+from base.ratelimit import parse_rate_limit, parse_rate_limits
+from base.source import Source, CRC32Source
+from base.timeseries import TimeSeriesStore
+from base.wal import WriteAheadLog
 from base.exceptions import SourceException, InvalidMessageException
 
 # source controller
-@gen.coroutine
-def start_source():
+async def start_source():
     if not options.sid:
         print('source id `sid` must be defined')
         return
-    source = Source(options.sid, options.status)
+    source_class = CRC32Source if options.checksum == 'crc32' else Source
+    source = source_class(options.sid, options.status)
     print('source\t"{}"\t"{}"({})'.format(source.source_id, source.status_str, source.status))
     client = ApplicationSourceClient(source)
     print('connect to server...')
     try:
-        yield client.connect(options.host, options.port[0])
+        await client.connect(options.host, options.port[0])
         print('success!')
 
         # simple command interpreter
-        @gen.coroutine
-        def exec_command(command):
+        async def exec_command(command):
             if not command:
                 return
             if command == 'status':
@@ -56,9 +67,9 @@ def start_source():
                     print(*data.items(), sep='\n')
                 if input('Send message?(y/n)') == 'y':
                     try:
-                        yield client.send_message(data)
+                        await client.send_message(data)
                         # wait for response
-                        response = yield client.listen()
+                        response = await client.listen()
                         print(response)
                     except ClientException as e:
                         print('Error:', e)
@@ -76,7 +87,7 @@ def start_source():
             print('- send', 'send message to server')
             while True:
                 command = input('cmd:')
-                yield exec_command(command)
+                await exec_command(command)
         except KeyboardInterrupt:
             client.stop()
             IOLoop.current().stop()
@@ -88,31 +99,178 @@ def start_source():
 
 
 # server controller
-def start_server():
+def configure_server():
+    """
+    Sets up ApplicationServer by command line options
+    :return: None
+    """
     if options.port:
         try:
             ApplicationServer.SOURCE_PORT = options.port[0]
             ApplicationServer.LISTENER_PORT = options.port[1]
         except (IndexError, TypeError):
             pass
+    ApplicationServer.SOURCE_HISTORY_SIZE = options.history
+    ApplicationServer.LISTENER_QUEUE_SIZE = options.listener_queue
+    ApplicationServer.LISTENER_OVERFLOW_POLICY = options.listener_overflow
+    ApplicationServer.TIMESERIES_MAX_CHUNKS = options.timeseries_chunks
+    ApplicationServer.WAL_PATH = options.wal
+    ApplicationServer.WAL_FSYNC_POLICY = options.wal_fsync
+    ApplicationServer.WAL_MAX_SEGMENTS = options.wal_max_segments or None
+    ApplicationServer.STATS_PORT = options.stats_port
+    ApplicationServer.LOOP_LAG_INTERVAL = options.loop_lag_interval or None
+    ApplicationServer.IDLE_TIMEOUT = options.idle_timeout or None
+    ApplicationServer.SOURCE_RETENTION = options.source_retention
+    ApplicationServer.SOURCE_MAX_CONNECTIONS = options.source_max_connections
+    ApplicationServer.SOURCE_MAX_CONNECTIONS_PER_ADDRESS = options.source_max_per_address
+    ApplicationServer.SOURCE_MAX_ACCEPT_RATE = options.source_accept_rate
+    ApplicationServer.LISTENER_MAX_CONNECTIONS = options.listener_max_connections
+    ApplicationServer.LISTENER_MAX_CONNECTIONS_PER_ADDRESS = options.listener_max_per_address
+    ApplicationServer.LISTENER_MAX_ACCEPT_RATE = options.listener_accept_rate
+    if options.rate_limits:
+        ApplicationServer.SOURCE_RATE_LIMITS = parse_rate_limits(options.rate_limits, Source.STATUS)
+    if options.connection_rate_limit:
+        ApplicationServer.CONNECTION_RATE_LIMIT = parse_rate_limit(options.connection_rate_limit)
+    ApplicationServer.RATE_LIMIT_POLICY = options.rate_limit_policy
+
+
+def listen_server(server, source_sockets=None, listener_sockets=None, stats_sockets=None):
+    """
+    Starts serving of source, listener and stats ports, sockets are bound by server if they are not passed
+    :param server: server :ApplicationServer
+    :param source_sockets: bound sockets of source port :list
+    :param listener_sockets: bound sockets of listener port :list
+    :param stats_sockets: bound sockets of stats port :list
+    :return: None
+    """
+    if options.transport == 'protocol':
+        loop = asyncio.get_event_loop()
+        if source_sockets:
+            for sock in source_sockets:
+                loop.run_until_complete(loop.create_server(server.create_source_protocol, sock=sock))
+        else:
+            loop.run_until_complete(loop.create_server(server.create_source_protocol,
+                                                       host=options.host, port=ApplicationServer.SOURCE_PORT))
+    elif source_sockets:
+        server.add_sockets(source_sockets)
+    else:
+        server.listen(port=ApplicationServer.SOURCE_PORT, address=options.host)
+    if listener_sockets:
+        server.add_sockets(listener_sockets)
+    else:
+        server.listen(port=ApplicationServer.LISTENER_PORT, address=options.host)
+    if stats_sockets:
+        server.add_sockets(stats_sockets)
+    elif ApplicationServer.STATS_PORT:
+        server.listen(port=ApplicationServer.STATS_PORT, address=options.host)
+
+
+def install_loop():
+    if options.transport == 'protocol':
+        # IOLoop must be based on asyncio loop to serve source port by asyncio protocol
+        from tornado.platform.asyncio import AsyncIOMainLoop
+        AsyncIOMainLoop().install()
+
+
+def start_server():
+    configure_server()
+    source_sockets = listener_sockets = stats_sockets = None
+    if options.workers > 1:
+        # ports are bound before fork, so connections are accepted by all workers
+        source_sockets = bind_sockets(ApplicationServer.SOURCE_PORT, options.host)
+        listener_sockets = bind_sockets(ApplicationServer.LISTENER_PORT, options.host)
+        if ApplicationServer.STATS_PORT:
+            stats_sockets = bind_sockets(ApplicationServer.STATS_PORT, options.host)
+        ApplicationServer.BUS_PATH = tempfile.mkdtemp(prefix='server-bus-')
+        ApplicationServer.WORKERS = options.workers
+        parent_pid = os.getpid()
+        # parent process waits for workers and restarts failed ones, function returns in workers only
+        ApplicationServer.WORKER_ID = fork_processes(options.workers)
+    install_loop()
     # start server
     server = ApplicationServer()
-    server.listen(port=ApplicationServer.SOURCE_PORT, address=options.host)
-    server.listen(port=ApplicationServer.LISTENER_PORT, address=options.host)
+    if options.wal:
+        print('state of {} sources restored from log'.format(len(server.sources)))
+    listen_server(server, source_sockets, listener_sockets, stats_sockets)
+    # stop loop on SIGTERM too, so batch of log is written
+    io_loop = IOLoop.current()
+    signal.signal(signal.SIGTERM, lambda signum, frame: io_loop.add_callback_from_signal(io_loop.stop))
+    # dump of stats on SIGUSR1
+    signal.signal(signal.SIGUSR1, lambda signum, frame: io_loop.add_callback_from_signal(
+        lambda: print(json.dumps(server.get_stats(), sort_keys=True), flush=True)))
+    # profiler is started by SIGUSR2 and stopped with report by next SIGUSR2
+    signal.signal(signal.SIGUSR2, lambda signum, frame: io_loop.add_callback_from_signal(toggle_profiler, server))
+    if ApplicationServer.WORKER_ID is not None:
+        # worker is stopped when parent process is terminated
+        PeriodicCallback(lambda: os.getppid() != parent_pid and io_loop.stop(), 1000).start()
     try:
-        IOLoop.current().start()
+        io_loop.start()
     except KeyboardInterrupt:
         print('server stopped')
+    finally:
+        server.close_bus()
+        server.close_wal()
+
+def toggle_profiler(server):
+    """
+    Starts or stops profiler of server, report of stopped profiler is printed
+    and its stacks are saved to `profile_output` file in format of flame graph tools
+    :param server: server :ApplicationServer
+    :return: None
+    """
+    report = server.toggle_profiler()
+    if report is None:
+        print('profiler started', flush=True)
+        return
+    if options.profile_output:
+        path = options.profile_output
+        if ApplicationServer.WORKER_ID is not None:
+            path = '{}.{}'.format(path, ApplicationServer.WORKER_ID)
+        with open(path, 'w') as file:
+            file.writelines(line + '\n' for line in server.profiler.collapsed())
+    print(json.dumps(report, sort_keys=True), flush=True)
+
+# benchmark controller
+def start_bench():
+    configure_server()
+    server = None
+    if options.bench_server:
+        install_loop()
+        server = ApplicationServer()
+        listen_server(server)
+    benchmark = ApplicationBenchmark(options.host, ApplicationServer.SOURCE_PORT, ApplicationServer.LISTENER_PORT,
+                                     sources=options.bench_sources, listeners=options.bench_listeners,
+                                     rate=options.bench_rate, fields=options.bench_fields,
+                                     duration=options.bench_duration, window=options.bench_window)
+    try:
+        report = IOLoop.current().run_sync(benchmark.run)
+    finally:
+        if server is not None:
+            server.stop()
+            server.close_wal()
+    report['transport'] = options.transport if server is not None else None
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.bench_output:
+        with open(options.bench_output, 'w') as file:
+            file.write(text + '\n')
+    print(text)
 
 # listener controller
-@gen.coroutine
-def start_listener():
+async def start_listener():
     client = ApplicationListenerClient()
     try:
-        yield client.connect(options.host, options.port[0])
+        await client.connect(options.host, options.port[0])
+        if options.subscribe:
+            await client.send_command('subscribe {}'.format(options.subscribe))
+        if options.binary:
+            await client.request_binary()
         while True:
-            message = yield client.listen()
-            print(message.decode(), end='')
+            message = await client.listen()
+            if isinstance(message, bytes):
+                print(message.decode(), end='')
+            else:
+                timestamp, sequence, message = message
+                print('#{} {} {}'.format(sequence, message.date_received, message), end='')
     except StreamClosedError:
         print('connection closed by server')
 
@@ -126,18 +284,73 @@ def main():
             IOLoop.current().run_sync(start_source)
         elif options.type == 'listener':
             IOLoop.current().run_sync(start_listener)
+        elif options.type == 'bench':
+            start_bench()
     except KeyboardInterrupt:
         print('closed')
 
 
 #  command line params
-define('type', 'source', help='start app server/source/listener')
+define('type', 'source', help='start app server/source/listener/bench')
 define('host', 'localhost', help='server host')
 define('port', [8888], type=int, multiple=True, help='''To start server use pair <source_port>,<listener_port>.
                                             To start source/listener enter single value.
                                             Default 8888,8889''')
 define('sid', None, help='source id')
 define('status', None, help='initial status of source')
+define('checksum', 'xor', help='check sum of source messages: xor/crc32')
+define('workers', 1, type=int, help='count of server worker processes sharing ports')
+define('stats_port', None, type=int,
+       help='port of server stats (JSON line is sent to each connection), stats are printed on SIGUSR1 too')
+define('idle_timeout', None, type=float,
+       help='seconds after which server closes connections of silent sources and stalled listeners, disabled by default')
+define('source_retention', None, type=float,
+       help='seconds of keeping of disconnected sources on server, 0 - removed at once, kept by default')
+define('source_max_connections', None, type=int, help='max count of open connections of sources, unlimited by default')
+define('source_max_per_address', None, type=int,
+       help='max count of open connections of sources from one address, unlimited by default')
+define('source_accept_rate', None, type=float,
+       help='max count of accepted connections of sources per second, unlimited by default')
+define('listener_max_connections', None, type=int,
+       help='max count of open connections of listeners, unlimited by default')
+define('listener_max_per_address', None, type=int,
+       help='max count of open connections of listeners from one address, unlimited by default')
+define('listener_accept_rate', None, type=float,
+       help='max count of accepted connections of listeners per second, unlimited by default')
+define('rate_limits', None,
+       help='limits of messages of each source by status, e.g. "default=100:200,RECHARGE=10" (rate per second:burst)')
+define('connection_rate_limit', None, help='limit of messages of one source connection, e.g. "1000:2000"')
+define('rate_limit_policy', ApplicationServer.RATE_LIMIT_POLICY,
+       help='action for messages over rate limits: {} (pause reading of connection or reply with error)'.format(
+           '/'.join(ApplicationServer.RATE_LIMIT_POLICIES)))
+define('loop_lag_interval', ApplicationServer.LOOP_LAG_INTERVAL, type=int,
+       help='interval of checks of server event loop lag (milliseconds), 0 - disabled')
+define('profile_output', None,
+       help='file of stacks of server profiler (flame graph format), profiler is switched on/off by SIGUSR2')
+define('transport', 'iostream', help='transport of server source port: iostream/protocol (asyncio)')
+define('history', Source.HISTORY_SIZE, type=int, help='count of last messages kept by server for each source')
+define('listener_queue', BaseListener.QUEUE_SIZE, type=int, help='max count of queued messages of listener')
+define('listener_overflow', BaseListener.OVERFLOW_POLICY,
+       help='policy for listener with full queue: {}'.format('/'.join(BaseListener.OVERFLOW_POLICIES)))
+define('timeseries_chunks', None, type=int,
+       help='max count of chunks ({} samples) kept by server for each source field, unlimited by default'.format(
+           TimeSeriesStore.CHUNK_SIZE))
+define('wal', None, help='directory of write-ahead log of source messages, log is disabled by default')
+define('wal_fsync', WriteAheadLog.FSYNC_POLICY,
+       help='sync of log with disk: {}'.format('/'.join(WriteAheadLog.FSYNC_POLICIES)))
+define('wal_max_segments', 0, type=int,
+       help='max count of kept segments ({} bytes) of log, the oldest segments are removed, 0 - unlimited'.format(
+           WriteAheadLog.SEGMENT_SIZE))
+define('subscribe', None, help='subscription of listener, e.g. "source=a,b prefix=s status=RECHARGE field=x"')
+define('binary', False, type=bool, help='listener receives original frames of messages instead of text')
+define('bench_sources', 10, type=int, help='count of simulated sources of benchmark')
+define('bench_listeners', 1, type=int, help='count of listeners of benchmark')
+define('bench_rate', 0, type=float, help='messages per second of each source of benchmark, 0 - unlimited')
+define('bench_fields', 1, type=int, help='count of data fields of benchmark messages')
+define('bench_duration', 5.0, type=float, help='duration of benchmark (seconds)')
+define('bench_window', 64, type=int, help='max count of not acknowledged messages of source, 0 - request/response')
+define('bench_server', True, type=bool, help='run server in benchmark process, otherwise server must be started')
+define('bench_output', None, help='file of JSON report of benchmark')
 
 if __name__ == '__main__':
     options.parse_command_line()